@@ -1,5 +1,10 @@
 import requests
 import json
+import re
+import time
+import calendar
+import threading
+import Queue
 
 '''
  URL, String, String -> ([RegionalizedEndpoint], AccountID, AuthToken, UTCString)
@@ -34,16 +39,157 @@ def gen_rack_api_v1_0_compatible_headers(account_id, token_id):
 		#"X-Auth-Project-ID" : account_id
 	}
 
-def gen_curried_api_generator_function(regionalized_endpoint_public_url, headers, dict):
+UTC_STRING_PATTERN = re.compile(r'^(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.\d+)?(Z|[+-]\d\d:?\d\d)?$')
+
+'''
+ UTCString -> Float
+
+ Seconds since the epoch for timestamps such as 2012-04-18T10:20:07.000-05:00
+'''
+def parse_utc_string(utc_string):
+	match = UTC_STRING_PATTERN.match(utc_string)
+	if not match:
+		raise ValueError("Unrecognized timestamp %s" % utc_string)
+	seconds = calendar.timegm([int(part) for part in match.groups()[:6]])
+	offset = match.group(7)
+	if offset and offset != 'Z':
+		sign = offset[0] == '-' and -1 or 1
+		digits = offset[1:].replace(':', '')
+		seconds -= sign * (int(digits[:2]) * 3600 + int(digits[2:]) * 60)
+	return float(seconds)
+
+'''
+ Keeps the auth token of a session fresh.
+
+ A background thread re-authenticates refresh_margin seconds before the
+ token expires and swaps the session headers in one assignment, so the
+ curried functions sharing the session never see a half updated set.
+ Tokens living less than refresh_margin are renewed halfway through their
+ lifetime, at least min_refresh_interval seconds apart.
+ Requests failing with a 401 call unauthorized(token) and retry; only the
+ first caller for a given token re-authenticates, the others wait on the
+ lock and reuse its result.
+'''
+class TokenManager(object):
+	def __init__(self, auth_url, rack_user, rack_api_key, session, refresh_margin = 300, retry_interval = 30, min_refresh_interval = 5):
+		self.auth_url = auth_url
+		self.rack_user = rack_user
+		self.rack_api_key = rack_api_key
+		self.session = session
+		self.refresh_margin = refresh_margin
+		self.retry_interval = retry_interval
+		self.min_refresh_interval = min_refresh_interval
+		self.listeners = []
+		self.endpoints = None
+		self.account_id = None
+		self.token = None
+		self.expires = None
+		self._lock = threading.Lock()
+		self._stopped = threading.Event()
+		self._thread = None
+
+	def authenticate(self):
+		self._lock.acquire()
+		try:
+			return self._authenticate()
+		finally:
+			self._lock.release()
+
+	def _authenticate(self):
+		endpoints, account_id, token, expiration = auth_to_service(self.auth_url, self.rack_user, self.rack_api_key)
+		headers = self.session.headers.copy()
+		headers.update(gen_rack_api_v1_0_compatible_headers(account_id, token))
+		self.session.headers = headers
+		self.endpoints = endpoints
+		self.account_id = account_id
+		self.token = token
+		self.expires = parse_utc_string(expiration)
+		for listener in self.listeners:
+			listener(self)
+		return token
+
+	'''
+	 AuthToken -> AuthToken
+	'''
+	def unauthorized(self, token):
+		self._lock.acquire()
+		try:
+			if token != self.token:
+				# Someone already re-authenticated while we were waiting
+				return self.token
+			return self._authenticate()
+		finally:
+			self._lock.release()
+
+	def start(self):
+		if self.token is None:
+			self.authenticate()
+		self._stopped.clear()
+		self._thread = threading.Thread(target = self._run, name = 'token-refresh')
+		self._thread.daemon = True
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self._stopped.set()
+		if self._thread is not None:
+			self._thread.join()
+			self._thread = None
+
+	def _refresh_delay(self):
+		remaining = self.expires - time.time()
+		delay = remaining - self.refresh_margin
+		if delay < self.min_refresh_interval:
+			# Renewing refresh_margin before the expiry would loop
+			delay = max(remaining / 2, self.min_refresh_interval)
+		return delay
+
+	def _run(self):
+		delay = self._refresh_delay()
+		while not self._stopped.wait(delay) and not self._stopped.isSet():
+			try:
+				self.authenticate()
+				delay = self._refresh_delay()
+			except Exception:
+				delay = self.retry_interval
+
+'''
+ Int -> Session
+'''
+def gen_pooled_session(pool_size = 10):
+	session = requests.Session()
+	adapter = requests.adapters.HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size)
+	session.mount('https://', adapter)
+	session.mount('http://', adapter)
+	return session
+
+JSON_CONTENT_HEADERS = {'Content-Type' : 'application/json'}
+
+'''
+ URL, {String : String}, {String : Function}, Session -> (String, String, String, String -> None)
+'''
+def gen_curried_api_generator_function(regionalized_endpoint_public_url, headers, dict, session = None, token_manager = None):
+	# The auth headers live on the session so each call only sends what differs
+	session = session or gen_pooled_session()
+	session.headers.update(headers)
+
 	def _gen_curried_api_function(function_name, rest_endpoint, method, namespace = None):
+		writes = method in ['post', 'patch', 'put']
+		request_headers = writes and JSON_CONTENT_HEADERS or None
+		url = regionalized_endpoint_public_url + rest_endpoint
+		failure = "Failed to " + function_name.replace('_', ' ') + " with status code %d. %s"
+
 		def f(*args, **kwargs):
-			data = kwargs.get('data') or {}
-			h = headers.copy()
-			if method in ['post', 'patch', 'put']:
-				h['Content-Type'] = 'application/json'
-			resp = requests.request(method,
-					regionalized_endpoint_public_url + rest_endpoint.format(*args),
-					headers = h, data = json.dumps(data))
+			data = kwargs.get('data')
+			if writes:
+				body = json.dumps(data or {})
+			else:
+				body = data and json.dumps(data) or None
+			token = session.headers.get('X-Auth-Token')
+			resp = session.request(method, url.format(*args), headers = request_headers, data = body)
+			if resp.status_code == 401 and token_manager:
+				token_manager.unauthorized(token)
+				resp = session.request(method, url.format(*args), headers = request_headers, data = body)
 			if resp.ok:
 				try:
 					resp_obj = json.loads(resp.content)
@@ -54,11 +200,54 @@ def gen_curried_api_generator_function(regionalized_endpoint_public_url, headers
 				except ValueError:
 					return resp.status_code
 			else:
-				raise StandardError("Failed to %s with status code %d. %s" % (function_name.replace('_', ' '), resp.status_code, resp.content))
+				raise StandardError(failure % (resp.status_code, resp.content))
 		dict[function_name] = f
 
 	return _gen_curried_api_function
 
+'''
+ (* -> a), [* | (*)], Int, Bool -> [a]
+
+ Calls f once per item of args_list from up to max_workers threads and
+ returns the results in the order of args_list. Tuple items are passed as
+ positional arguments. The first failure (in order) is raised once all the
+ calls are done, unless return_exceptions is set, in which case exceptions
+ take the place of their results.
+'''
+def concurrent_map(f, args_list, max_workers = 8, return_exceptions = False):
+	args_list = list(args_list)
+	results = [None] * len(args_list)
+	failed = [False] * len(args_list)
+	pending = Queue.Queue()
+	for i, args in enumerate(args_list):
+		pending.put((i, args))
+
+	def worker():
+		while True:
+			try:
+				i, args = pending.get_nowait()
+			except Queue.Empty:
+				return
+			try:
+				if isinstance(args, tuple):
+					results[i] = f(*args)
+				else:
+					results[i] = f(args)
+			except Exception, e:
+				results[i] = e
+				failed[i] = True
+
+	workers = [threading.Thread(target = worker) for _ in range(min(max_workers, len(args_list)))]
+	for w in workers:
+		w.daemon = True
+		w.start()
+	for w in workers:
+		w.join()
+
+	if not return_exceptions and True in failed:
+		raise results[failed.index(True)]
+	return results
+
 # Potential base API
 
 
@@ -98,14 +287,25 @@ API_OPERATIONS = [
 ]
 
 
-def augment_dict_with_curried_api_functions(rack_auth_url, rack_user, rack_api, dict):
-	[[re], account_id, token, expires] = auth_to_service(rack_auth_url, rack_user, rack_api)
-	headers = gen_rack_api_v1_0_compatible_headers(account_id, token)
+def augment_dict_with_curried_api_functions(rack_auth_url, rack_user, rack_api, dict, pool_size = 10, refresh_margin = 300):
+	session = gen_pooled_session(pool_size)
+	token_manager = TokenManager(rack_auth_url, rack_user, rack_api, session, refresh_margin)
 
-	g = gen_curried_api_generator_function(re['publicURL'], headers, dict)
+	def _update_dict(manager):
+		dict['account_id'] = manager.account_id
+		dict['token'] = manager.token
+		dict['headers'] = gen_rack_api_v1_0_compatible_headers(manager.account_id, manager.token)
+	token_manager.listeners.append(_update_dict)
+	token_manager.start()
+
+	[endpoint] = token_manager.endpoints
+	g = gen_curried_api_generator_function(endpoint['publicURL'], {}, dict, session, token_manager)
 	for api_operation in API_OPERATIONS:
 		g(*api_operation)
-	dict['account_id'] = account_id
-	dict['token'] = token
-	dict['url'] = re['publicURL']
-	dict['headers'] = headers
+	dict['url'] = endpoint['publicURL']
+	dict['session'] = session
+	dict['token_manager'] = token_manager
+
+	def _map(f, args_list, max_workers = pool_size, return_exceptions = False):
+		return concurrent_map(f, args_list, max_workers, return_exceptions)
+	dict['map'] = _map
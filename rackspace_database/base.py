@@ -1,4 +1,31 @@
-from libcloud.common.base import ConnectionUserAndKey
+class _DefaultConnectionClass(object):
+    """
+    Resolves to libcloud's C{ConnectionUserAndKey} on first access so that
+    importing the models does not import libcloud.
+    """
+
+    def __get__(self, instance, owner):
+        from libcloud.common.base import ConnectionUserAndKey
+        return ConnectionUserAndKey
+
+
+def status_code(error):
+    """
+    Return the HTTP status code carried by an error raised by the driver,
+    or C{None}.
+
+    The API error bodies look like C{{"itemNotFound": {"code": 404, ...}}}
+    and libcloud raises them as the argument of a plain C{Exception}.
+    """
+    code = getattr(error, 'code', None)
+    if code is not None:
+        return code
+    args = getattr(error, 'args', None)
+    if args and isinstance(args[0], dict):
+        for value in args[0].values():
+            if isinstance(value, dict) and 'code' in value:
+                return value['code']
+    return None
 
 
 class InstanceStatus(object):
@@ -8,6 +35,9 @@ class InstanceStatus(object):
     SHUTDOWN = 3
     FAILED = 4
     RESIZE = 5
+    REBOOT = 6
+    # Any status this version does not know about
+    UNKNOWN = 7
 
 
 class Instance(object):
@@ -65,7 +95,7 @@ class DatabaseDriver(object):
     A base DatabaseDriver to derive from.
     """
 
-    connectionCls = ConnectionUserAndKey
+    connectionCls = _DefaultConnectionClass()
 
     def __init__(self, key, secret=None, secure=True, host=None, port=None,
                  **kwargs):
@@ -0,0 +1,368 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Record and replay of API exchanges.
+
+A driver created with C{ex_record=cassette} sends its requests through a
+L{RecordingTransport}, which stores every request / response pair in the
+L{Cassette} together with its latency.  Credentials never reach the
+cassette: request headers are not kept, and the values of the
+L{REDACTED_FIELDS} found in JSON bodies (user passwords, root passwords)
+are replaced.  Compressed responses are stored decoded.
+
+The cassette is saved as JSON lines, gzipped when the path ends with
+C{.gz}, and replayed with a L{ReplayTransport}, at the recorded speed or
+without any delay::
+
+    cassette = Cassette()
+    driver = RackspaceDatabaseDriver(user, key, ex_record=cassette)
+    driver.list_instances()
+    cassette.save('list_instances.jsonl.gz')
+
+    cassette = Cassette.load('list_instances.jsonl.gz')
+    driver = RackspaceDatabaseDriver('user', 'key',
+                                     **cassette.driver_kwargs(speed=0))
+    driver.list_instances()
+"""
+
+import gzip
+import time
+import zlib
+import base64
+import threading
+
+from collections import deque
+from timeit import default_timer as timer
+
+try:
+    import simplejson as json
+except:
+    import json
+
+from rackspace_database.transports import Transport, LibcloudTransport
+
+__all__ = [
+    'REDACTED',
+    'REDACTED_FIELDS',
+    'REDACTED_HEADERS',
+    'CassetteError',
+    'Cassette',
+    'RecordingTransport',
+    'ReplayTransport',
+    'redact'
+]
+
+REDACTED = 'REDACTED'
+REDACTED_FIELDS = ['password', 'key', 'apiKey', 'token']
+REDACTED_HEADERS = ['x-auth-token', 'x-auth-key', 'authorization',
+                    'set-cookie']
+# Response headers describing the recorded encoding rather than the body
+SKIPPED_HEADERS = ['content-encoding', 'content-length', 'transfer-encoding',
+                   'connection']
+VERSION = 1
+
+
+class CassetteError(Exception):
+    """
+    Raised when a replayed request was not recorded.
+    """
+
+
+def redact(value):
+    """
+    Return a copy of a decoded JSON value with the L{REDACTED_FIELDS}
+    replaced, at any depth.
+    """
+    if isinstance(value, dict):
+        return dict([(k, k in REDACTED_FIELDS and v is not None and
+                      REDACTED or redact(v)) for k, v in value.items()])
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+
+def _redact_body(body):
+    if not body:
+        return body
+    try:
+        value = json.loads(body)
+    except ValueError:
+        return body
+    redacted = redact(value)
+    # Bodies without credentials are kept byte for byte
+    if redacted == value:
+        return body
+    return json.dumps(redacted)
+
+
+def _decode(body, encoding):
+    if encoding == 'gzip':
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+class Cassette(object):
+    """
+    Recorded exchanges, in the order their responses completed.
+
+    @ivar base_url: API endpoint the exchanges were recorded against, used
+                    as C{ex_force_base_url} on replay.
+    """
+
+    def __init__(self, interactions=None, base_url=None):
+        self.interactions = list(interactions or [])
+        self.base_url = base_url
+        self._start = None
+        self._lock = threading.Lock()
+
+    def record(self, method, url, body, status, reason, headers,
+               response_body, elapsed):
+        """
+        Store one exchange, redacting it first.
+        """
+        now = timer()
+        interaction = {'method': method, 'url': url,
+                       'body': _redact_body(body) or None,
+                       'status': status, 'reason': reason,
+                       'headers': [(k, k.lower() in REDACTED_HEADERS and
+                                    REDACTED or v) for k, v in headers
+                                   if k.lower() not in SKIPPED_HEADERS],
+                       'elapsed': round(elapsed, 6)}
+        response_body = _redact_body(response_body)
+        try:
+            interaction['response'] = response_body.decode('utf-8')
+        except UnicodeDecodeError:
+            interaction['response_base64'] = base64.b64encode(response_body)
+        self._lock.acquire()
+        try:
+            if self._start is None:
+                self._start = now - elapsed
+            interaction['offset'] = round(now - elapsed - self._start, 6)
+            self.interactions.append(interaction)
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self.interactions)
+
+    def save(self, path):
+        """
+        Write the cassette as JSON lines, gzipped for a C{.gz} path.
+        """
+        fp = path.endswith('.gz') and gzip.open(path, 'wb') or \
+            open(path, 'w')
+        try:
+            fp.write(json.dumps({'version': VERSION,
+                                 'base_url': self.base_url}) + '\n')
+            for interaction in self.interactions:
+                fp.write(json.dumps(interaction, sort_keys=True) + '\n')
+        finally:
+            fp.close()
+
+    @classmethod
+    def load(cls, path):
+        fp = path.endswith('.gz') and gzip.open(path, 'rb') or open(path)
+        try:
+            lines = fp.read().splitlines()
+        finally:
+            fp.close()
+        header = json.loads(lines[0])
+        if header.get('version') != VERSION:
+            raise CassetteError('Unsupported cassette version %s' %
+                                (header.get('version')))
+        return cls([json.loads(line) for line in lines[1:] if line],
+                   base_url=header.get('base_url'))
+
+    def driver_kwargs(self, speed=1.0, repeat=True):
+        """
+        Keyword arguments of a driver replaying this cassette offline.
+        """
+        return {'ex_force_auth_token': REDACTED,
+                'ex_force_base_url': self.base_url,
+                'ex_transport': ReplayTransport(self, speed=speed,
+                                                repeat=repeat)}
+
+
+class RecordingTransport(Transport):
+    """
+    Transport storing the exchanges made through another one in a
+    L{Cassette}.
+    """
+
+    name = 'record'
+
+    def __init__(self, cassette, transport=None):
+        self.cassette = cassette
+        self.transport = transport or LibcloudTransport()
+
+    def connection(self, host, port, secure, timeout=None):
+        return _RecordingConnection(
+            self.cassette, self.transport.connection(host, port, secure,
+                                                     timeout=timeout))
+
+    def close(self):
+        self.transport.close()
+
+
+class _RecordingConnection(object):
+    def __init__(self, cassette, connection):
+        self._cassette = cassette
+        self._connection = connection
+        self._request = None
+
+    def request(self, method, url, body=None, headers=None):
+        self._request = (method, url, body)
+        self._connection.request(method, url, body, headers or {})
+
+    def getresponse(self):
+        start = timer()
+        response = self._connection.getresponse()
+        body = response.read()
+        elapsed = timer() - start
+
+        headers = response.getheaders()
+        encoding = dict([(k.lower(), v) for k, v in headers]).get(
+            'content-encoding')
+        method, url, request_body = self._request
+        self._cassette.record(method, url, request_body, response.status,
+                              response.reason, headers,
+                              _decode(body, encoding), elapsed)
+        return _BufferedResponse(response.status, response.reason, headers,
+                                 body)
+
+    def close(self):
+        self._connection.close()
+
+
+class _BufferedResponse(object):
+    """
+    C{httplib} style response over a body already in memory.
+    """
+
+    version = 11
+
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self._headers = headers
+        self._body = body
+        self._offset = 0
+
+    def getheaders(self):
+        return list(self._headers)
+
+    def getheader(self, name, default=None):
+        for key, value in self._headers:
+            if key.lower() == name.lower():
+                return value
+        return default
+
+    def read(self, amt=None):
+        if amt is None:
+            amt = len(self._body) - self._offset
+        data = self._body[self._offset:self._offset + amt]
+        self._offset += len(data)
+        return data
+
+    def isclosed(self):
+        return self._offset >= len(self._body)
+
+
+class ReplayTransport(Transport):
+    """
+    Transport answering requests with the responses of a L{Cassette}.
+
+    Requests are matched on their method and URL; the responses recorded
+    for the same request are served in order.
+
+    @type speed: C{float}
+    @param speed: Factor applied to the recorded latencies, C{1} to replay
+                  at the recorded speed and C{0} for no delay.
+
+    @type repeat: C{bool}
+    @param repeat: Start over with the first response of a request once
+                   all of them were served, instead of raising
+                   L{CassetteError}.
+    """
+
+    name = 'replay'
+
+    def __init__(self, cassette, speed=1.0, repeat=True):
+        self.cassette = cassette
+        self.speed = speed
+        self.repeat = repeat
+        self.stats = {'served': 0, 'delay': 0.0}
+        self._queues = {}
+        self._recorded = {}
+        for interaction in cassette.interactions:
+            key = (interaction['method'], interaction['url'])
+            self._recorded.setdefault(key, []).append(interaction)
+        self._lock = threading.Lock()
+
+    def connection(self, host, port, secure, timeout=None):
+        return _ReplayConnection(self)
+
+    def _next(self, method, url):
+        key = (method, url)
+        self._lock.acquire()
+        try:
+            queue = self._queues.get(key)
+            if not queue:
+                if key not in self._recorded or \
+                        (queue is not None and not self.repeat):
+                    raise CassetteError('No recorded response for %s %s' %
+                                        (method, url))
+                queue = self._queues[key] = deque(self._recorded[key])
+            self.stats['served'] += 1
+            return queue.popleft()
+        finally:
+            self._lock.release()
+
+    def _respond(self, method, url):
+        interaction = self._next(method, url)
+        delay = interaction['elapsed'] * self.speed
+        if delay > 0:
+            time.sleep(delay)
+            self.stats['delay'] += delay
+        if 'response_base64' in interaction:
+            body = base64.b64decode(interaction['response_base64'])
+        else:
+            body = interaction['response'].encode('utf-8')
+        headers = [(str(k), str(v)) for k, v in interaction['headers']]
+        headers.append(('content-length', str(len(body))))
+        return _BufferedResponse(interaction['status'],
+                                 interaction['reason'], headers, body)
+
+
+class _ReplayConnection(object):
+    def __init__(self, transport):
+        self._transport = transport
+        self._request = None
+
+    def request(self, method, url, body=None, headers=None):
+        self._request = (method, url)
+
+    def getresponse(self):
+        method, url = self._request
+        return self._transport._respond(method, url)
+
+    def close(self):
+        pass
@@ -0,0 +1,275 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Circuit breakers failing requests fast while an endpoint is degraded.
+
+A L{CircuitBreaker} watches the outcome and latency of the last
+C{window} calls made to one endpoint:
+
+    - C{closed}: calls go through.  Once at least C{min_calls} were seen,
+      the circuit opens when the fraction of failed calls reaches
+      C{failure_rate}, or when the fraction of calls slower than
+      C{slow_call_duration} reaches C{slow_call_rate}.
+    - C{open}: calls fail immediately with L{CircuitOpenError} for
+      C{open_duration} seconds.
+    - C{half_open}: up to C{probes} calls go through as probes, the others
+      are rejected.  The circuit closes once all the probes succeeded and
+      opens again as soon as one fails or is slow.
+
+L{CircuitBreakers} holds the breakers of a set of endpoints, created on
+demand with the same settings.  It reports state changes to its
+listeners and, when given a L{MetricsRegistry}, as C{circuit} series.
+"""
+
+import threading
+
+from collections import deque
+from timeit import default_timer as timer
+
+from libcloud.common.types import LibcloudError
+
+__all__ = [
+    'CLOSED',
+    'OPEN',
+    'HALF_OPEN',
+    'CircuitOpenError',
+    'CircuitBreaker',
+    'CircuitBreakers'
+]
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(LibcloudError):
+    """
+    Raised instead of making a call while the circuit of its endpoint is
+    open.
+
+    @ivar key: Key of the endpoint.
+    @ivar retry_after: Seconds until the circuit lets a probe through.
+    """
+
+    def __init__(self, key, retry_after, driver=None):
+        self.key = key
+        self.retry_after = retry_after
+        value = 'Circuit open for %s, retry in %.1f seconds' % (
+            _format_key(key), retry_after)
+        super(CircuitOpenError, self).__init__(value=value, driver=driver)
+
+
+def _format_key(key):
+    if isinstance(key, tuple):
+        return '/'.join([str(part) for part in key])
+    return str(key)
+
+
+class CircuitBreaker(object):
+    """
+    Circuit breaker of a single endpoint.  See the module documentation
+    for the parameters.
+
+    @type listener: C{callable}
+    @param listener: Called as C{listener(breaker, old_state, new_state,
+                     duration)} on every state change, C{duration} being the
+                     time spent in C{old_state}.
+    """
+
+    def __init__(self, key, failure_rate=0.5, slow_call_duration=None,
+                 slow_call_rate=0.5, window=20, min_calls=10,
+                 open_duration=30, probes=1, listener=None, clock=timer):
+        self.key = key
+        self.failure_rate = failure_rate
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = min_calls
+        self.open_duration = open_duration
+        self.probes = probes
+        self.listener = listener
+        self.clock = clock
+        self.state = CLOSED
+        self.opened_at = None
+        self.changed_at = clock()
+        self.stats = {'calls': 0, 'failures': 0, 'slow_calls': 0,
+                      'rejected': 0, 'opened': 0}
+        # (failed, slow) of the last calls
+        self._outcomes = deque(maxlen=window)
+        self._probes_started = 0
+        self._probes_passed = 0
+        self._lock = threading.Lock()
+
+    def _transition(self, state, now):
+        # Called with the lock held, returns the event to report
+        old_state, changed_at = self.state, self.changed_at
+        self.state = state
+        self.changed_at = now
+        self._probes_started = self._probes_passed = 0
+        if state == OPEN:
+            self.opened_at = now
+            self.stats['opened'] += 1
+        elif state == CLOSED:
+            self._outcomes.clear()
+        return (old_state, state, now - changed_at)
+
+    def before_call(self):
+        """
+        Let a call through or raise L{CircuitOpenError}.  Every call let
+        through must be followed by L{record}.
+        """
+        event = None
+        now = self.clock()
+        self._lock.acquire()
+        try:
+            if self.state == OPEN:
+                retry_after = self.opened_at + self.open_duration - now
+                if retry_after > 0:
+                    self.stats['rejected'] += 1
+                    raise CircuitOpenError(self.key, retry_after)
+                event = self._transition(HALF_OPEN, now)
+            if self.state == HALF_OPEN:
+                if self._probes_started >= self.probes:
+                    self.stats['rejected'] += 1
+                    raise CircuitOpenError(self.key, 0)
+                self._probes_started += 1
+        finally:
+            self._lock.release()
+        self._notify(event)
+
+    def record(self, duration, failed):
+        """
+        Record the outcome of a call let through by L{before_call}.
+
+        @type duration: C{float}
+        @param duration: Latency of the call in seconds.
+
+        @type failed: C{bool}
+        @param failed: Whether the call failed because of the endpoint.
+        """
+        slow = self.slow_call_duration is not None and \
+            duration >= self.slow_call_duration
+        event = None
+        now = self.clock()
+        self._lock.acquire()
+        try:
+            self.stats['calls'] += 1
+            self.stats['failures'] += failed and 1 or 0
+            self.stats['slow_calls'] += slow and 1 or 0
+            if self.state == HALF_OPEN:
+                if failed or slow:
+                    event = self._transition(OPEN, now)
+                else:
+                    self._probes_passed += 1
+                    if self._probes_passed >= self.probes:
+                        event = self._transition(CLOSED, now)
+            elif self.state == CLOSED:
+                self._outcomes.append((failed, slow))
+                if self._tripped():
+                    event = self._transition(OPEN, now)
+        finally:
+            self._lock.release()
+        self._notify(event)
+
+    def _tripped(self):
+        count = len(self._outcomes)
+        if count < self.min_calls:
+            return False
+        failures = len([o for o in self._outcomes if o[0]])
+        if float(failures) / count >= self.failure_rate:
+            return True
+        if self.slow_call_duration is None:
+            return False
+        slow = len([o for o in self._outcomes if o[1]])
+        return float(slow) / count >= self.slow_call_rate
+
+    def _notify(self, event):
+        if event is not None and self.listener is not None:
+            old_state, new_state, duration = event
+            self.listener(self, old_state, new_state, duration)
+
+    def snapshot(self):
+        self._lock.acquire()
+        try:
+            result = dict(self.stats)
+            result['key'] = _format_key(self.key)
+            result['state'] = self.state
+            result['window'] = len(self._outcomes)
+            result['window_failures'] = len([o for o in self._outcomes
+                                             if o[0]])
+            return result
+        finally:
+            self._lock.release()
+
+
+class CircuitBreakers(object):
+    """
+    The circuit breakers of a set of endpoints, shared by any number of
+    connections.
+
+    @type metrics: L{MetricsRegistry}
+    @param metrics: Registry receiving a C{circuit} observation labelled
+                    with the endpoint and the new state on every state
+                    change, its duration being the time spent in the
+                    previous state.
+
+    @param settings: L{CircuitBreaker} parameters.
+    """
+
+    def __init__(self, metrics=None, **settings):
+        self.metrics = metrics
+        self.settings = settings
+        self.events = deque(maxlen=100)
+        self._listeners = []
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """
+        Call C{listener(breaker, old_state, new_state)} on every state
+        change of every breaker.
+        """
+        self._listeners.append(listener)
+
+    def get(self, key):
+        self._lock.acquire()
+        try:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(key, listener=self._changed,
+                                         **self.settings)
+                self._breakers[key] = breaker
+            return breaker
+        finally:
+            self._lock.release()
+
+    def _changed(self, breaker, old_state, new_state, duration):
+        self.events.append((breaker.changed_at, breaker.key, old_state,
+                            new_state))
+        if self.metrics is not None:
+            self.metrics.observe('circuit', _format_key(breaker.key),
+                                 new_state, duration,
+                                 error=new_state == OPEN)
+        for listener in list(self._listeners):
+            listener(breaker, old_state, new_state)
+
+    def snapshot(self):
+        self._lock.acquire()
+        try:
+            breakers = list(self._breakers.values())
+        finally:
+            self._lock.release()
+        return sorted([b.snapshot() for b in breakers],
+                      key=lambda s: s['key'])
@@ -0,0 +1,427 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Bounded concurrency helpers shared by the bulk operations.
+
+L{WorkerPool} runs callables on a fixed number of threads and hands back
+L{Task} objects; L{bounded_map} is the common "call this for every item,
+at most N at a time, give me the results in order" case built on it.
+
+Where a fixed N is either too slow or gets the calls throttled, an
+L{AdaptiveLimiter} can be given instead of N.  It adjusts the number of
+calls in flight with AIMD: the limit grows by one per round of calls
+while their latency stays close to the lowest latency seen recently, and
+is multiplied by C{decrease} when the latency rises past
+C{latency_tolerance} times that baseline or a call is throttled (413,
+429) or fails on the server side (5xx, network errors).
+L{shared_limiter} returns the limiter shared by all the parallel paths of
+a driver::
+
+    limiter = shared_limiter(driver, max_limit=64)
+    teardown(driver, name='loadtest-*', concurrency=limiter)
+    FleetCrawler(driver, concurrency=limiter).write_jsonl(fp)
+    limiter.snapshot()
+"""
+
+import sys
+import socket
+import threading
+import weakref
+
+from collections import deque
+from timeit import default_timer as timer
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    import httplib
+except ImportError:
+    import http.client as httplib
+
+from rackspace_database.base import status_code
+
+__all__ = [
+    'Task',
+    'WorkerPool',
+    'AdaptiveLimiter',
+    'bounded_map',
+    'shared_limiter'
+]
+
+THROTTLED_CODES = (413, 429)
+
+# Failures of the connection itself, socket.timeout and ssl.SSLError
+# included
+NETWORK_ERRORS = (socket.error, EOFError, httplib.HTTPException)
+
+
+class Task(object):
+    """
+    The pending result of a callable submitted to a L{WorkerPool}.
+    """
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.value = None
+        self.error = None
+        self._done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def run(self):
+        try:
+            self.value = self.func(*self.args, **self.kwargs)
+        except Exception:
+            self.error = sys.exc_info()[1]
+
+        self._lock.acquire()
+        try:
+            self._done.set()
+            callbacks = self._callbacks
+            self._callbacks = []
+        finally:
+            self._lock.release()
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        """
+        Call C{callback(task)} once the task is done, right away when it
+        already is.
+        """
+        self._lock.acquire()
+        try:
+            if not self._done.isSet():
+                self._callbacks.append(callback)
+                return
+        finally:
+            self._lock.release()
+        callback(self)
+
+    def done(self):
+        return self._done.isSet()
+
+    def wait(self, timeout=None):
+        self._done.wait(timeout)
+        return self._done.isSet()
+
+    def result(self, timeout=None):
+        """
+        Return the value of the callable, re-raising its exception.
+        """
+        if not self.wait(timeout):
+            raise RuntimeError('Task did not finish within %s seconds' %
+                               (timeout))
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class WorkerPool(object):
+    """
+    A fixed set of daemon threads running submitted callables in order of
+    submission.
+
+    @type concurrency: C{int}
+    @param concurrency: Number of worker threads.
+    """
+
+    def __init__(self, concurrency=10, name='worker'):
+        if concurrency < 1:
+            raise ValueError('concurrency must be at least 1')
+        self.concurrency = concurrency
+        self.name = name
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _start_workers(self):
+        # Threads are started lazily, up to one per pending task
+        self._lock.acquire()
+        try:
+            if self._closed:
+                raise RuntimeError('WorkerPool is closed')
+            if len(self._threads) < self.concurrency:
+                thread = threading.Thread(target=self._work, name='%s-%d' %
+                                          (self.name, len(self._threads)))
+                thread.setDaemon(True)
+                thread.start()
+                self._threads.append(thread)
+        finally:
+            self._lock.release()
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            task.run()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Schedule C{func(*args, **kwargs)} and return its L{Task}.
+        """
+        task = Task(func, args, kwargs)
+        self._start_workers()
+        self._queue.put(task)
+        return task
+
+    def close(self, wait=True):
+        """
+        Stop the workers once the submitted tasks have run.
+        """
+        self._lock.acquire()
+        try:
+            self._closed = True
+            threads = list(self._threads)
+        finally:
+            self._lock.release()
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+        return False
+
+
+class AdaptiveLimiter(object):
+    """
+    AIMD limit on the number of calls in flight.  See the module
+    documentation.
+
+    @type initial: C{int}
+    @param initial: Starting limit.
+
+    @type min_limit: C{int}
+    @param min_limit: The limit never goes below it.
+
+    @type max_limit: C{int}
+    @param max_limit: The limit never goes above it, this is also the number
+                      of threads the parallel paths start.
+
+    @type decrease: C{float}
+    @param decrease: Factor applied to the limit on a congestion signal.
+
+    @type latency_tolerance: C{float}
+    @param latency_tolerance: Ratio of the recent latency over the baseline
+                              latency from which latency counts as rising.
+
+    @type window: C{int}
+    @param window: Number of calls the baseline latency is the minimum of.
+
+    @type smoothing: C{float}
+    @param smoothing: Weight of the last call in the recent latency, an
+                      exponentially weighted moving average.
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=64, decrease=0.5,
+                 latency_tolerance=2.0, window=100, smoothing=0.2,
+                 clock=timer):
+        if not 1 <= min_limit <= initial <= max_limit:
+            raise ValueError('Expected 1 <= min_limit <= initial <= '
+                             'max_limit')
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.clock = clock
+        self.limit = float(initial)
+        self.in_flight = 0
+        self.latency = None
+        self.stats = {'calls': 0, 'throttled': 0, 'errors': 0,
+                      'latency_rises': 0, 'decreases': 0}
+        # (time, limit) after every change
+        self.history = deque([(clock(), self.limit)], maxlen=1000)
+        self._latencies = deque(maxlen=window)
+        self._last_decrease = None
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+
+    @property
+    def baseline(self):
+        """
+        Lowest latency of the last C{window} calls.
+        """
+        latencies = list(self._latencies)
+        return latencies and min(latencies) or None
+
+    def acquire(self):
+        """
+        Wait until a call may start.  Every L{acquire} must be followed by
+        a L{release}.
+        """
+        self._lock.acquire()
+        try:
+            while self.in_flight >= int(self.limit):
+                self._available.wait()
+            self.in_flight += 1
+        finally:
+            self._lock.release()
+
+    def release(self, latency, error=None):
+        """
+        Record the outcome of a call started with L{acquire}.
+
+        @type latency: C{float}
+        @param latency: Duration of the call in seconds.
+
+        @param error: Exception the call raised, if any.  Only 413, 429,
+                      5xx and L{NETWORK_ERRORS} are congestion signals,
+                      not client errors nor local failures.
+        """
+        signal = _congestion(error)
+        now = self.clock()
+        self._lock.acquire()
+        try:
+            self.in_flight -= 1
+            self.stats['calls'] += 1
+            if signal is None:
+                self._latencies.append(latency)
+                if self.latency is None:
+                    self.latency = latency
+                else:
+                    self.latency += self.smoothing * (latency - self.latency)
+                if self.latency > self.baseline * self.latency_tolerance:
+                    signal = 'latency_rises'
+            else:
+                self.stats[signal] += 1
+
+            if signal is None:
+                # One more call in flight per round of limit calls
+                self.limit = min(self.max_limit,
+                                 self.limit + 1.0 / self.limit)
+            elif self._last_decrease is None or \
+                    now - self._last_decrease >= (self.latency or 0):
+                # At most one decrease per round trip, the calls already
+                # in flight carry the same signal
+                if signal == 'latency_rises':
+                    self.stats['latency_rises'] += 1
+                self.stats['decreases'] += 1
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+                self._last_decrease = now
+            if int(self.limit) != int(self.history[-1][1]):
+                self.history.append((now, self.limit))
+            self._available.notifyAll()
+        finally:
+            self._lock.release()
+
+    def call(self, func, *args, **kwargs):
+        """
+        Run C{func(*args, **kwargs)} within the limit and return its value.
+        """
+        self.acquire()
+        start = timer()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            error = sys.exc_info()[1]
+            self.release(timer() - start, error)
+            raise
+        self.release(timer() - start)
+        return result
+
+    def snapshot(self):
+        """
+        @rtype: C{dict}
+        @return: The current C{limit}, the calls C{in_flight}, the recent
+                 and C{baseline} latencies and the counters of the
+                 congestion signals.
+        """
+        self._lock.acquire()
+        try:
+            result = dict(self.stats)
+            result['limit'] = int(self.limit)
+            result['in_flight'] = self.in_flight
+            result['latency'] = self.latency
+            result['baseline'] = self.baseline
+            return result
+        finally:
+            self._lock.release()
+
+
+def _congestion(error):
+    """
+    Return the congestion signal carried by the error of a call, if any.
+    """
+    if error is None:
+        return None
+    code = status_code(error)
+    if code in THROTTLED_CODES:
+        return 'throttled'
+    if code is None:
+        # Local failures say nothing about the load of the API
+        return isinstance(error, NETWORK_ERRORS) and 'errors' or None
+    if code >= 500:
+        return 'errors'
+    return None
+
+
+_limiters = weakref.WeakKeyDictionary()
+_limiters_lock = threading.Lock()
+
+
+def shared_limiter(driver, **settings):
+    """
+    Return the L{AdaptiveLimiter} of a driver, created with C{settings} on
+    first use, so all the parallel paths using it share one limit.
+    """
+    _limiters_lock.acquire()
+    try:
+        limiter = _limiters.get(driver)
+        if limiter is None:
+            limiter = _limiters[driver] = AdaptiveLimiter(**settings)
+        return limiter
+    finally:
+        _limiters_lock.release()
+
+
+def bounded_map(func, items, concurrency=10):
+    """
+    Call C{func(item)} for every item, at most C{concurrency} at a time.
+
+    @type concurrency: C{int} or L{AdaptiveLimiter}
+    @param concurrency: Fixed number of calls in flight, or the limiter
+                        deciding it.
+
+    @rtype: C{list}
+    @return: One L{Task} per item, in the order of C{items}, all done.
+    """
+    items = list(items)
+    if isinstance(concurrency, AdaptiveLimiter):
+        limiter = concurrency
+        concurrency = limiter.max_limit
+        func = lambda item, func=func: limiter.call(func, item)
+    pool = WorkerPool(min(concurrency, len(items)) or 1)
+    try:
+        tasks = [pool.submit(func, item) for item in items]
+        for task in tasks:
+            task.wait()
+    finally:
+        pool.close(wait=False)
+    return tasks
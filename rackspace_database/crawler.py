@@ -0,0 +1,379 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Fleet topology crawler.
+
+A sweep lists the instances of every driver (one per region) and then
+runs C{list_databases}, C{list_users} and C{has_root_enabled} for each
+instance on a bounded pool of workers, instead of 3N + 1 serial round
+trips.  Each API host additionally gets its own limit on the calls in
+flight, so a slow region does not take all the workers.
+
+Records are joined per instance and yielded as soon as the three calls of
+that instance have completed, in completion order.  At most
+C{max_pending} instances are in progress at a time, which bounds memory
+whatever the size of the fleet.
+
+Example::
+
+    python -m rackspace_database.crawler --region ord --region dfw \\
+        --concurrency 32 --per-host 16 --output fleet.jsonl
+"""
+
+import sys
+import threading
+
+from functools import partial
+
+from collections import deque
+from optparse import OptionParser
+from timeit import default_timer as timer
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+try:
+    import simplejson as json
+except:
+    import json
+
+from rackspace_database.base import InstanceStatus
+from rackspace_database.schema import Projection, enum_table
+from rackspace_database.concurrency import AdaptiveLimiter, WorkerPool
+
+__all__ = [
+    'CALLS',
+    'INSTANCE_COLUMNS',
+    'NAME_COLUMNS',
+    'FleetCrawler'
+]
+
+# Record key -> driver method called with the instance id
+CALLS = [
+    ('databases', 'list_databases'),
+    ('users', 'list_users'),
+    ('root_enabled', 'has_root_enabled')
+]
+
+# Fields fetched by a crawler created with projections=True
+INSTANCE_COLUMNS = Projection('InstanceColumns', ('id', 'name', 'status',
+                                                  'flavorRef', 'size'))
+NAME_COLUMNS = Projection('Name', ('name',))
+
+STATUS_NAMES = dict([(value, name) for name, value in
+                     enum_table(InstanceStatus).items()])
+
+
+def _names(items):
+    return [item.name for item in items]
+
+
+CONVERTERS = {
+    'databases': _names,
+    'users': _names,
+    'root_enabled': bool
+}
+
+
+class _HostGate(object):
+    """
+    Limits the calls in flight to one API host.
+
+    Calls past the limit wait here rather than on a worker, so the workers
+    stay available to the other hosts.  Once C{cancelled} is set the
+    waiting calls are dropped, since the pool is being closed.
+    """
+
+    def __init__(self, pool, limit, cancelled):
+        self.pool = pool
+        self.limit = limit
+        self.cancelled = cancelled
+        self.running = 0
+        self._waiting = deque()
+        self._lock = threading.Lock()
+
+    def submit(self, func, args, callback):
+        """
+        Submit C{func(*args)} to the pool once the host has a free slot
+        and call C{callback(task)} when it is done.
+        """
+        self._lock.acquire()
+        try:
+            if self.cancelled.isSet():
+                return
+            if self.running >= self.limit:
+                self._waiting.append((func, args, callback))
+                return
+            self.running += 1
+        finally:
+            self._lock.release()
+        self._submit(func, args, callback)
+
+    def _submit(self, func, args, callback):
+        try:
+            task = self.pool.submit(func, *args)
+        except RuntimeError:
+            # The crawl was cancelled between the check and the submission
+            if not self.cancelled.isSet():
+                raise
+            return
+        task.add_done_callback(lambda task: self._release(task, callback))
+
+    def _release(self, task, callback):
+        self._lock.acquire()
+        try:
+            if self.cancelled.isSet():
+                self._waiting.clear()
+            following = self._waiting and self._waiting.popleft() or None
+            if following is None:
+                self.running -= 1
+        finally:
+            self._lock.release()
+        callback(task)
+        if following is not None:
+            self._submit(*following)
+
+
+def _interleave(queues):
+    """
+    Yield the items of the queues round-robin.
+    """
+    queues = [deque(items) for items in queues if items]
+    while queues:
+        for items in list(queues):
+            yield items.popleft()
+            if not items:
+                queues.remove(items)
+
+
+class _Join(object):
+    """
+    Collects the results of the calls made for one instance.
+    """
+
+    def __init__(self, record, remaining, done):
+        self.record = record
+        self.remaining = remaining
+        self.done = done
+        self._lock = threading.Lock()
+
+    def complete(self, key, task):
+        if task.error is None:
+            self.record[key] = CONVERTERS[key](task.value)
+        else:
+            self.record[key] = None
+            self.record.setdefault('errors', {})[key] = str(task.error)
+
+        self._lock.acquire()
+        try:
+            self.remaining -= 1
+            finished = not self.remaining
+        finally:
+            self._lock.release()
+        if finished:
+            self.done(self.record)
+
+
+class FleetCrawler(object):
+    """
+    Crawls the instances, databases, users and root status of a fleet.
+
+    @type drivers: C{list}
+    @param drivers: Drivers to crawl, typically one per region.  They are
+                    shared by the workers.
+
+    @type concurrency: C{int} or L{AdaptiveLimiter}
+    @param concurrency: Maximum number of calls in flight overall, or the
+                        limiter deciding it.
+
+    @type per_host: C{int}
+    @param per_host: Maximum number of calls in flight per API host.
+
+    @type max_pending: C{int}
+    @param max_pending: Maximum number of instances in progress, defaults
+                        to twice C{concurrency}.
+
+    @type projections: C{bool}
+    @param projections: Fetch L{INSTANCE_COLUMNS} and L{NAME_COLUMNS} rows
+                        with C{ex_projection} instead of mapping the
+                        responses to model objects.
+    """
+
+    def __init__(self, drivers, concurrency=16, per_host=8, max_pending=None,
+                 projections=False):
+        if not isinstance(drivers, (list, tuple)):
+            drivers = [drivers]
+        self.drivers = list(drivers)
+        self.limiter = None
+        if isinstance(concurrency, AdaptiveLimiter):
+            self.limiter = concurrency
+            concurrency = concurrency.max_limit
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.max_pending = max_pending or concurrency * 2
+        self.projections = projections
+        self.stats = {'instances': 0, 'calls': 0, 'errors': 0,
+                      'elapsed': None}
+
+    def _host(self, driver):
+        connection = driver.connection
+        return '%s:%s' % (getattr(connection, 'host', None),
+                          getattr(connection, 'port', None))
+
+    def _call(self, func, *args):
+        if self.limiter is not None:
+            return self.limiter.call(func, *args)
+        return func(*args)
+
+    def _record(self, host, instance):
+        return {'host': host,
+                'id': instance.id,
+                'name': instance.name,
+                'status': STATUS_NAMES.get(instance.status, instance.status),
+                'flavorRef': instance.flavorRef,
+                'size': instance.size}
+
+    def _start(self, gate, driver, host, instance, done):
+        join = _Join(self._record(host, instance), len(CALLS), done)
+        for key, method in CALLS:
+            func = getattr(driver, method)
+            if self.projections and key != 'root_enabled':
+                func = partial(func, ex_projection=NAME_COLUMNS)
+            gate.submit(self._call, (func, instance.id),
+                        lambda task, key=key: join.complete(key, task))
+
+    def crawl(self):
+        """
+        Generate one joined record per instance, as a dict.
+        """
+        start = timer()
+        pool = WorkerPool(self.concurrency, name='crawler')
+        # Set when the generator is closed, so that the gates stop
+        # submitting to the closed pool
+        cancelled = threading.Event()
+        gates = {}
+        completed = queue.Queue()
+        try:
+            listings = []
+            for driver in self.drivers:
+                if self.projections:
+                    listings.append(pool.submit(
+                        driver.list_instances,
+                        ex_projection=INSTANCE_COLUMNS))
+                else:
+                    listings.append(pool.submit(driver.list_instances))
+            # Round-robin across the drivers, so that every region has
+            # instances in progress from the start
+            per_driver = []
+            for driver, listing in zip(self.drivers, listings):
+                host = self._host(driver)
+                if host not in gates:
+                    gates[host] = _HostGate(pool, self.per_host, cancelled)
+                per_driver.append([(driver, host, i)
+                                   for i in listing.result()])
+            work = deque(_interleave(per_driver))
+
+            pending = 0
+            while work or pending:
+                while work and pending < self.max_pending:
+                    driver, host, instance = work.popleft()
+                    self._start(gates[host], driver, host, instance,
+                                completed.put)
+                    pending += 1
+                record = completed.get()
+                pending -= 1
+                self.stats['instances'] += 1
+                self.stats['calls'] += len(CALLS)
+                self.stats['errors'] += len(record.get('errors', ()))
+                yield record
+        finally:
+            cancelled.set()
+            pool.close(wait=False)
+            self.stats['elapsed'] = timer() - start
+
+    def write_jsonl(self, fp):
+        """
+        Write the records to C{fp} as JSON lines and return their number.
+        """
+        count = 0
+        for record in self.crawl():
+            fp.write(json.dumps(record, sort_keys=True) + '\n')
+            count += 1
+        return count
+
+
+def main(argv=None):
+    from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--user', default='user')
+    parser.add_option('--key', default='key')
+    parser.add_option('--auth-url', default=None)
+    parser.add_option('--auth-version', default=None)
+    parser.add_option('--region', action='append', dest='regions',
+                      default=[], help='region to crawl (repeatable)')
+    parser.add_option('--standin', type='int', default=None, metavar='N',
+                      help='crawl a local stand-in server seeded with N '
+                           'instances')
+    parser.add_option('--concurrency', type='int', default=16)
+    parser.add_option('--per-host', type='int', default=8)
+    parser.add_option('--output', default=None,
+                      help='write the records to this file instead of '
+                           'stdout')
+    options, args = parser.parse_args(argv)
+
+    server = None
+    if options.standin is not None:
+        from rackspace_database.standin import StandInServer
+
+        server = StandInServer().start()
+        for i in range(options.standin):
+            server.add_instance('crawler_%06d' % (i), databases=['db'],
+                                users=['user'])
+        options.auth_url = server.auth_url
+        options.auth_version = '1.1'
+
+    kwargs = {}
+    if options.auth_url:
+        kwargs['ex_force_auth_url'] = options.auth_url
+    if options.auth_version:
+        kwargs['ex_force_auth_version'] = options.auth_version
+
+    fp = options.output and open(options.output, 'w') or sys.stdout
+    try:
+        drivers = [RackspaceDatabaseDriver(options.user, options.key,
+                                           ex_force_region=region, **kwargs)
+                   for region in options.regions or [None]]
+        crawler = FleetCrawler(drivers, concurrency=options.concurrency,
+                               per_host=options.per_host)
+        count = crawler.write_jsonl(fp)
+    finally:
+        if fp is not sys.stdout:
+            fp.close()
+        if server is not None:
+            server.stop()
+
+    stats = crawler.stats
+    sys.stderr.write('instances=%d calls=%d errors=%d elapsed=%.2fs\n' %
+                     (count, stats['calls'], stats['errors'],
+                      stats['elapsed']))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
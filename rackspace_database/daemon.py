@@ -0,0 +1,785 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Driver daemon shared by the processes of a host over a Unix socket.
+
+L{DriverDaemon} owns one driver, so its authentication token, its pooled
+connections and a short-lived cache of the read calls are shared by every
+local client, and serves the L{DatabaseDriver} API on a Unix domain
+socket.  L{DaemonDriver} is the client side: it implements the same
+methods and can replace a L{RackspaceDatabaseDriver}::
+
+    python -m rackspace_database.daemon --socket /run/rsdb.sock \\
+        --user $USER --key $KEY --region ord
+
+    driver = DaemonDriver('/run/rsdb.sock')
+    driver.list_instances()
+
+Every message is a frame made of a L{HEADER} (version, kind, request id
+and payload length, in network order) followed by a JSON payload.  Models
+travel as C{{"__model__": ..., "attrs": ...}} objects and errors as
+C{{"__error__": ...}} objects, so the client raises the errors the driver
+raised, with their status code.
+
+L{DaemonDriver.ex_batch} sends many calls in a single frame, which the
+daemon runs concurrently.  The daemon runs at most C{concurrency} calls at
+a time and queues up to C{max_pending}; past that it answers C{BUSY} and
+the client backs off and retries, for up to C{busy_timeout} seconds.
+"""
+
+import os
+import sys
+import time
+import errno
+import socket
+import struct
+import threading
+
+from optparse import OptionParser
+from timeit import default_timer as timer
+
+try:
+    import simplejson as json
+except:
+    import json
+
+from rackspace_database.base import DatabaseDriver, Instance, Database, \
+    Flavor, User, status_code
+from rackspace_database.schema import Projection
+from rackspace_database.concurrency import WorkerPool
+
+__all__ = [
+    'HEADER',
+    'METHODS',
+    'DaemonError',
+    'DaemonBusyError',
+    'DriverDaemon',
+    'DaemonDriver'
+]
+
+VERSION = 1
+
+# Version, kind, request id and payload length
+HEADER = struct.Struct('!BBII')
+
+REQUEST = 1
+BATCH = 2
+RESPONSE = 3
+BUSY = 4
+
+MAX_PAYLOAD = 64 * 1024 * 1024
+
+# The DatabaseDriver methods served by the daemon
+METHODS = [
+    'list_instances', 'get_instance', 'create_instance', 'delete_instance',
+    'restart_instance', 'resize_instance', 'resize_instance_volume',
+    'list_flavors', 'get_flavor',
+    'create_databases', 'create_database', 'list_databases',
+    'delete_database',
+    'create_users', 'create_user', 'list_users', 'delete_user',
+    'enable_root', 'has_root_enabled'
+]
+
+# Calls answered from the cache, any other call clears it
+CACHED_METHODS = frozenset(['list_instances', 'get_instance', 'list_flavors',
+                            'get_flavor', 'list_databases', 'list_users',
+                            'has_root_enabled'])
+
+MODELS = dict([(cls.__name__, cls) for cls in (Instance, Database, Flavor,
+                                                User)])
+
+
+class DaemonError(Exception):
+    """
+    An error raised by the daemon, or by the driver when it is not a plain
+    C{Exception}.
+
+    @ivar type: Class name of the original error.
+    @ivar code: HTTP status code of the original error, if any.
+    """
+
+    def __init__(self, message, type=None, code=None):
+        super(DaemonError, self).__init__(message)
+        self.message = message
+        self.type = type
+        self.code = code
+
+
+class DaemonBusyError(DaemonError):
+    """
+    Raised when the daemon stayed saturated for C{busy_timeout} seconds.
+    """
+
+
+class _MalformedFrame(DaemonError):
+    """
+    A complete frame whose payload is not JSON, the connection is still
+    in sync.
+    """
+
+    def __init__(self, message, kind, request_id):
+        super(_MalformedFrame, self).__init__(message)
+        self.kind = kind
+        self.request_id = request_id
+
+
+def _encode(value):
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    if isinstance(value, dict):
+        return dict([(key, _encode(item)) for key, item in value.items()])
+    if isinstance(value, Projection):
+        return {'__projection__': [value.name, list(value.fields)]}
+    if isinstance(value, Exception):
+        return {'__error__': _encode_error(value)}
+    if type(value).__name__ in MODELS:
+        return {'__model__': type(value).__name__,
+                'attrs': _encode(value.__dict__)}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if isinstance(value, dict):
+        if '__model__' in value:
+            model = MODELS[value['__model__']].__new__(
+                MODELS[value['__model__']])
+            model.__dict__.update(_decode(value['attrs']))
+            return model
+        if '__projection__' in value:
+            name, fields = value['__projection__']
+            return Projection(str(name), [str(f) for f in fields])
+        if '__error__' in value:
+            return _decode_error(value['__error__'])
+        return dict([(key, _decode(item)) for key, item in value.items()])
+    return value
+
+
+def _encode_error(error):
+    if type(error) is Exception:
+        # The API errors, raised with their decoded body as argument
+        try:
+            json.dumps(error.args)
+            return {'type': 'Exception', 'args': list(error.args)}
+        except (TypeError, ValueError):
+            pass
+    return {'type': type(error).__name__, 'message': str(error),
+            'code': status_code(error)}
+
+
+def _decode_error(data):
+    if data['type'] == 'Exception' and 'args' in data:
+        return Exception(*data['args'])
+    return DaemonError(data['message'], type=data['type'],
+                       code=data.get('code'))
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1024 * 1024))
+        if not chunk:
+            raise EOFError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def read_frame(sock):
+    """
+    Read a frame, return C{(kind, request_id, payload)}.
+    """
+    version, kind, request_id, length = HEADER.unpack(
+        _recv_exactly(sock, HEADER.size))
+    if version != VERSION:
+        raise DaemonError('Unsupported protocol version %d' % (version))
+    if length > MAX_PAYLOAD:
+        raise DaemonError('Frame of %d bytes is too large' % (length))
+    data = _recv_exactly(sock, length)
+    try:
+        return kind, request_id, json.loads(data)
+    except ValueError:
+        raise _MalformedFrame('Malformed payload: %s' % (sys.exc_info()[1]),
+                              kind, request_id)
+
+
+def write_frame(sock, kind, request_id, payload):
+    data = json.dumps(payload, separators=(',', ':'))
+    if isinstance(data, unicode):
+        data = data.encode('utf-8')
+    sock.sendall(HEADER.pack(VERSION, kind, request_id, len(data)) + data)
+
+
+class _Cache(object):
+    """
+    Results of the read calls for C{ttl} seconds, cleared by any write.
+
+    A read only stores its result when no write completed while it ran,
+    so a result fetched before a write is not served after it.
+    """
+
+    def __init__(self, ttl, clock=timer):
+        self.ttl = ttl
+        self.clock = clock
+        self.generation = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < self.clock():
+                return None
+            return entry
+        finally:
+            self._lock.release()
+
+    def put(self, key, payload, generation):
+        self._lock.acquire()
+        try:
+            if generation == self.generation:
+                self._entries[key] = (self.clock() + self.ttl, payload)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self.generation += 1
+            self._entries.clear()
+        finally:
+            self._lock.release()
+
+
+class DriverDaemon(object):
+    """
+    Serves the methods of a driver on a Unix socket.
+
+    @param driver: The shared driver, used from C{concurrency} threads.
+
+    @type path: C{str}
+    @param path: Path of the socket, replaced when it already exists.
+
+    @type concurrency: C{int}
+    @param concurrency: Maximum number of driver calls running at a time.
+
+    @type max_pending: C{int}
+    @param max_pending: Maximum number of calls queued or running, past
+                        which requests are answered C{BUSY}.  Defaults to
+                        four times C{concurrency}.
+
+    @type cache_ttl: C{float}
+    @param cache_ttl: Seconds the results of the L{CACHED_METHODS} are
+                      reused, C{0} disables the cache.
+
+    @type mode: C{int}
+    @param mode: Permissions of the socket file.
+    """
+
+    def __init__(self, driver, path, concurrency=16, max_pending=None,
+                 cache_ttl=5, mode=0600):
+        self.driver = driver
+        self.path = path
+        self.concurrency = concurrency
+        self.max_pending = max_pending or concurrency * 4
+        self.cache = cache_ttl and _Cache(cache_ttl) or None
+        self.mode = mode
+        self.stats = {'connections': 0, 'requests': 0, 'batches': 0,
+                      'calls': 0, 'errors': 0, 'busy': 0, 'cache_hits': 0,
+                      'peak_pending': 0}
+        self.pending = 0
+        self._pool = None
+        self._sock = None
+        self._thread = None
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self):
+        """
+        Start serving in a background thread.
+        """
+        try:
+            os.unlink(self.path)
+        except OSError:
+            if sys.exc_info()[1].errno != errno.ENOENT:
+                raise
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        os.chmod(self.path, self.mode)
+        self._sock.listen(128)
+        self._sock.settimeout(0.05)
+        self._pool = WorkerPool(self.concurrency, name='daemon')
+        self._thread = threading.Thread(target=self._accept_loop,
+                                        name='daemon-accept')
+        self._thread.setDaemon(True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._sock.close()
+        self._lock.acquire()
+        try:
+            clients = list(self._clients)
+        finally:
+            self._lock.release()
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        self._pool.close(wait=False)
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while not self._stopped.isSet():
+                self._stopped.wait(1)
+        finally:
+            self.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+        return False
+
+    def _accept_loop(self):
+        while not self._stopped.isSet():
+            try:
+                client, address = self._sock.accept()
+            except socket.timeout:
+                continue
+            except socket.error:
+                return
+            client.settimeout(None)
+            self._lock.acquire()
+            try:
+                self._clients.add(client)
+                self.stats['connections'] += 1
+            finally:
+                self._lock.release()
+            thread = threading.Thread(target=self._serve, args=(client,),
+                                      name='daemon-client')
+            thread.setDaemon(True)
+            thread.start()
+
+    def _serve(self, client):
+        # Responses of pipelined requests may complete out of order
+        write_lock = threading.Lock()
+        try:
+            while True:
+                try:
+                    kind, request_id, payload = read_frame(client)
+                except (EOFError, socket.error):
+                    return
+                except _MalformedFrame:
+                    error = sys.exc_info()[1]
+                    self._reject(client, write_lock, error.request_id,
+                                 error.message)
+                    continue
+                if kind not in (REQUEST, BATCH):
+                    self._reject(client, write_lock, request_id,
+                                 'Unexpected frame kind %d' % (kind))
+                    continue
+                if kind == BATCH and not isinstance(payload, list):
+                    self._reject(client, write_lock, request_id,
+                                 'A batch must be a list of calls')
+                    continue
+                calls = kind == BATCH and payload or [payload]
+                if not self._admit(len(calls)):
+                    self._send(client, write_lock, BUSY, request_id,
+                               {'pending': self.pending})
+                    continue
+                self._run(client, write_lock, kind, request_id, calls)
+        except DaemonError:
+            return
+        finally:
+            self._lock.acquire()
+            try:
+                self._clients.discard(client)
+            finally:
+                self._lock.release()
+            client.close()
+
+    def _reject(self, client, write_lock, request_id, message):
+        self._lock.acquire()
+        try:
+            self.stats['errors'] += 1
+        finally:
+            self._lock.release()
+        self._send(client, write_lock, RESPONSE, request_id,
+                   {'error': {'type': 'DaemonError', 'message': message}})
+
+    def _admit(self, count):
+        self._lock.acquire()
+        try:
+            if self.pending and self.pending + count > self.max_pending:
+                self.stats['busy'] += 1
+                return False
+            self.pending += count
+            self.stats['peak_pending'] = max(self.stats['peak_pending'],
+                                             self.pending)
+            self.stats[count > 1 and 'batches' or 'requests'] += 1
+            self.stats['calls'] += count
+            return True
+        finally:
+            self._lock.release()
+
+    def _run(self, client, write_lock, kind, request_id, calls):
+        if not calls:
+            self._send(client, write_lock, RESPONSE, request_id, [])
+            return
+        results = [None] * len(calls)
+        remaining = [len(calls)]
+
+        def done(index, task):
+            if task.error is None:
+                results[index] = task.value
+            else:
+                results[index] = {'error': _encode_error(task.error)}
+            self._lock.acquire()
+            try:
+                self.pending -= 1
+                remaining[0] -= 1
+                finished = not remaining[0]
+            finally:
+                self._lock.release()
+            if finished:
+                payload = kind == BATCH and results or results[0]
+                self._send(client, write_lock, RESPONSE, request_id, payload)
+
+        for index, call in enumerate(calls):
+            task = self._pool.submit(self._call, call)
+            task.add_done_callback(lambda task, index=index:
+                                   done(index, task))
+
+    def _send(self, client, write_lock, kind, request_id, payload):
+        write_lock.acquire()
+        try:
+            write_frame(client, kind, request_id, payload)
+        except socket.error:
+            pass
+        finally:
+            write_lock.release()
+
+    def _call(self, call):
+        """
+        Run one call, return its encoded C{{"result": ...}} or
+        C{{"error": ...}} payload.
+        """
+        if not isinstance(call, dict):
+            return {'error': {'type': 'DaemonError',
+                              'message': 'A call must be an object, got %s'
+                                         % (type(call).__name__)}}
+        method = call.get('method')
+        if method not in METHODS:
+            return {'error': {'type': 'DaemonError',
+                              'message': 'Unknown method %s' % (method)}}
+
+        key = None
+        cached = self.cache is not None and method in CACHED_METHODS
+        if cached:
+            key = json.dumps([method, call.get('args'), call.get('kwargs')],
+                             sort_keys=True)
+            generation = self.cache.generation
+            entry = self.cache.get(key)
+            if entry is not None:
+                self._lock.acquire()
+                try:
+                    self.stats['cache_hits'] += 1
+                finally:
+                    self._lock.release()
+                return entry[1]
+
+        try:
+            args = _decode(call.get('args') or [])
+            kwargs = dict([(str(k), v) for k, v in
+                           _decode(call.get('kwargs') or {}).items()])
+            payload = {'result': _encode(getattr(self.driver, method)(
+                *args, **kwargs))}
+        except Exception:
+            self._lock.acquire()
+            try:
+                self.stats['errors'] += 1
+            finally:
+                self._lock.release()
+            return {'error': _encode_error(sys.exc_info()[1])}
+        finally:
+            if self.cache is not None and not cached:
+                self.cache.clear()
+        if cached:
+            self.cache.put(key, payload, generation)
+        return payload
+
+
+class _Connection(object):
+    def __init__(self, driver, path):
+        self.driver = driver
+        self.host = 'unix:%s' % (path)
+        self.port = None
+
+    def connect(self):
+        pass
+
+
+def _proxy(method):
+    def call(self, *args, **kwargs):
+        return self._call(method, args, kwargs)
+    call.__name__ = method
+    call.__doc__ = 'Call C{%s} on the daemon.' % (method)
+    return call
+
+
+def _rows(method, result, projection):
+    # JSON turned the projected rows into lists
+    if isinstance(projection, Projection):
+        row = lambda values: projection.row(*values)
+    elif isinstance(projection, (list, tuple)):
+        row = tuple
+    else:
+        return result
+    if method.startswith('list_'):
+        return [row(values) for values in result]
+    return row(result)
+
+
+class DaemonDriver(DatabaseDriver):
+    """
+    Client of a L{DriverDaemon}, with the methods of L{DatabaseDriver}.
+
+    Every thread gets its own connection to the daemon, opened on first
+    use.
+
+    @type path: C{str}
+    @param path: Path of the daemon socket.
+
+    @type busy_timeout: C{float}
+    @param busy_timeout: Seconds during which calls answered C{BUSY} are
+                         retried before L{DaemonBusyError} is raised.
+
+    @type timeout: C{float}
+    @param timeout: Socket timeout in seconds.
+    """
+
+    name = 'Database Driver Daemon'
+
+    def __init__(self, path, busy_timeout=30, timeout=None):
+        # No HTTP connection, DatabaseDriver.__init__ is not called
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.timeout = timeout
+        self.connection = _Connection(self, path)
+        self.stats = {'requests': 0, 'busy': 0}
+        self._local = threading.local()
+        self._ids = 0
+        self._lock = threading.Lock()
+
+    def _socket(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self._local.sock = sock
+        return sock
+
+    def _next_id(self):
+        self._lock.acquire()
+        try:
+            self._ids = (self._ids + 1) % (2 ** 32)
+            self.stats['requests'] += 1
+            return self._ids
+        finally:
+            self._lock.release()
+
+    def _exchange(self, kind, payload):
+        """
+        Send a frame and return the payload of its response, retrying
+        with exponential backoff while the daemon answers C{BUSY}.
+        """
+        deadline = timer() + self.busy_timeout
+        delay = 0.005
+        while True:
+            request_id = self._next_id()
+            sock = self._socket()
+            try:
+                write_frame(sock, kind, request_id, payload)
+                response_kind, response_id, response = read_frame(sock)
+            except (EOFError, socket.error):
+                # The daemon went away, the next call reconnects
+                self.close()
+                raise DaemonError('Lost the connection to the daemon: %s' %
+                                  (sys.exc_info()[1]))
+            if response_id != request_id:
+                self.close()
+                raise DaemonError('Response %d does not match request %d' %
+                                  (response_id, request_id))
+            if response_kind != BUSY:
+                return response
+
+            self._lock.acquire()
+            try:
+                self.stats['busy'] += 1
+            finally:
+                self._lock.release()
+            if timer() + delay > deadline:
+                raise DaemonBusyError('Daemon busy for %s seconds' %
+                                      (self.busy_timeout))
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    def _request(self, method, args, kwargs):
+        return {'method': method, 'args': _encode(list(args)),
+                'kwargs': _encode(kwargs)}
+
+    def _result(self, method, response, kwargs):
+        if 'error' in response:
+            return _decode_error(response['error'])
+        return _rows(method, _decode(response['result']),
+                     kwargs.get('ex_projection'))
+
+    def _call(self, method, args, kwargs):
+        result = self._result(method, self._exchange(
+            REQUEST, self._request(method, args, kwargs)), kwargs)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def ex_batch(self, calls):
+        """
+        Run many calls in one round trip.  The daemon runs them
+        concurrently.
+
+        @type calls: C{list}
+        @param calls: C{(method, args)} or C{(method, args, kwargs)}
+                      tuples.
+
+        @rtype: C{list}
+        @return: The result of every call, in order, or the exception it
+                 raised.
+        """
+        calls = [len(call) == 3 and call or (call[0], call[1], {})
+                 for call in calls]
+        if not calls:
+            return []
+        responses = self._exchange(BATCH, [self._request(*call)
+                                           for call in calls])
+        if isinstance(responses, dict):
+            # The daemon rejected the whole batch
+            raise _decode_error(responses['error'])
+        return [self._result(call[0], response, call[2])
+                for call, response in zip(calls, responses)]
+
+    def close(self):
+        """
+        Close the connection of the calling thread.
+        """
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    list_instances = _proxy('list_instances')
+    get_instance = _proxy('get_instance')
+    create_instance = _proxy('create_instance')
+    delete_instance = _proxy('delete_instance')
+    restart_instance = _proxy('restart_instance')
+    resize_instance = _proxy('resize_instance')
+    resize_instance_volume = _proxy('resize_instance_volume')
+    list_flavors = _proxy('list_flavors')
+    get_flavor = _proxy('get_flavor')
+    create_databases = _proxy('create_databases')
+    create_database = _proxy('create_database')
+    list_databases = _proxy('list_databases')
+    delete_database = _proxy('delete_database')
+    create_users = _proxy('create_users')
+    create_user = _proxy('create_user')
+    list_users = _proxy('list_users')
+    delete_user = _proxy('delete_user')
+    enable_root = _proxy('enable_root')
+    has_root_enabled = _proxy('has_root_enabled')
+
+
+def main(argv=None):
+    from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+    from rackspace_database.transports import PooledTransport
+
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--socket', default='rackspace_database.sock',
+                      help='path of the Unix socket')
+    parser.add_option('--user', default='user')
+    parser.add_option('--key', default='key')
+    parser.add_option('--auth-url', default=None)
+    parser.add_option('--auth-version', default=None)
+    parser.add_option('--region', default='ord')
+    parser.add_option('--concurrency', type='int', default=16)
+    parser.add_option('--max-pending', type='int', default=None)
+    parser.add_option('--cache-ttl', type='float', default=5)
+    parser.add_option('--standin', type='int', default=None, metavar='N',
+                      help='serve a local stand-in server seeded with N '
+                           'instances')
+    options, args = parser.parse_args(argv)
+
+    server = None
+    if options.standin is not None:
+        from rackspace_database.standin import StandInServer
+
+        server = StandInServer().start()
+        for i in range(options.standin):
+            server.add_instance('daemon_%06d' % (i))
+        options.auth_url = server.auth_url
+        options.auth_version = '1.1'
+
+    kwargs = {}
+    if options.auth_url:
+        kwargs['ex_force_auth_url'] = options.auth_url
+    if options.auth_version:
+        kwargs['ex_force_auth_version'] = options.auth_version
+
+    driver = RackspaceDatabaseDriver(
+        options.user, options.key, ex_force_region=options.region,
+        ex_transport=PooledTransport(max_idle=options.concurrency), **kwargs)
+    daemon = DriverDaemon(driver, options.socket,
+                          concurrency=options.concurrency,
+                          max_pending=options.max_pending,
+                          cache_ttl=options.cache_ttl)
+    sys.stderr.write('Serving on %s\n' % (options.socket))
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.stop()
+        sys.stderr.write('%s\n' % (' '.join(['%s=%s' % item for item in
+                                             sorted(daemon.stats.items())])))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
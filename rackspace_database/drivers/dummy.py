@@ -0,0 +1,494 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+In-memory driver for unit tests and capacity simulations.
+
+L{DummyDatabaseDriver} keeps its instances in memory and follows the
+semantics of the API, as served by the L{StandInServer}: new instances
+spend C{ex_build_time} seconds in C{BUILD}, restarts and resizes take
+the instance out of C{ACTIVE} for C{ex_restart_time} and
+C{ex_resize_time} seconds, and errors are raised with the API error
+bodies (C{404} for unknown instances, C{409} for duplicate databases and
+users, C{422} for actions on instances which are not C{ACTIVE}), so
+L{status_code} and the code built on it behave as with the real driver.
+Like the real driver, C{create_databases} and C{create_users} leave out
+the items failing validation and return them with a C{400} error.
+
+Due transitions are kept in a heap and applied lazily, so a call costs
+the same whatever the size of the fleet::
+
+    driver = get_driver(Provider.DUMMY)('user', ex_build_time=30)
+    for i in range(100000):
+        driver.ex_add_instance('load_%06d' % (i))
+"""
+
+import heapq
+import random
+import threading
+
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+from rackspace_database.base import DatabaseDriver, Instance, \
+    InstanceStatus, Database, Flavor, User
+from rackspace_database.schema import Projection
+from rackspace_database.standin import ERROR_NAMES, FLAVORS
+from rackspace_database.validation import MAX_VOLUME_SIZE, database_errors, \
+    user_errors, instance_errors
+
+__all__ = [
+    'DummyDatabaseDriver'
+]
+
+
+def _sampler(value):
+    if callable(value):
+        return value
+    return lambda: value
+
+
+def _error(code, message):
+    """
+    Return the exception the real driver raises for an API error.
+    """
+    return Exception({ERROR_NAMES.get(code, 'error'): {'code': code,
+                                                       'message': message}})
+
+
+def _partition(items, errors_of):
+    """
+    Split the items of a bulk call as the real driver does.
+
+    @return: C{(valid, rejected)}, C{rejected} being a list of
+             C{(item, 400 error)} pairs.
+    """
+    valid = []
+    rejected = []
+    for item in items:
+        errors = errors_of(item)
+        if errors:
+            rejected.append((item, _error(400, errors[0])))
+        else:
+            valid.append(item)
+    return valid, rejected
+
+
+def _user_errors(pair):
+    user, databases = pair
+    errors = user_errors(user)
+    for database in databases:
+        errors.extend(database_errors(database))
+    return errors
+
+
+def _sorted_values(items):
+    # Databases and users are listed by name, as the API does
+    return [items[key] for key in sorted(items)]
+
+
+class _Connection(object):
+    def __init__(self, driver, host):
+        self.driver = driver
+        self.host = host
+        self.port = None
+
+    def connect(self):
+        pass
+
+
+class _Instance(object):
+    __slots__ = ('seq', 'id', 'name', 'flavor_id', 'size', 'status',
+                 'databases', 'users', 'root_enabled', 'pending')
+
+    def __init__(self, seq, instance_id, name, flavor_id, size, status):
+        self.seq = seq
+        self.id = instance_id
+        self.name = name
+        self.flavor_id = flavor_id
+        self.size = size
+        self.status = status
+        self.databases = {}
+        self.users = {}
+        self.root_enabled = False
+        # (target status, ready_at, changes), a target of None deletes the
+        # instance
+        self.pending = None
+
+
+class DummyDatabaseDriver(DatabaseDriver):
+    """
+    In-memory database driver.  All the methods are thread-safe.
+
+    @type ex_build_time: C{float} or C{callable}
+    @param ex_build_time: Seconds (or a distribution such as
+                          L{rackspace_database.standin.lognormal}) a new
+                          instance spends in C{BUILD}.
+
+    @param ex_resize_time: Seconds an instance spends in C{RESIZE}.
+
+    @param ex_restart_time: Seconds an instance spends in C{REBOOT} while
+                            it is restarted.
+
+    @param ex_delete_time: Seconds a deleted instance stays listed.
+
+    @type ex_flavors: C{list}
+    @param ex_flavors: C{(id, name, vcpus, ram)} tuples, defaults to the
+                       flavors of the stand-in.
+
+    @type ex_clock: C{callable}
+    @param ex_clock: Time source, replace it to run simulations on a
+                     virtual clock.
+    """
+
+    name = 'Dummy Database'
+
+    def __init__(self, key='dummy', secret=None, secure=True, host=None,
+                 port=None, ex_build_time=0, ex_resize_time=0,
+                 ex_restart_time=0, ex_delete_time=0, ex_flavors=None,
+                 ex_clock=timer):
+        # No connection to make, DatabaseDriver.__init__ is not called
+        self.key = key
+        self.secret = secret
+        self.secure = secure
+        self.connection = _Connection(self, host or 'dummy')
+        self.endpoint = 'dummy://%s' % (self.connection.host)
+        self.build_time = _sampler(ex_build_time)
+        self.resize_time = _sampler(ex_resize_time)
+        self.restart_time = _sampler(ex_restart_time)
+        self.delete_time = _sampler(ex_delete_time)
+        self.clock = ex_clock
+        self.flavors = OrderedDict([(f[0], Flavor(f[0], f[1], f[2], f[3],
+                                                  self._flavor_href(f[0])))
+                                    for f in ex_flavors or FLAVORS])
+
+        self._instances = OrderedDict()
+        # (ready_at, seq, instance id) of the pending transitions
+        self._due = []
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    # State helpers, called with the lock held
+
+    def _flavor_href(self, flavor_id):
+        return '%s/flavors/%s' % (self.endpoint, flavor_id)
+
+    def _flavor_id(self, flavor_ref):
+        try:
+            flavor_id = int(str(flavor_ref).rstrip('/').split('/')[-1])
+        except ValueError:
+            flavor_id = None
+        if flavor_id not in self.flavors:
+            raise _error(400, 'Invalid flavorRef: %s' % (flavor_ref))
+        return flavor_id
+
+    def _new_instance(self, name, flavor_id, size, status):
+        self._seq += 1
+        instance_id = '%08x-0000-4000-8000-%012x' % (
+            random.getrandbits(32), self._seq)
+        instance = _Instance(self._seq, instance_id, name, flavor_id, size,
+                             status)
+        self._instances[instance_id] = instance
+        return instance
+
+    def _transition(self, instance, status, duration, target,
+                    **changes):
+        ready_at = self.clock() + max(duration(), 0)
+        instance.status = status
+        instance.pending = (target, ready_at, changes)
+        heapq.heappush(self._due, (ready_at, instance.seq, instance.id))
+
+    def _refresh(self):
+        now = self.clock()
+        due = self._due
+        while due and due[0][0] <= now:
+            ready_at, seq, instance_id = heapq.heappop(due)
+            instance = self._instances.get(instance_id)
+            # Transitions replaced by a later one are skipped
+            if instance is None or instance.pending is None or \
+                    instance.pending[1] != ready_at:
+                continue
+            target, ready_at, changes = instance.pending
+            instance.pending = None
+            if target is None:
+                del self._instances[instance_id]
+                continue
+            instance.status = target
+            for key, value in changes.items():
+                setattr(instance, key, value)
+
+    def _instance(self, instance_id):
+        self._refresh()
+        instance = self._instances.get(instance_id)
+        if instance is None:
+            raise _error(404, 'The resource could not be found.')
+        return instance
+
+    def _to_instance(self, instance, full=True):
+        if full:
+            databases = [Database(d.name, d.character_set, d.collate)
+                         for d in _sorted_values(instance.databases)]
+        else:
+            databases = None
+        return Instance(self._flavor_href(instance.flavor_id),
+                        id=instance.id, name=instance.name,
+                        status=instance.status, size=instance.size,
+                        databases=databases or None,
+                        rootEnabled=full and instance.root_enabled or None)
+
+    def _project(self, objects, projection):
+        """
+        Apply an C{ex_projection} to model objects, like the real driver
+        does to the decoded responses.
+        """
+        if projection is None:
+            return objects
+        if projection == 'raw':
+            raise ValueError('The dummy driver has no raw responses')
+        if isinstance(projection, Projection):
+            row = projection.row
+            fields = projection.fields
+            return [row(*[getattr(o, f) for f in fields]) for o in objects]
+        return [tuple([getattr(o, f) for f in projection]) for o in objects]
+
+    def _locked(self, func):
+        self._lock.acquire()
+        try:
+            return func()
+        finally:
+            self._lock.release()
+
+    # Simulation helpers
+
+    def ex_add_instance(self, name, flavor_id=1, size=1,
+                        status=InstanceStatus.ACTIVE, databases=(),
+                        users=()):
+        """
+        Seed an instance without going through C{BUILD} and return its id.
+        """
+        self._lock.acquire()
+        try:
+            instance = self._new_instance(name, flavor_id, size, status)
+            for database in databases:
+                instance.databases[database] = Database(database, 'utf8',
+                                                        'utf8_general_ci')
+            for user in users:
+                instance.users[user] = []
+            return instance.id
+        finally:
+            self._lock.release()
+
+    def ex_count_instances(self):
+        self._lock.acquire()
+        try:
+            self._refresh()
+            return len(self._instances)
+        finally:
+            self._lock.release()
+
+    # DatabaseDriver
+
+    def list_instances(self, ex_projection=None):
+        self._lock.acquire()
+        try:
+            self._refresh()
+            instances = [self._to_instance(i, full=False)
+                         for i in self._instances.values()]
+        finally:
+            self._lock.release()
+        return self._project(instances, ex_projection)
+
+    def get_instance(self, instance_id, ex_projection=None):
+        instance = self._locked(lambda: self._to_instance(
+            self._instance(instance_id)))
+        if ex_projection is None:
+            return instance
+        return self._project([instance], ex_projection)[0]
+
+    def create_instance(self, instance):
+        errors = instance_errors(instance)
+        if errors:
+            raise _error(400, errors[0])
+        self._lock.acquire()
+        try:
+            flavor_id = self._flavor_id(instance.flavorRef)
+            created = self._new_instance(instance.name, flavor_id,
+                                         instance.size, InstanceStatus.BUILD)
+            for database in instance.databases or ():
+                created.databases[database.name] = Database(
+                    database.name, database.character_set or 'utf8',
+                    database.collate or 'utf8_general_ci')
+            self._transition(created, InstanceStatus.BUILD, self.build_time,
+                             InstanceStatus.ACTIVE)
+            return self._to_instance(created)
+        finally:
+            self._lock.release()
+
+    def delete_instance(self, instance_id):
+        self._lock.acquire()
+        try:
+            instance = self._instance(instance_id)
+            if instance.pending and instance.pending[0] is None:
+                raise _error(422, 'Instance is already being deleted.')
+            self._transition(instance, InstanceStatus.SHUTDOWN,
+                             self.delete_time, None)
+            self._refresh()
+            return []
+        finally:
+            self._lock.release()
+
+    def _action(self, instance_id, status, duration, **changes):
+        self._lock.acquire()
+        try:
+            instance = self._instance(instance_id)
+            if instance.status != InstanceStatus.ACTIVE:
+                raise _error(422, 'Instance %s is not ACTIVE.' %
+                             (instance_id))
+            if 'flavor_id' in changes:
+                changes['flavor_id'] = self._flavor_id(changes['flavor_id'])
+            if 'size' in changes:
+                size = changes['size']
+                if not isinstance(size, int) or \
+                        not instance.size < size <= MAX_VOLUME_SIZE:
+                    raise _error(400, 'Volume size must be larger than the '
+                                      'current size and at most %d' %
+                                      (MAX_VOLUME_SIZE))
+            self._transition(instance, status, duration,
+                             InstanceStatus.ACTIVE, **changes)
+            return []
+        finally:
+            self._lock.release()
+
+    def restart_instance(self, instance_id):
+        return self._action(instance_id, InstanceStatus.REBOOT,
+                            self.restart_time)
+
+    def resize_instance(self, instance_id, flavorRef):
+        return self._action(instance_id, InstanceStatus.RESIZE,
+                            self.resize_time, flavor_id=flavorRef)
+
+    def resize_instance_volume(self, instance_id, size):
+        return self._action(instance_id, InstanceStatus.RESIZE,
+                            self.resize_time, size=size)
+
+    def list_flavors(self, ex_projection=None):
+        return self._project(list(self.flavors.values()), ex_projection)
+
+    def get_flavor(self, flavor_id, ex_projection=None):
+        try:
+            flavor = self.flavors[int(flavor_id)]
+        except (KeyError, ValueError):
+            raise _error(404, 'The resource could not be found.')
+        if ex_projection is None:
+            return flavor
+        return self._project([flavor], ex_projection)[0]
+
+    def create_databases(self, instance_id, databases):
+        databases, rejected = _partition(databases, database_errors)
+        if not databases:
+            return rejected
+        self._lock.acquire()
+        try:
+            instance = self._instance(instance_id)
+            names = set()
+            for database in databases:
+                if database.name in instance.databases or \
+                        database.name in names:
+                    raise _error(409, 'Database %s already exists.' %
+                                 (database.name))
+                names.add(database.name)
+            for database in databases:
+                instance.databases[database.name] = Database(
+                    database.name, database.character_set or 'utf8',
+                    database.collate or 'utf8_general_ci')
+            return rejected
+        finally:
+            self._lock.release()
+
+    def create_database(self, instance_id, database):
+        rejected = self.create_databases(instance_id, [database])
+        if rejected:
+            raise rejected[0][1]
+        return rejected
+
+    def list_databases(self, instance_id, ex_projection=None):
+        databases = self._locked(lambda: [
+            Database(d.name, d.character_set, d.collate)
+            for d in _sorted_values(self._instance(instance_id).databases)])
+        return self._project(databases, ex_projection)
+
+    def delete_database(self, instance_id, database_name):
+        self._lock.acquire()
+        try:
+            instance = self._instance(instance_id)
+            if instance.databases.pop(database_name, None) is None:
+                raise _error(404, 'Database %s does not exist.' %
+                             (database_name))
+            return []
+        finally:
+            self._lock.release()
+
+    def create_users(self, instance_id, user_databases_pairs):
+        user_databases_pairs, rejected = _partition(user_databases_pairs,
+                                                    _user_errors)
+        if not user_databases_pairs:
+            return rejected
+        self._lock.acquire()
+        try:
+            instance = self._instance(instance_id)
+            names = set()
+            for user, databases in user_databases_pairs:
+                if user.name in instance.users or user.name in names:
+                    raise _error(409, 'User %s already exists.' %
+                                 (user.name))
+                names.add(user.name)
+            for user, databases in user_databases_pairs:
+                instance.users[user.name] = [d.name for d in databases]
+            return rejected
+        finally:
+            self._lock.release()
+
+    def create_user(self, instance_id, user, databases):
+        rejected = self.create_users(instance_id, [(user, databases)])
+        if rejected:
+            raise rejected[0][1]
+        return rejected
+
+    def list_users(self, instance_id, ex_projection=None):
+        users = self._locked(lambda: [
+            User(name) for name in sorted(self._instance(instance_id).users)])
+        return self._project(users, ex_projection)
+
+    def delete_user(self, instance_id, user_name):
+        self._lock.acquire()
+        try:
+            instance = self._instance(instance_id)
+            if instance.users.pop(user_name, None) is None:
+                raise _error(404, 'User %s does not exist.' % (user_name))
+            return []
+        finally:
+            self._lock.release()
+
+    def enable_root(self, instance_id):
+        self._lock.acquire()
+        try:
+            self._instance(instance_id).root_enabled = True
+        finally:
+            self._lock.release()
+        return User('root', '%016x' % (random.getrandbits(64)))
+
+    def has_root_enabled(self, instance_id):
+        return self._locked(
+            lambda: self._instance(instance_id).root_enabled)
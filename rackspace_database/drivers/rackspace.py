@@ -13,7 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from __future__ import with_statement
+
 import sys
+import zlib
+import threading
+
+from timeit import default_timer as timer
 
 try:
     import simplejson as json
@@ -21,13 +27,26 @@ except:
     import json
 
 from libcloud.utils.py3 import httplib, urlparse
+from libcloud.utils.misc import lowercase_keys
 from libcloud.common.types import MalformedResponseError, LibcloudError
 from libcloud.common.types import LazyList
 from libcloud.common.base import Response
 
 from rackspace_database.providers import Provider
+from rackspace_database.metrics import ByteCounters
+from rackspace_database.tracing import start_span
+from rackspace_database.transports import get_transport, LibcloudTransport
+from rackspace_database.cassette import RecordingTransport
+from rackspace_database.circuit import CircuitBreakers
+from rackspace_database.concurrency import NETWORK_ERRORS
+from rackspace_database.slowlog import SlowCallLog
+from rackspace_database.validation import database_errors, user_errors, \
+    instance_errors
+from rackspace_database.schema import (Schema, Projection, Value, Path,
+                                       Lookup, SelfLink, Nested, enum_table)
 from rackspace_database.base import (DatabaseDriver, Instance,
-                            InstanceStatus, Flavor, Database, User)
+                            InstanceStatus, Flavor, Database, User,
+                            status_code)
 
 from libcloud.common.rackspace import AUTH_URL_US
 from libcloud.common.openstack import OpenStackBaseConnection,\
@@ -36,6 +55,45 @@ from libcloud.common.openstack import OpenStackBaseConnection,\
 API_VERSION = 'v1.0'
 API_URL = 'https://ord.databases.api.rackspacecloud.com/%s' % (API_VERSION)
 
+# Compressed bytes handed to the decompressor at a time
+DECOMPRESS_CHUNK_SIZE = 64 * 1024
+
+DATABASE_SCHEMA = Schema(Database, [
+    Value('name'),
+    Value('character_set', 'character_set', required=False),
+    Value('collate', 'collate', required=False)
+])
+
+INSTANCE_SCHEMA = Schema(Instance, [
+    SelfLink('flavor', name='flavorRef'),
+    Path(('volume', 'size'), 'size'),
+    Value('id', 'id'),
+    Value('name', 'name'),
+    Lookup('status', enum_table(InstanceStatus), 'status',
+           default=InstanceStatus.UNKNOWN),
+    Value('rootEnabled', 'rootEnabled', required=False),
+    Nested('databases', DATABASE_SCHEMA, 'databases')
+])
+
+FLAVOR_SCHEMA = Schema(Flavor, [
+    Value('id'),
+    Value('name'),
+    Value('vcpus'),
+    Value('ram'),
+    SelfLink(name='href')
+])
+
+USER_SCHEMA = Schema(User, [
+    Value('name'),
+    Value('password', 'password', required=False)
+])
+
+# Fields inventory scans need, see the ex_projection argument
+INSTANCE_SUMMARY = Projection('InstanceSummary', ('id', 'status', 'flavorRef'))
+
+# String type the JSON decoder returns, the schema mappers are compiled for it
+DECODED_STRING_TYPE = type(json.loads('["name"]')[0])
+
 
 class RackspaceDatabaseValidationError(LibcloudError):
 
@@ -53,10 +111,103 @@ class RackspaceDatabaseValidationError(LibcloudError):
         return string
 
 
+def _instrumented(func):
+    """
+    Record a C{call} observation and span for every driver request made
+    through C{func} when the connection has a metrics registry or a tracer
+    attached, and a slow call record when it has a slow call log and the
+    call exceeds its threshold.
+    """
+    def wrapper(self, value_dict, *args):
+        connection = self.connection
+        metrics = connection.metrics
+        tracer = connection.tracer
+        slow_calls = connection.slow_calls
+        if metrics is None and tracer is None and slow_calls is None:
+            return func(self, value_dict, *args)
+
+        operation = value_dict.get('operation')
+        if slow_calls is not None:
+            connection.exchange = None
+        start = timer()
+        try:
+            with start_span(tracer, operation, 'call',
+                            url=value_dict.get('url')):
+                result = func(self, value_dict, *args)
+        except Exception:
+            duration = timer() - start
+            if metrics is not None:
+                metrics.observe('call', operation, 'error', duration,
+                                error=True)
+            if slow_calls is not None and duration >= slow_calls.threshold:
+                slow_calls.record(operation, value_dict.get('url'),
+                                  duration, connection.exchange,
+                                  error=sys.exc_info()[1])
+            raise
+        duration = timer() - start
+        if metrics is not None:
+            metrics.observe('call', operation, 'ok', duration)
+        if slow_calls is not None and duration >= slow_calls.threshold:
+            slow_calls.record(operation, value_dict.get('url'), duration,
+                              connection.exchange, result=result)
+        return result
+
+    wrapper.__name__ = func.__name__
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
 class RackspaceDatabaseResponse(Response):
 
     valid_response_codes = [httplib.CONFLICT]
 
+    def __init__(self, response, connection):
+        # Response only sets the connection after reading the body
+        self.connection = connection
+        super(RackspaceDatabaseResponse, self).__init__(response, connection)
+
+    def _decompress_response(self, response):
+        """
+        With compression enabled on the connection, feed the body to the
+        decompressor in chunks as it is read off the socket, instead of
+        buffering the whole compressed body first, and count the bytes.
+        """
+        counters = self.connection.byte_counters
+        if counters is None or \
+                getattr(response, '_original_data', None) is not None:
+            return super(RackspaceDatabaseResponse,
+                         self)._decompress_response(response)
+
+        headers = lowercase_keys(dict(response.getheaders()))
+        encoding = headers.get('content-encoding', None)
+        if encoding in ['gzip', 'x-gzip']:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding in ['zlib', 'deflate']:
+            decompressor = _DeflateDecompressor()
+        else:
+            encoding = None
+            decompressor = None
+
+        chunks = []
+        wire_bytes = 0
+        while True:
+            chunk = response.read(DECOMPRESS_CHUNK_SIZE)
+            if not chunk:
+                break
+            wire_bytes += len(chunk)
+            if decompressor is not None:
+                chunk = decompressor.decompress(chunk)
+            chunks.append(chunk)
+
+        if decompressor is not None:
+            chunks.append(decompressor.flush())
+        body = ''.join(chunks)
+        counters.record(encoding, wire_bytes, len(body))
+
+        if decompressor is None:
+            body = body.strip()
+        return body
+
     def success(self):
         i = int(self.status)
         return i >= 200 and i <= 299 or i in self.valid_response_codes
@@ -78,7 +229,9 @@ class RackspaceDatabaseResponse(Response):
 
         if content_type == 'application/json':
             try:
-                data = json.loads(self.body)
+                with start_span(self.connection.tracer, 'parse_body',
+                                'decode', bytes=len(self.body)):
+                    data = json.loads(self.body)
             except:
                 raise MalformedResponseError('Failed to parse JSON',
                                              body=self.body,
@@ -103,6 +256,30 @@ class RackspaceDatabaseResponse(Response):
         return body
 
 
+class _DeflateDecompressor(object):
+    """
+    Decompressor for C{deflate} bodies, which servers send either zlib
+    wrapped, as the RFC says, or as a raw deflate stream.
+    """
+
+    def __init__(self):
+        self._decompressor = zlib.decompressobj()
+        self._started = False
+
+    def decompress(self, data):
+        if self._started:
+            return self._decompressor.decompress(data)
+        self._started = True
+        try:
+            return self._decompressor.decompress(data)
+        except zlib.error:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self._decompressor.decompress(data)
+
+    def flush(self):
+        return self._decompressor.flush()
+
+
 class RackspaceDatabaseConnection(OpenStackBaseConnection):
     """
     Base connection class for the Rackspace Monitoring driver.
@@ -111,18 +288,104 @@ class RackspaceDatabaseConnection(OpenStackBaseConnection):
     type = Provider.RACKSPACE
     responseCls = RackspaceDatabaseResponse
     auth_url = AUTH_URL_US
+    metrics = None
+    tracer = None
+    byte_counters = None
+    transport = None
+    circuit_breakers = None
+    cassette = None
+    slow_calls = None
     _url_key = "database_url"
 
     def __init__(self, user_id, key, secure=True, ex_force_region='ord',
+                 ex_metrics=None, ex_tracer=None, ex_compression=False,
+                 ex_transport=None, ex_circuit_breaker=None, ex_record=None,
+                 ex_slow_call_threshold=None, ex_slow_call_log=None,
                  **kwargs):
+        # The HTTP connection of the request in flight is per thread so a
+        # connection can be shared by concurrent driver calls
+        self._local = threading.local()
+        self._auth_lock = threading.Lock()
+        self._hosts_populated = False
         super(RackspaceDatabaseConnection, self).__init__(user_id, key, secure,
                                                           **kwargs)
         self.api_version = API_VERSION
         self.accept_format = 'application/json'
         self._ex_force_region = ex_force_region
+        self.metrics = ex_metrics
+        self.tracer = ex_tracer
+        if ex_compression:
+            self.byte_counters = ByteCounters()
+        if ex_transport not in (None, 'libcloud'):
+            self.transport = get_transport(ex_transport)
+        if isinstance(ex_circuit_breaker, CircuitBreakers):
+            self.circuit_breakers = ex_circuit_breaker
+        elif ex_circuit_breaker:
+            settings = ex_circuit_breaker is not True and \
+                ex_circuit_breaker or {}
+            self.circuit_breakers = CircuitBreakers(metrics=ex_metrics,
+                                                    **settings)
+        if ex_slow_call_log is not None:
+            self.slow_calls = ex_slow_call_log
+        elif ex_slow_call_threshold is not None:
+            self.slow_calls = SlowCallLog(ex_slow_call_threshold)
+        if ex_record is not None:
+            self.cassette = ex_record
+            self.transport = RecordingTransport(
+                ex_record, self.transport or LibcloudTransport(
+                    self.conn_classes))
+
+    def _get_connection(self):
+        return getattr(self._local, 'connection', None)
+
+    def _set_connection(self, connection):
+        self._local.connection = connection
+
+    connection = property(_get_connection, _set_connection)
+
+    def _get_exchange(self):
+        return getattr(self._local, 'exchange', None)
+
+    def _set_exchange(self, exchange):
+        self._local.exchange = exchange
+
+    # (status, request bytes, response bytes) of the last request made by
+    # the current thread, only tracked for the slow call log
+    exchange = property(_get_exchange, _set_exchange)
+
+    def connect(self, host=None, port=None, base_url=None):
+        transport = self.transport
+        if transport is None:
+            return super(RackspaceDatabaseConnection, self).connect(
+                host=host, port=port, base_url=base_url)
+
+        secure = self.secure
+        if base_url is None:
+            base_url = getattr(self, 'base_url', None)
+        if base_url:
+            host, port, secure, request_path = self._tuple_from_url(base_url)
+        else:
+            host = host or self.host
+            port = port or self.port
+
+        self.connection = transport.connection(host, int(port), secure,
+                                               timeout=self.timeout)
+
+    def pre_connect_hook(self, params, headers):
+        if self.byte_counters is not None:
+            headers['Accept-Encoding'] = 'gzip, deflate'
+        return super(RackspaceDatabaseConnection,
+                     self).pre_connect_hook(params, headers)
 
     def request(self, action, params=None, data='', headers=None, method='GET',
-                raw=False):
+                raw=False, ex_operation=None):
+        """
+        Perform a request against the database API.
+
+        @type ex_operation: C{str}
+        @param ex_operation: Name of the driver operation issuing the
+                             request, used to label recorded metrics.
+        """
         if not headers:
             headers = {}
         if not params:
@@ -133,13 +396,144 @@ class RackspaceDatabaseConnection(OpenStackBaseConnection):
         if method in ['POST', 'PUT']:
             headers['Content-Type'] = 'application/json; charset=UTF-8'
             data = json.dumps(data)
-
-        return super(RackspaceDatabaseConnection, self).request(
-            action=action,
-            params=params, data=data,
-            method=method, headers=headers,
-            raw=raw
-        )
+        elif not data:
+            # httplib can only send string bodies
+            data = ''
+
+        cassette = self.cassette
+        if cassette is not None and cassette.base_url is None:
+            self._populate_hosts_and_request_paths()
+            cassette.base_url = '%s://%s:%s%s' % (
+                self.secure and 'https' or 'http', self.host, self.port,
+                self.request_path)
+
+        if self.slow_calls is None:
+            return self._dispatch(action, params, data, headers, method, raw,
+                                  ex_operation)
+
+        request_bytes = len(data or '')
+        try:
+            response = self._dispatch(action, params, data, headers, method,
+                                      raw, ex_operation)
+        except Exception:
+            self.exchange = (status_code(sys.exc_info()[1]), request_bytes,
+                             None)
+            raise
+        self.exchange = (int(response.status), request_bytes,
+                         len(response.body or ''))
+        return response
+
+    def _dispatch(self, action, params, data, headers, method, raw,
+                  ex_operation):
+        breakers = self.circuit_breakers
+        if breakers is None:
+            return self._request(action, params, data, headers, method, raw,
+                                 ex_operation)
+
+        # The API host is only known once authenticated
+        self._populate_hosts_and_request_paths()
+        breaker = breakers.get(('%s:%s' % (self.host, self.port),
+                                self._ex_force_region))
+        breaker.before_call()
+        start = timer()
+        try:
+            response = self._request(action, params, data, headers, method,
+                                     raw, ex_operation)
+        except Exception:
+            # Only server errors and network failures say something about
+            # the health of the endpoint, not client errors or responses
+            # which failed to parse
+            error = sys.exc_info()[1]
+            code = status_code(error)
+            if isinstance(code, int):
+                failed = code >= 500
+            else:
+                failed = isinstance(error, NETWORK_ERRORS)
+            breaker.record(timer() - start, failed)
+            raise
+        breaker.record(timer() - start, False)
+        return response
+
+    def _request(self, action, params, data, headers, method, raw,
+                 ex_operation):
+        metrics = self.metrics
+        tracer = self.tracer
+        if metrics is None and tracer is None:
+            return super(RackspaceDatabaseConnection, self).request(
+                action=action,
+                params=params, data=data,
+                method=method, headers=headers,
+                raw=raw
+            )
+
+        operation = ex_operation or method
+        request_bytes = len(data or '')
+        start = timer()
+        try:
+            with start_span(tracer, operation, 'network', method=method,
+                            action=action,
+                            request_bytes=request_bytes) as span:
+                try:
+                    response = super(RackspaceDatabaseConnection,
+                                     self).request(
+                        action=action,
+                        params=params, data=data,
+                        method=method, headers=headers,
+                        raw=raw
+                    )
+                except Exception:
+                    span.set(status=status_code(sys.exc_info()[1]))
+                    raise
+                status = int(response.status)
+                response_bytes = len(response.body or '')
+                span.set(status=status, response_bytes=response_bytes)
+        except Exception:
+            e = sys.exc_info()[1]
+            if metrics is not None:
+                code = status_code(e)
+                metrics.observe('http', operation,
+                                code is None and 'error' or code,
+                                timer() - start, request_bytes=request_bytes,
+                                error=True)
+            raise
+
+        if metrics is not None:
+            metrics.observe('http', operation, status, timer() - start,
+                            request_bytes=request_bytes,
+                            response_bytes=response_bytes,
+                            error=not 200 <= status <= 299)
+        return response
+
+    def _populate_hosts_and_request_paths(self):
+        if self.auth_token and self._hosts_populated:
+            return super(RackspaceDatabaseConnection,
+                         self)._populate_hosts_and_request_paths()
+
+        # Concurrent first requests wait for a single authentication
+        with self._auth_lock:
+            self._authenticate()
+            self._hosts_populated = True
+
+    def _authenticate(self):
+        metrics = self.metrics
+        tracer = self.tracer
+        if (metrics is None and tracer is None) or self.auth_token:
+            return super(RackspaceDatabaseConnection,
+                         self)._populate_hosts_and_request_paths()
+
+        start = timer()
+        try:
+            with start_span(tracer, 'authenticate', 'auth',
+                            auth_version=self._auth_version):
+                super(RackspaceDatabaseConnection,
+                      self)._populate_hosts_and_request_paths()
+        except Exception:
+            if metrics is not None:
+                metrics.observe('auth', 'authenticate', 'error',
+                                timer() - start, error=True)
+            raise
+        if metrics is not None:
+            metrics.observe('auth', 'authenticate', 'ok', timer() - start)
 
     def get_endpoint(self):
         region = self._ex_force_region
@@ -169,39 +563,55 @@ class RackspaceDatabaseDriver(DatabaseDriver, OpenStackDriverMixin):
     def __init__(self, *args, **kwargs):
         OpenStackDriverMixin.__init__(self, *args, **kwargs)
         self._ex_force_region = kwargs.pop('ex_force_region', None)
+        self._ex_metrics = kwargs.pop('ex_metrics', None)
+        self._ex_tracer = kwargs.pop('ex_tracer', None)
+        self._ex_compression = kwargs.pop('ex_compression', False)
+        self._ex_transport = kwargs.pop('ex_transport', None)
+        self._ex_circuit_breaker = kwargs.pop('ex_circuit_breaker', None)
+        self._ex_record = kwargs.pop('ex_record', None)
+        self._ex_slow_call_threshold = kwargs.pop('ex_slow_call_threshold',
+                                                  None)
+        self._ex_slow_call_log = kwargs.pop('ex_slow_call_log', None)
+        self._ex_validate = kwargs.pop('ex_validate', True)
         super(RackspaceDatabaseDriver, self).__init__(*args, **kwargs)
 
     def _ex_connection_class_kwargs(self):
         kwargs = self.openstack_connection_kwargs()
         if self._ex_force_region:
             kwargs['ex_force_region'] = self._ex_force_region
+        if self._ex_metrics is not None:
+            kwargs['ex_metrics'] = self._ex_metrics
+        if self._ex_tracer is not None:
+            kwargs['ex_tracer'] = self._ex_tracer
+        if self._ex_compression:
+            kwargs['ex_compression'] = True
+        if self._ex_transport is not None:
+            kwargs['ex_transport'] = self._ex_transport
+        if self._ex_circuit_breaker is not None:
+            kwargs['ex_circuit_breaker'] = self._ex_circuit_breaker
+        if self._ex_record is not None:
+            kwargs['ex_record'] = self._ex_record
+        if self._ex_slow_call_threshold is not None:
+            kwargs['ex_slow_call_threshold'] = self._ex_slow_call_threshold
+        if self._ex_slow_call_log is not None:
+            kwargs['ex_slow_call_log'] = self._ex_slow_call_log
 
         return kwargs
 
+    @_instrumented
     def _get_request(self, value_dict):
         key = None
 
         params = value_dict.get('params', {})
 
-        response = self.connection.request(value_dict['url'], params)
+        response = self.connection.request(value_dict['url'], params,
+                ex_operation=value_dict.get('operation'))
 
         # newdata, self._last_key, self._exhausted
         if response.status == httplib.NO_CONTENT:
             return []
         elif response.status == httplib.OK:
-            resp = json.loads(response.body)
-            l = None
-
-            if 'namespace' in value_dict:
-                resp = resp[value_dict['namespace']]
-
-            if 'list_item_mapper' in value_dict:
-                func = value_dict['list_item_mapper']
-                l = [func(x, value_dict) for x in resp]
-            else:
-                l = value_dict['object_mapper'](resp, value_dict)
-
-            return l
+            return self._map_response(response, value_dict)
 
         body = json.loads(response.body)
 
@@ -209,6 +619,7 @@ class RackspaceDatabaseDriver(DatabaseDriver, OpenStackDriverMixin):
         raise LibcloudError('Unexpected status code: %s (url=%s, details=%s)' %
                             (response.status, value_dict['url'], details))
 
+    @_instrumented
     def _request(self, value_dict, method):
         key = None
 
@@ -224,30 +635,72 @@ class RackspaceDatabaseDriver(DatabaseDriver, OpenStackDriverMixin):
                 value_dict.get('object_mapper')
 
         response = self.connection.request(url,
-                method=method, data=data, params=params)
+                method=method, data=data, params=params,
+                ex_operation=value_dict.get('operation'))
 
         if response.status == httplib.NO_CONTENT or not expects_response:
             return []
         elif response.status == httplib.OK:
-            resp = json.loads(response.body)
-            l = None
+            return self._map_response(response, value_dict)
+
+        body = json.loads(response.body)
+
+        details = body['details'] if 'details' in body else ''
+        raise LibcloudError('Unexpected status code: %s (url=%s, details=%s)' %
+                            (response.status, value_dict['url'], details))
+
+    def _map_response(self, response, value_dict):
+        tracer = self.connection.tracer
+
+        # parse_body already decoded JSON bodies
+        resp = response.object
+        if isinstance(resp, basestring):
+            with start_span(tracer, 'json.loads', 'decode',
+                            bytes=len(response.body)):
+                resp = json.loads(response.body)
+        l = None
 
-            if 'namespace' in value_dict:
-                resp = resp[value_dict['namespace']]
+        if 'namespace' in value_dict:
+            resp = resp[value_dict['namespace']]
 
+        projection = value_dict.get('projection')
+        if projection == 'raw':
+            return resp
+
+        if 'list_item_mapper' in value_dict:
+            func = value_dict['list_item_mapper']
+        else:
+            func = value_dict['object_mapper']
+        if projection is not None:
+            func = self._projection_mapper(func, projection)
+
+        with start_span(tracer, value_dict.get('operation'), 'map') as span:
             if 'list_item_mapper' in value_dict:
-                func = value_dict['list_item_mapper']
-                l = [func(x, value_dict) for x in resp]
+                many = getattr(func, 'many', None)
+                if many is not None:
+                    l = many(resp, value_dict)
+                else:
+                    l = [func(x, value_dict) for x in resp]
+                span.set(objects=len(l))
             else:
-                l = value_dict['object_mapper'](resp, value_dict)
+                l = func(resp, value_dict)
+                span.set(objects=1)
 
-            return l
+        return l
 
-        body = json.loads(response.body)
+    def _projection_mapper(self, mapper, projection):
+        """
+        Return the mapper selecting C{projection} out of the objects
+        C{mapper} maps.
 
-        details = body['details'] if 'details' in body else ''
-        raise LibcloudError('Unexpected status code: %s (url=%s, details=%s)' %
-                            (response.status, value_dict['url'], details))
+        @type projection: C{tuple} or L{Projection}
+        @param projection: Field names, returned as plain tuples, or a
+                           L{Projection} returning its named rows.
+        """
+        if isinstance(projection, Projection):
+            return mapper.schema.project(projection.fields,
+                                         DECODED_STRING_TYPE, projection.row)
+        return mapper.schema.project(projection, DECODED_STRING_TYPE)
 
     def _post_request(self, value_dict):
         return self._request(value_dict, 'POST')
@@ -255,17 +708,39 @@ class RackspaceDatabaseDriver(DatabaseDriver, OpenStackDriverMixin):
     def _delete_request(self, value_dict):
         return self._request(value_dict, 'DELETE')
 
-    def __extract_flavor_ref(self, obj):
-        for link in obj['links']:
-            if link['rel'] == 'self':
-                return link['href']
-
-    def _to_database(self, obj, value_dict):
-        return Database(obj['name'],
-                character_set=obj.get('character_set', None),
-                collate=obj.get('collate', None))
+    _to_database = staticmethod(
+        DATABASE_SCHEMA.compile(DECODED_STRING_TYPE))
+
+    def _validate(self, kind, errors):
+        """
+        Raise the error the API would answer with when C{errors} is not
+        empty, unless the driver was created with C{ex_validate=False}.
+        """
+        if errors and self._ex_validate:
+            raise RackspaceDatabaseValidationError(
+                code=400, type='ValidationError',
+                message='Invalid %s: %s' % (kind, errors[0]),
+                details='; '.join(errors), driver=self)
+
+    def _partition(self, from_item, items):
+        """
+        Convert the items of a bulk call with C{from_item}, setting aside
+        the ones failing validation.
+
+        @return: C{(data, rejected)}, C{rejected} being a list of
+                 C{(item, RackspaceDatabaseValidationError)} pairs.
+        """
+        data = []
+        rejected = []
+        for item in items:
+            try:
+                data.append(from_item(item))
+            except RackspaceDatabaseValidationError:
+                rejected.append((item, sys.exc_info()[1]))
+        return data, rejected
 
     def _from_database(self, database):
+        self._validate('database', database_errors(database))
         d = dict()
         d['name'] = database.name
         if database.character_set:
@@ -274,26 +749,11 @@ class RackspaceDatabaseDriver(DatabaseDriver, OpenStackDriverMixin):
             d['collate'] = database.collate
         return d
 
-    def _to_instance(self, obj, value_dict):
-        status = InstanceStatus.__dict__[obj['status']]
-        flavorRef = self.__extract_flavor_ref(obj['flavor'])
-        rootEnabled = obj.get('rootEnabled')
-        if obj.get('databases'):
-            databases = [self._to_database(d, value_dict) for d
-                in obj.get('databases', [])]
-        else:
-            databases = None
-
-        if obj.get('volume') and obj['volume'].get('size'):
-            size = obj['volume']['size']
-        else:
-            size = None
-
-        return Instance(flavorRef, size=size, id=obj['id'],
-                name=obj['name'], status=status, rootEnabled=rootEnabled,
-                databases=databases)
+    _to_instance = staticmethod(
+        INSTANCE_SCHEMA.compile(DECODED_STRING_TYPE))
 
     def _from_instance(self, instance):
+        self._validate('instance', instance_errors(instance))
         d = {'flavorRef': instance.flavorRef,
             'volume': {'size': instance.size}
         }
@@ -308,29 +768,42 @@ class RackspaceDatabaseDriver(DatabaseDriver, OpenStackDriverMixin):
             d['rootEnabled'] = instance.rootEnabled
         return d
 
-    def _to_flavor(self, obj, value_dict):
-        href = self.__extract_flavor_ref(obj)
-        return Flavor(obj['id'], obj['name'],
-                obj['vcpus'], obj['ram'], href)
+    _to_flavor = staticmethod(
+        FLAVOR_SCHEMA.compile(DECODED_STRING_TYPE))
 
-    def _to_user(self, obj, value_dict):
-        return User(obj['name'], password=obj.get('password', None))
+    _to_user = staticmethod(
+        USER_SCHEMA.compile(DECODED_STRING_TYPE))
 
     def _from_user(self, user):
+        self._validate('user', user_errors(user))
         d = dict()
         d['name'] = user.name
         if user.password:
             d['password'] = user.password
         return d
 
-    def list_instances(self):
-        value_dict = {'url': '/instances/detail',
+    def list_instances(self, ex_projection=None):
+        """
+        List the instances.
+
+        @type ex_projection: C{str}, C{tuple} or L{Projection}
+        @param ex_projection: C{'raw'} to return the decoded dicts, a tuple
+                              of field names (e.g. C{('id', 'status')}) to
+                              return tuples, or a L{Projection} such as
+                              L{INSTANCE_SUMMARY} to return its rows.  The
+                              other list and get methods accept it too.
+        """
+        value_dict = {'operation': 'list_instances',
+                'projection': ex_projection,
+                'url': '/instances/detail',
                 'namespace': 'instances',
                 'list_item_mapper': self._to_instance}
         return self._get_request(value_dict)
 
-    def get_instance(self, instance_id):
-        value_dict = {'url': '/instances/%s' % instance_id,
+    def get_instance(self, instance_id, ex_projection=None):
+        value_dict = {'operation': 'get_instance',
+                'projection': ex_projection,
+                'url': '/instances/%s' % instance_id,
                 'namespace': 'instance',
                 'object_mapper': self._to_instance}
         return self._get_request(value_dict)
@@ -338,102 +811,141 @@ class RackspaceDatabaseDriver(DatabaseDriver, OpenStackDriverMixin):
     def create_instance(self, instance):
         data = self._from_instance(instance)
 
-        value_dict = {'url': '/instances',
+        value_dict = {'operation': 'create_instance',
+                'url': '/instances',
                 'namespace': 'instance',
                 'data': {'instance': data},
                 'object_mapper': self._to_instance}
         return self._post_request(value_dict)
 
     def delete_instance(self, instance_id):
-        value_dict = {'url': '/instances/%s' % instance_id}
+        value_dict = {'operation': 'delete_instance',
+                'url': '/instances/%s' % instance_id}
         return self._delete_request(value_dict)
 
     def restart_instance(self, instance_id):
         data = {'restart': {}}
-        value_dict = {'url': '/instances/%s/action' % instance_id,
+        value_dict = {'operation': 'restart_instance',
+                'url': '/instances/%s/action' % instance_id,
                 'data': data}
         return self._post_request(value_dict)
 
     def resize_instance_volume(self, instance_id, size):
         data = {'resize': {'volume': {'size': size}}}
-        value_dict = {'url': '/instances/%s/action' % instance_id,
+        value_dict = {'operation': 'resize_instance_volume',
+                'url': '/instances/%s/action' % instance_id,
                 'data': data}
         return self._post_request(value_dict)
 
     def resize_instance(self, instance_id, flavorRef):
         data = {'resize': {'flavorRef': flavorRef}}
-        value_dict = {'url': '/instances/%s/action' % instance_id,
+        value_dict = {'operation': 'resize_instance',
+                'url': '/instances/%s/action' % instance_id,
                 'data': data}
         return self._post_request(value_dict)
 
     def create_databases(self, instance_id, databases):
-        data = {'databases':
-                [self._from_database(x) for x in databases]}
-        value_dict = {'url': '/instances/%s/databases' % instance_id,
-                'data': data}
-        return self._post_request(value_dict)
+        """
+        Create databases on an instance.  Databases failing the
+        client-side validation are left out of the request.
+
+        @rtype: C{list}
+        @return: C{(database, RackspaceDatabaseValidationError)} pairs of
+                 the databases left out, empty when all were valid.
+        """
+        data, rejected = self._partition(self._from_database, databases)
+        if not data:
+            return rejected
+        value_dict = {'operation': 'create_databases',
+                'url': '/instances/%s/databases' % instance_id,
+                'data': {'databases': data}}
+        self._post_request(value_dict)
+        return rejected
 
     def create_database(self, instance_id, database):
-        return self.create_databases(instance_id, [database])
-
-    def list_databases(self, instance_id):
-        value_dict = {'url': '/instances/%s/databases' % instance_id,
+        rejected = self.create_databases(instance_id, [database])
+        if rejected:
+            raise rejected[0][1]
+        return rejected
+
+    def list_databases(self, instance_id, ex_projection=None):
+        value_dict = {'operation': 'list_databases',
+                'projection': ex_projection,
+                'url': '/instances/%s/databases' % instance_id,
                 'namespace': 'databases',
                 'list_item_mapper': self._to_database}
         return self._get_request(value_dict)
 
     def delete_database(self, instance_id, database_name):
-        value_dict = {'url': '/instances/%s/databases/%s' %
+        value_dict = {'operation': 'delete_database',
+                'url': '/instances/%s/databases/%s' %
                 (instance_id, database_name)}
         return self._delete_request(value_dict)
 
     def create_users(self, instance_id, user_databases_pairs):
+        """
+        Create users on an instance.  Users failing the client-side
+        validation, or granted an invalid database, are left out of the
+        request.
+
+        @rtype: C{list}
+        @return: C{((user, databases), RackspaceDatabaseValidationError)}
+                 pairs of the users left out, empty when all were valid.
+        """
         def _from_user_databases_pair((user, databases)):
-            data = {
-                'databases': [self._from_database(d) for d in databases],
-                'name': user.name
-            }
-            if user.password:
-                data['password'] = user.password
+            data = self._from_user(user)
+            data['databases'] = [self._from_database(d) for d in databases]
             return data
 
-        data = {'users':
-            [_from_user_databases_pair(p) for p in user_databases_pairs]
-        }
-
-        value_dict = {'url': '/instances/%s/users' % instance_id,
-                'data': data}
-
-        return self._post_request(value_dict)
+        data, rejected = self._partition(_from_user_databases_pair,
+                                         user_databases_pairs)
+        if not data:
+            return rejected
+        value_dict = {'operation': 'create_users',
+                'url': '/instances/%s/users' % instance_id,
+                'data': {'users': data}}
+        self._post_request(value_dict)
+        return rejected
 
     def create_user(self, instance_id, user, databases):
-        return self.create_users(instance_id, [(user, databases)])
+        rejected = self.create_users(instance_id, [(user, databases)])
+        if rejected:
+            raise rejected[0][1]
+        return rejected
 
     def delete_user(self, instance_id, user_name):
-        value_dict = {'url': '/instances/%s/users/%s/' %
+        value_dict = {'operation': 'delete_user',
+                'url': '/instances/%s/users/%s/' %
                 (instance_id, user_name)}
         return self._delete_request(value_dict)
 
-    def list_users(self, instance_id):
-        value_dict = {'url': '/instances/%s/users' % instance_id,
+    def list_users(self, instance_id, ex_projection=None):
+        value_dict = {'operation': 'list_users',
+                'projection': ex_projection,
+                'url': '/instances/%s/users' % instance_id,
                 'namespace': 'users',
                 'list_item_mapper': self._to_user}
         return self._get_request(value_dict)
 
-    def list_flavors(self):
-        value_dict = {'url': '/flavors/detail',
+    def list_flavors(self, ex_projection=None):
+        value_dict = {'operation': 'list_flavors',
+                'projection': ex_projection,
+                'url': '/flavors/detail',
                 'namespace': 'flavors',
                 'list_item_mapper': self._to_flavor}
         return self._get_request(value_dict)
 
-    def get_flavor(self, flavor_id):
-        value_dict = {'url': '/flavors/%s' % flavor_id,
+    def get_flavor(self, flavor_id, ex_projection=None):
+        value_dict = {'operation': 'get_flavor',
+                'projection': ex_projection,
+                'url': '/flavors/%s' % flavor_id,
                 'namespace': 'flavor',
                 'object_mapper': self._to_flavor}
         return self._get_request(value_dict)
 
     def enable_root(self, instance_id):
-        value_dict = {'url': '/instances/%s/root' % instance_id,
+        value_dict = {'operation': 'enable_root',
+                'url': '/instances/%s/root' % instance_id,
                 'namespace': 'user',
                 'object_mapper': self._to_user}
         return self._post_request(value_dict)
@@ -441,7 +953,8 @@ class RackspaceDatabaseDriver(DatabaseDriver, OpenStackDriverMixin):
     def has_root_enabled(self, instance_id):
         def id(x, value_dict):
             return x
-        value_dict = {'url': '/instances/%s/root' % instance_id,
+        value_dict = {'operation': 'has_root_enabled',
+                'url': '/instances/%s/root' % instance_id,
                 'namespace': 'rootEnabled',
                 'object_mapper': id}
         return self._get_request(value_dict)
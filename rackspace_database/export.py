@@ -0,0 +1,396 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Streaming export of the fleet inventory.
+
+L{FleetExporter} runs a L{FleetCrawler} with projections, so the listings
+are decoded straight into rows without building L{Instance}, L{Database}
+or L{User} objects, and writes one row per instance in chunks of
+C{chunk_size} rows.  Memory stays bounded by the chunk and by the
+instances the crawler has in progress, whatever the size of the fleet.
+
+The rows have the L{COLUMNS} columns and are written in one of the
+L{FORMATS}:
+
+    - C{jsonl}: one JSON object per line.
+    - C{csv}: a header line, then one line per row.  The database and
+      user names are joined with C{;} and the errors encoded as JSON.
+    - C{arrow}: an Arrow IPC stream, one record batch per chunk.
+    - C{parquet}: a Parquet file, one row group per chunk.
+
+The last two require the optional C{pyarrow} package.
+
+Example::
+
+    python -m rackspace_database.export --region ord --region dfw \\
+        --format parquet --output fleet.parquet
+"""
+
+import sys
+import csv
+
+from optparse import OptionParser
+from timeit import default_timer as timer
+
+try:
+    import simplejson as json
+except:
+    import json
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from rackspace_database.crawler import FleetCrawler
+
+__all__ = [
+    'COLUMNS',
+    'FORMATS',
+    'FleetExporter',
+    'ExportReport',
+    'JsonLinesWriter',
+    'CsvWriter',
+    'ArrowWriter',
+    'ParquetWriter',
+    'get_writer'
+]
+
+COLUMNS = ['host', 'id', 'name', 'status', 'flavorRef', 'size',
+           'databases', 'users', 'root_enabled', 'errors']
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+class JsonLinesWriter(object):
+    """
+    Writes the rows as JSON lines.
+    """
+
+    name = 'jsonl'
+
+    def __init__(self, fp):
+        self.fp = fp
+
+    def write(self, rows):
+        self.fp.write(''.join([json.dumps(row, sort_keys=True) + '\n'
+                               for row in rows]))
+
+    def close(self):
+        self.fp.flush()
+
+
+class CsvWriter(object):
+    """
+    Writes the rows as CSV with a header line.
+    """
+
+    name = 'csv'
+
+    def __init__(self, fp):
+        self.fp = fp
+        self._writer = csv.writer(fp)
+        self._writer.writerow(COLUMNS)
+
+    def _values(self, row):
+        values = []
+        for column in COLUMNS:
+            value = row.get(column)
+            if column in ('databases', 'users'):
+                value = value is not None and ';'.join(value) or None
+            elif column == 'errors':
+                value = value and json.dumps(value, sort_keys=True) or None
+            values.append(value is None and '' or _encode(value))
+        return values
+
+    def write(self, rows):
+        self._writer.writerows([self._values(row) for row in rows])
+
+    def close(self):
+        self.fp.flush()
+
+
+def _arrow_schema():
+    string = pyarrow.string()
+    return pyarrow.schema([
+        ('host', string),
+        ('id', string),
+        ('name', string),
+        ('status', string),
+        ('flavorRef', string),
+        ('size', pyarrow.int64()),
+        ('databases', pyarrow.list_(string)),
+        ('users', pyarrow.list_(string)),
+        ('root_enabled', pyarrow.bool_()),
+        ('errors', string)
+    ])
+
+
+class ArrowWriter(object):
+    """
+    Writes the rows as an Arrow IPC stream, one record batch per chunk.
+    """
+
+    name = 'arrow'
+
+    def __init__(self, fp):
+        if pyarrow is None:
+            raise RuntimeError('The %s format requires the pyarrow package' %
+                               (self.name))
+        self.fp = fp
+        self.schema = _arrow_schema()
+        self._writer = self._open()
+
+    def _open(self):
+        return pyarrow.RecordBatchStreamWriter(self.fp, self.schema)
+
+    def _batch(self, rows):
+        columns = []
+        for field in self.schema:
+            if field.name == 'errors':
+                values = [row.get('errors') and
+                          json.dumps(row['errors'], sort_keys=True) or None
+                          for row in rows]
+            else:
+                values = [row.get(field.name) for row in rows]
+            columns.append(pyarrow.array(values, type=field.type))
+        return pyarrow.RecordBatch.from_arrays(columns, schema=self.schema)
+
+    def write(self, rows):
+        self._writer.write_batch(self._batch(rows))
+
+    def close(self):
+        self._writer.close()
+
+
+class ParquetWriter(ArrowWriter):
+    """
+    Writes the rows as a Parquet file, one row group per chunk.
+    """
+
+    name = 'parquet'
+
+    def _open(self):
+        return pyarrow.parquet.ParquetWriter(self.fp, self.schema)
+
+    def write(self, rows):
+        self._writer.write_table(
+            pyarrow.Table.from_batches([self._batch(rows)]))
+
+
+FORMATS = {
+    'jsonl': JsonLinesWriter,
+    'csv': CsvWriter,
+    'arrow': ArrowWriter,
+    'parquet': ParquetWriter
+}
+
+
+def get_writer(format, fp):
+    """
+    Return the writer of C{format} (one of L{FORMATS}) writing to C{fp}.
+    """
+    if format not in FORMATS:
+        raise ValueError('Unknown export format %s, expected one of %s' %
+                         (format, ', '.join(sorted(FORMATS))))
+    return FORMATS[format](fp)
+
+
+class ExportReport(object):
+    """
+    Outcome of a L{FleetExporter} run.
+
+    @ivar rows: Number of rows written.
+    @ivar chunks: Number of chunks written.
+    @ivar errors: Number of sub-fetches which failed, see the C{errors}
+                  column.
+    @ivar calls: Number of API calls made for the sub-fetches.
+    """
+
+    def __init__(self, format):
+        self.format_name = format
+        self.rows = 0
+        self.chunks = 0
+        self.errors = 0
+        self.calls = 0
+        self.elapsed = None
+
+    @property
+    def rows_per_second(self):
+        if not self.elapsed:
+            return None
+        return self.rows / self.elapsed
+
+    def summary(self):
+        return {'format': self.format_name, 'rows': self.rows,
+                'chunks': self.chunks, 'errors': self.errors,
+                'calls': self.calls, 'elapsed': self.elapsed,
+                'rows_per_second': self.rows_per_second}
+
+    def format(self):
+        return ('format=%s rows=%d chunks=%d calls=%d errors=%d '
+                'elapsed=%.2fs rows/s=%.1f' %
+                (self.format_name, self.rows, self.chunks, self.calls,
+                 self.errors, self.elapsed or 0,
+                 self.rows_per_second or 0))
+
+
+class FleetExporter(object):
+    """
+    Exports the instances of a fleet with their databases, users and root
+    status.
+
+    @type drivers: C{list}
+    @param drivers: Drivers to export, typically one per region.
+
+    @type format: C{str}
+    @param format: One of L{FORMATS}.
+
+    @type chunk_size: C{int}
+    @param chunk_size: Number of rows buffered before a write.
+
+    @type progress: C{callable}
+    @param progress: Called with the L{ExportReport} after every chunk.
+
+    @param crawler_kwargs: L{FleetCrawler} parameters, e.g.
+                           C{concurrency} and C{per_host}.
+    """
+
+    def __init__(self, drivers, format='jsonl', chunk_size=1000,
+                 progress=None, **crawler_kwargs):
+        if format not in FORMATS:
+            raise ValueError('Unknown export format %s, expected one of %s' %
+                             (format, ', '.join(sorted(FORMATS))))
+        self.drivers = drivers
+        self.format = format
+        self.chunk_size = chunk_size
+        self.progress = progress
+        crawler_kwargs.setdefault('projections', True)
+        self.crawler_kwargs = crawler_kwargs
+
+    def export(self, fp):
+        """
+        Write the inventory to the file object C{fp}, binary for the Arrow
+        based formats.
+
+        @rtype: L{ExportReport}
+        """
+        report = ExportReport(self.format)
+        start = timer()
+        writer = get_writer(self.format, fp)
+        crawler = FleetCrawler(self.drivers, **self.crawler_kwargs)
+        chunk = []
+        try:
+            for record in crawler.crawl():
+                chunk.append(record)
+                if len(chunk) >= self.chunk_size:
+                    self._flush(writer, chunk, report, crawler, start)
+                    chunk = []
+            if chunk:
+                self._flush(writer, chunk, report, crawler, start)
+        finally:
+            writer.close()
+            report.calls = crawler.stats['calls']
+            report.errors = crawler.stats['errors']
+            report.elapsed = timer() - start
+        return report
+
+    def _flush(self, writer, chunk, report, crawler, start):
+        writer.write(chunk)
+        report.rows += len(chunk)
+        report.chunks += 1
+        report.calls = crawler.stats['calls']
+        report.errors = crawler.stats['errors']
+        report.elapsed = timer() - start
+        if self.progress is not None:
+            self.progress(report)
+
+
+def main(argv=None):
+    from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--user', default='user')
+    parser.add_option('--key', default='key')
+    parser.add_option('--auth-url', default=None)
+    parser.add_option('--auth-version', default=None)
+    parser.add_option('--region', action='append', dest='regions',
+                      default=[], help='region to export (repeatable)')
+    parser.add_option('--format', default='jsonl',
+                      help='one of %s (default: jsonl)' %
+                           (', '.join(sorted(FORMATS))))
+    parser.add_option('--chunk-size', type='int', default=1000)
+    parser.add_option('--concurrency', type='int', default=16)
+    parser.add_option('--per-host', type='int', default=8)
+    parser.add_option('--standin', type='int', default=None, metavar='N',
+                      help='export a local stand-in server seeded with N '
+                           'instances')
+    parser.add_option('--output', default=None,
+                      help='write the export to this file instead of '
+                           'stdout')
+    parser.add_option('--progress', action='store_true', default=False,
+                      help='report the rows per second after every chunk')
+    options, args = parser.parse_args(argv)
+
+    server = None
+    if options.standin is not None:
+        from rackspace_database.standin import StandInServer
+
+        server = StandInServer().start()
+        for i in range(options.standin):
+            server.add_instance('export_%06d' % (i), databases=['db'],
+                                users=['user'])
+        options.auth_url = server.auth_url
+        options.auth_version = '1.1'
+
+    kwargs = {}
+    if options.auth_url:
+        kwargs['ex_force_auth_url'] = options.auth_url
+    if options.auth_version:
+        kwargs['ex_force_auth_version'] = options.auth_version
+
+    progress = None
+    if options.progress:
+        progress = lambda report: sys.stderr.write(report.format() + '\n')
+
+    fp = options.output and open(options.output, 'wb') or sys.stdout
+    try:
+        drivers = [RackspaceDatabaseDriver(options.user, options.key,
+                                           ex_force_region=region, **kwargs)
+                   for region in options.regions or [None]]
+        exporter = FleetExporter(drivers, format=options.format,
+                                 chunk_size=options.chunk_size,
+                                 progress=progress,
+                                 concurrency=options.concurrency,
+                                 per_host=options.per_host)
+        report = exporter.export(fp)
+    finally:
+        if fp is not sys.stdout:
+            fp.close()
+        if server is not None:
+            server.stop()
+
+    sys.stderr.write(report.format() + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
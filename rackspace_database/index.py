@@ -0,0 +1,337 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+In-memory index over a listing of instances.
+
+L{InstanceIndex} keeps hash indexes on the status and the flavor, and
+sorted indexes on the volume size and on the name, so that repeated
+queries over the same listing do not scan it::
+
+    index = InstanceIndex(driver.list_instances())
+    index.query(status=InstanceStatus.ACTIVE, name_prefix='web-',
+                min_size=10, order_by='-size')
+    index.group_by('flavor')
+
+    # Later on, only the instances which changed are re-indexed
+    index.refresh(driver.list_instances())
+
+A query starts from the most selective of its conditions and checks the
+others on the resulting candidates only.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+
+__all__ = [
+    'InstanceIndex'
+]
+
+# Sorts after any name
+_NAME_END = u'\U0010ffff'
+
+
+def _remove_sorted(items, item):
+    position = bisect_left(items, item)
+    if position < len(items) and items[position] == item:
+        del items[position]
+
+
+def _fingerprint(instance):
+    return (instance.name, instance.status, instance.flavorRef,
+            instance.size)
+
+
+class InstanceIndex(object):
+    """
+    Indexes of a set of instances by id, status, flavor, size and name.
+    """
+
+    def __init__(self, instances=()):
+        self._instances = {}
+        self._fingerprints = {}
+        self._by_status = {}
+        self._by_flavor = {}
+        # Sorted (size, id) and (name, id) pairs
+        self._sizes = []
+        self._names = []
+        for instance in instances:
+            self.add(instance)
+
+    def __len__(self):
+        return len(self._instances)
+
+    def __contains__(self, instance_id):
+        return instance_id in self._instances
+
+    def __iter__(self):
+        return iter(self._instances.values())
+
+    def get(self, instance_id):
+        return self._instances.get(instance_id)
+
+    def add(self, instance):
+        """
+        Index an instance, replacing the previous version of it.
+        """
+        if instance.id in self._instances:
+            self.remove(instance.id)
+        instance_id = instance.id
+        self._instances[instance_id] = instance
+        self._fingerprints[instance_id] = _fingerprint(instance)
+        self._by_status.setdefault(instance.status, set()).add(instance_id)
+        self._by_flavor.setdefault(instance.flavorRef,
+                                   set()).add(instance_id)
+        if instance.size is not None:
+            insort(self._sizes, (instance.size, instance_id))
+        insort(self._names, (instance.name or u'', instance_id))
+
+    update = add
+
+    def remove(self, instance_id):
+        """
+        Drop an instance from the indexes, returning it or C{None}.
+        """
+        instance = self._instances.pop(instance_id, None)
+        if instance is None:
+            return None
+        name, status, flavor, size = self._fingerprints.pop(instance_id)
+        for table, key in ((self._by_status, status),
+                           (self._by_flavor, flavor)):
+            ids = table[key]
+            ids.discard(instance_id)
+            if not ids:
+                del table[key]
+        if size is not None:
+            _remove_sorted(self._sizes, (size, instance_id))
+        _remove_sorted(self._names, (name or u'', instance_id))
+        return instance
+
+    def refresh(self, instances):
+        """
+        Bring the index in line with a new listing: instances which
+        changed are re-indexed, new ones added and missing ones removed.
+
+        @rtype: C{tuple}
+        @return: C{(added, changed, removed)} counts.
+        """
+        added = changed = 0
+        seen = set()
+        for instance in instances:
+            seen.add(instance.id)
+            previous = self._fingerprints.get(instance.id)
+            if previous is None:
+                added += 1
+            elif previous != _fingerprint(instance):
+                changed += 1
+            else:
+                # Same indexed fields, only swap the object
+                self._instances[instance.id] = instance
+                continue
+            self.add(instance)
+        removed = [i for i in self._instances if i not in seen]
+        for instance_id in removed:
+            self.remove(instance_id)
+        return added, changed, len(removed)
+
+    def _size_range(self, min_size, max_size):
+        if min_size is None:
+            low = 0
+        else:
+            low = bisect_left(self._sizes, (min_size,))
+        if max_size is None:
+            high = len(self._sizes)
+        else:
+            # Every (max_size, id) pair sorts before (max_size, _NAME_END)
+            high = bisect_right(self._sizes, (max_size, _NAME_END))
+        return self._sizes[low:high]
+
+    def _name_range(self, prefix):
+        low = bisect_left(self._names, (prefix,))
+        high = bisect_left(self._names, (prefix + _NAME_END,))
+        return self._names[low:high]
+
+    def _candidates(self, status, flavor, name_prefix, min_size, max_size):
+        """
+        Return the set of ids matching all the conditions, C{None} when
+        there are none.
+        """
+        # Id sets of the hash conditions, (pairs, predicate) of the range
+        # conditions
+        sets = []
+        for table, values in ((self._by_status, status),
+                              (self._by_flavor, flavor)):
+            if values is None:
+                continue
+            if not isinstance(values, (list, tuple, set, frozenset)):
+                values = [values]
+            ids = set()
+            for value in values:
+                ids.update(table.get(value, ()))
+            sets.append(ids)
+
+        ranges = []
+        if min_size is not None or max_size is not None:
+            ranges.append((self._size_range(min_size, max_size),
+                           lambda instance: instance.size is not None and
+                           (min_size is None or instance.size >= min_size) and
+                           (max_size is None or instance.size <= max_size)))
+        if name_prefix:
+            ranges.append((self._name_range(name_prefix),
+                           lambda instance: (instance.name or u'').startswith(
+                               name_prefix)))
+
+        if not sets and not ranges:
+            return None
+
+        # Start from the most selective condition
+        sets.sort(key=len)
+        ranges.sort(key=lambda item: len(item[0]))
+        if sets and (not ranges or len(sets[0]) <= len(ranges[0][0])):
+            result = sets.pop(0)
+        else:
+            result = set([i for _, i in ranges.pop(0)[0]])
+
+        for ids in sets:
+            result = result & ids
+        # The remaining ranges are larger than the candidates, checking
+        # the candidates is cheaper than materializing them
+        for pairs, predicate in ranges:
+            instances = self._instances
+            result = set([i for i in result if predicate(instances[i])])
+        return result
+
+    def query(self, status=None, flavor=None, name_prefix=None,
+              min_size=None, max_size=None, order_by=None, limit=None):
+        """
+        Return the instances matching all the given conditions.
+
+        @param status: L{InstanceStatus} value or list of values.
+
+        @param flavor: C{flavorRef} or list of C{flavorRef}s.
+
+        @type name_prefix: C{str}
+        @param name_prefix: Prefix of the instance names.
+
+        @type min_size: C{int}
+        @param min_size: Smallest volume size, inclusive.
+
+        @type max_size: C{int}
+        @param max_size: Largest volume size, inclusive.
+
+        @type order_by: C{str}
+        @param order_by: C{size} or C{name}, prefixed with C{-} for the
+                         descending order.  Instances without a size come
+                         last when ordering by size.  Without it the order
+                         is unspecified.
+
+        @type limit: C{int}
+        @param limit: Maximum number of instances returned.
+
+        @rtype: C{list}
+        """
+        ids = self._candidates(status, flavor, name_prefix, min_size,
+                               max_size)
+        instances = self._instances
+        if order_by is None:
+            if ids is None:
+                result = list(instances.values())
+            else:
+                result = [instances[i] for i in ids]
+            if limit is None:
+                return result
+            return result[:limit]
+
+        field = order_by.lstrip('-')
+        reverse = order_by.startswith('-')
+        if field not in ('size', 'name'):
+            raise ValueError('Cannot order by %s, expected size or name' %
+                             (field))
+        if field == 'size':
+            pairs = self._sizes
+        else:
+            pairs = self._names
+
+        if ids is not None and len(ids) * 4 < len(pairs):
+            # Few candidates, sorting them beats walking the whole index
+            if field == 'size':
+                key = lambda i: (instances[i].size is None,
+                                 instances[i].size, i)
+            else:
+                key = lambda i: (instances[i].name or u'', i)
+            ordered = sorted(ids, key=key)
+            if reverse:
+                sized = [i for i in ordered if field != 'size' or
+                         instances[i].size is not None]
+                ordered = sized[::-1] + ordered[len(sized):]
+            result = [instances[i] for i in ordered[:limit]]
+            return result
+
+        walk = pairs
+        if reverse:
+            walk = reversed(pairs)
+        result = []
+        for _, instance_id in walk:
+            if ids is None or instance_id in ids:
+                result.append(instances[instance_id])
+                if limit is not None and len(result) >= limit:
+                    return result
+        if field == 'size':
+            if ids is None:
+                ids = instances
+            unsized = [i for i in ids if instances[i].size is None]
+            result.extend([instances[i] for i in sorted(unsized)])
+        if limit is None:
+            return result
+        return result[:limit]
+
+    def count(self, **conditions):
+        """
+        Return the number of instances matching the L{query} conditions.
+        """
+        ids = self._candidates(conditions.get('status'),
+                               conditions.get('flavor'),
+                               conditions.get('name_prefix'),
+                               conditions.get('min_size'),
+                               conditions.get('max_size'))
+        if ids is None:
+            return len(self._instances)
+        return len(ids)
+
+    def group_by(self, field, **conditions):
+        """
+        Group the instances matching the L{query} conditions.
+
+        @type field: C{str}
+        @param field: C{status} or C{flavor}.
+
+        @rtype: C{dict}
+        @return: C{value -> list of instances}.
+        """
+        tables = {'status': self._by_status, 'flavor': self._by_flavor}
+        if field not in tables:
+            raise ValueError('Cannot group by %s, expected status or flavor'
+                             % (field))
+        ids = self._candidates(conditions.get('status'),
+                               conditions.get('flavor'),
+                               conditions.get('name_prefix'),
+                               conditions.get('min_size'),
+                               conditions.get('max_size'))
+        groups = {}
+        for value, members in tables[field].items():
+            if ids is not None:
+                members = members & ids
+            if members:
+                groups[value] = [self._instances[i] for i in members]
+        return groups
@@ -0,0 +1,452 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Load generator driving L{RackspaceDatabaseDriver} with a weighted mix of
+operations.
+
+Every worker owns its own driver (libcloud connections are not thread-safe)
+and picks operations according to the mix.  Two modes are supported:
+
+    - C{closed}: every worker issues its next request as soon as the
+      previous one completed.  With C{rate} set, each worker follows its
+      own schedule of C{rate / workers} requests per second.
+    - C{open}: requests are scheduled at a fixed C{rate} regardless of how
+      fast they complete, C{workers} bounds the number in flight.
+
+Whenever a schedule exists latencies are measured from the intended start
+time rather than the actual one, which corrects for coordinated omission:
+a stalled request also delays (and is charged to) the requests queued
+behind it.
+
+Example::
+
+    python -m rackspace_database.loadgen --standin 100 --workers 8 \\
+        --duration 30 --rate 200 --mode open \\
+        --mix get_instance=70,list_databases=20,create_database=5,\\
+delete_database=5
+"""
+
+import sys
+import math
+import time
+import random
+import bisect
+import threading
+
+from collections import deque
+from optparse import OptionParser
+from timeit import default_timer as timer
+
+try:
+    import simplejson as json
+except:
+    import json
+
+__all__ = [
+    'OPERATIONS',
+    'LoadGenerator',
+    'LoadReport',
+    'parse_mix',
+    'percentile'
+]
+
+PERCENTILES = [50, 95, 99, 99.9]
+
+
+class _Context(object):
+    """
+    State shared by the workers of a run.
+    """
+
+    def __init__(self, instance_ids):
+        self.instance_ids = list(instance_ids)
+        self.created_databases = deque()
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def instance_id(self):
+        return random.choice(self.instance_ids)
+
+    def unique_name(self, prefix):
+        self._lock.acquire()
+        try:
+            self._counter += 1
+            return '%s_%d_%d' % (prefix, int(time.time()), self._counter)
+        finally:
+            self._lock.release()
+
+
+def _create_database(driver, context):
+    from rackspace_database.base import Database
+
+    instance_id = context.instance_id()
+    name = context.unique_name('loadgen')
+    driver.create_database(instance_id, Database(name))
+    context.created_databases.append((instance_id, name))
+
+
+def _delete_database(driver, context):
+    try:
+        instance_id, name = context.created_databases.popleft()
+    except IndexError:
+        return _create_database(driver, context)
+    driver.delete_database(instance_id, name)
+
+
+OPERATIONS = {
+    'list_instances': lambda d, c: d.list_instances(),
+    'get_instance': lambda d, c: d.get_instance(c.instance_id()),
+    'list_databases': lambda d, c: d.list_databases(c.instance_id()),
+    'list_users': lambda d, c: d.list_users(c.instance_id()),
+    'has_root_enabled': lambda d, c: d.has_root_enabled(c.instance_id()),
+    'list_flavors': lambda d, c: d.list_flavors(),
+    'create_database': _create_database,
+    'delete_database': _delete_database,
+}
+
+
+def parse_mix(spec):
+    """
+    Parse an operation mix such as C{get_instance=70,list_databases=30}.
+
+    @rtype: C{list}
+    @return: C{(name, weight)} tuples.
+    """
+    mix = []
+    for item in spec.split(','):
+        name, weight = item.split('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError('Unknown operation: %s' % (name))
+        mix.append((name, float(weight)))
+    return mix
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of the sorted list C{values}.
+    """
+    if not values:
+        return None
+    rank = int(math.ceil(round(pct * len(values) / 100.0, 9))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+class _Chooser(object):
+    def __init__(self, mix):
+        self.names = []
+        self.cumulative = []
+        total = 0
+        for name, weight in mix:
+            total += weight
+            self.names.append(name)
+            self.cumulative.append(total)
+        self.total = total
+
+    def choose(self):
+        return self.names[bisect.bisect_right(self.cumulative,
+                                              random.random() * self.total)]
+
+
+class LoadReport(object):
+    """
+    Latencies collected during a run.
+
+    C{latencies} are measured from the intended start time (coordinated
+    omission corrected) while C{service_times} are measured from the actual
+    start of the request.
+    """
+
+    def __init__(self, mode, workers, rate):
+        self.mode = mode
+        self.workers = workers
+        self.rate = rate
+        self.latencies = {}
+        self.service_times = {}
+        self.errors = {}
+        self.elapsed = None
+        self._lock = threading.Lock()
+
+    def record(self, name, latency, service_time, error=None):
+        self._lock.acquire()
+        try:
+            if error is None:
+                self.latencies.setdefault(name, []).append(latency)
+                self.service_times.setdefault(name, []).append(service_time)
+            else:
+                errors = self.errors.setdefault(name, {})
+                errors[error] = errors.get(error, 0) + 1
+        finally:
+            self._lock.release()
+
+    def summary(self):
+        operations = {}
+        for name in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies.get(name, []))
+            service = sorted(self.service_times.get(name, []))
+            errors = sum(self.errors.get(name, {}).values())
+            operations[name] = {
+                'count': len(latencies),
+                'errors': errors,
+                'error_types': self.errors.get(name, {}),
+                'throughput': len(latencies) / self.elapsed,
+                'latency': dict([('p%s' % (p), percentile(latencies, p))
+                                 for p in PERCENTILES] +
+                                [('max',
+                                  latencies[-1] if latencies else None)]),
+                'service_time': dict([('p%s' % (p), percentile(service, p))
+                                      for p in PERCENTILES])}
+
+        total = sum([o['count'] for o in operations.values()])
+        return {'mode': self.mode, 'workers': self.workers,
+                'rate': self.rate, 'elapsed': self.elapsed,
+                'requests': total, 'throughput': total / self.elapsed,
+                'operations': operations}
+
+    def format(self):
+        summary = self.summary()
+        lines = ['mode=%s workers=%d rate=%s elapsed=%.2fs requests=%d '
+                 'throughput=%.1f/s' % (summary['mode'], summary['workers'],
+                                        summary['rate'] or 'max',
+                                        summary['elapsed'],
+                                        summary['requests'],
+                                        summary['throughput']),
+                 '%-18s %8s %7s %9s %10s %10s %10s %10s %10s' %
+                 ('operation', 'count', 'errors', 'ops/s', 'p50', 'p95',
+                  'p99', 'p99.9', 'max')]
+        for name, op in sorted(summary['operations'].items()):
+            latency = op['latency']
+            cells = [latency[key] for key in ['p50', 'p95', 'p99', 'p99.9',
+                                              'max']]
+            lines.append('%-18s %8d %7d %9.1f %s' % (
+                name, op['count'], op['errors'], op['throughput'],
+                ' '.join(['%9.2fms' % (c * 1000) if c is not None
+                          else '%11s' % ('-') for c in cells])))
+        return '\n'.join(lines)
+
+
+class LoadGenerator(object):
+    """
+    @param driver_factory: Callable returning a new driver, called once
+                           per worker.
+    @param mix: C{(name, weight)} tuples, see L{parse_mix}.
+    @param duration: Run for this many seconds.
+    @param requests: Stop after this many requests (whichever of
+                     C{duration} and C{requests} comes first).
+    @param rate: Target requests per second over all the workers.
+    @param mode: C{closed} or C{open}.
+    @param instance_ids: Instances to target, listed from the first driver
+                         when not given.
+    """
+
+    def __init__(self, driver_factory, mix, workers=4, duration=None,
+                 requests=None, rate=None, mode='closed', instance_ids=None):
+        if duration is None and requests is None:
+            raise ValueError('Either duration or requests is required')
+        if mode not in ('closed', 'open'):
+            raise ValueError('Unknown mode: %s' % (mode))
+        if mode == 'open' and not rate:
+            raise ValueError('The open-loop mode requires a rate')
+
+        self.driver_factory = driver_factory
+        self.chooser = _Chooser(mix)
+        self.workers = workers
+        self.duration = duration
+        self.requests = requests
+        self.rate = rate
+        self.mode = mode
+        self.instance_ids = instance_ids
+        self._slot = 0
+        self._slot_lock = threading.Lock()
+
+    def _next_slot(self):
+        self._slot_lock.acquire()
+        try:
+            slot = self._slot
+            self._slot += 1
+            return slot
+        finally:
+            self._slot_lock.release()
+
+    def run(self):
+        drivers = [self.driver_factory() for _ in range(self.workers)]
+        instance_ids = self.instance_ids
+        if not instance_ids:
+            instance_ids = [i.id for i in drivers[0].list_instances()]
+        if not instance_ids:
+            raise ValueError('No instances to run against')
+
+        context = _Context(instance_ids)
+        report = LoadReport(self.mode, self.workers, self.rate)
+        start = timer()
+        deadline = self.duration is not None and start + self.duration \
+            or None
+
+        threads = [threading.Thread(target=self._worker,
+                                    args=(index, driver, context, report,
+                                          start, deadline))
+                   for index, driver in enumerate(drivers)]
+        for thread in threads:
+            thread.setDaemon(True)
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        report.elapsed = timer() - start
+        return report
+
+    def _intended_start(self, index, count, start):
+        if self.mode == 'open':
+            slot = self._next_slot()
+            if self.requests is not None and slot >= self.requests:
+                return False
+            return start + slot / float(self.rate)
+
+        if self.requests is not None and self._next_slot() >= self.requests:
+            return False
+        if self.rate:
+            interval = self.workers / float(self.rate)
+            # Stagger the workers across the first interval
+            return start + (count + index / float(self.workers)) * interval
+        return None
+
+    def _worker(self, index, driver, context, report, start, deadline):
+        count = 0
+        while True:
+            intended = self._intended_start(index, count, start)
+            if intended is False:
+                return
+            count += 1
+
+            now = timer()
+            if intended is not None and intended > now:
+                if deadline is not None and intended >= deadline:
+                    return
+                time.sleep(intended - now)
+            elif deadline is not None and now >= deadline:
+                return
+
+            name = self.chooser.choose()
+            began = timer()
+            error = None
+            try:
+                OPERATIONS[name](driver, context)
+            except Exception:
+                error = sys.exc_info()[0].__name__
+            end = timer()
+
+            report.record(name, end - (intended or began), end - began,
+                          error)
+
+
+def _driver_factory(options):
+    from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+
+    kwargs = {}
+    if options.auth_url:
+        kwargs['ex_force_auth_url'] = options.auth_url
+    if options.auth_version:
+        kwargs['ex_force_auth_version'] = options.auth_version
+    if options.region:
+        kwargs['ex_force_region'] = options.region
+
+    shared = {}
+
+    def factory():
+        if not shared:
+            driver = RackspaceDatabaseDriver(options.user, options.key,
+                                             **kwargs)
+            driver.connection._populate_hosts_and_request_paths()
+            shared['token'] = driver.connection.auth_token
+            shared['base_url'] = driver.connection.get_endpoint()
+            return driver
+
+        # Reuse the token of the first worker instead of authenticating
+        # once per worker
+        return RackspaceDatabaseDriver(options.user, options.key,
+                                       ex_force_auth_token=shared['token'],
+                                       ex_force_base_url=shared['base_url'],
+                                       **kwargs)
+    return factory
+
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--user', default='user')
+    parser.add_option('--key', default='key')
+    parser.add_option('--auth-url', default=None)
+    parser.add_option('--auth-version', default=None)
+    parser.add_option('--region', default=None)
+    parser.add_option('--standin', type='int', default=None, metavar='N',
+                      help='run against a local stand-in server seeded '
+                           'with N instances')
+    parser.add_option('--standin-latency', default=None,
+                      help='latency distribution of the stand-in server')
+    parser.add_option('--mix', default='get_instance=70,list_databases=20,'
+                                       'create_database=5,delete_database=5')
+    parser.add_option('--workers', type='int', default=4)
+    parser.add_option('--duration', type='float', default=None)
+    parser.add_option('--requests', type='int', default=None)
+    parser.add_option('--rate', type='float', default=None,
+                      help='target requests per second')
+    parser.add_option('--mode', choices=['closed', 'open'], default='closed')
+    parser.add_option('--instance', action='append', dest='instances',
+                      default=[], help='instance id to target (repeatable)')
+    parser.add_option('--json', default=None,
+                      help='write the JSON summary to this file')
+    options, args = parser.parse_args(argv)
+
+    if options.duration is None and options.requests is None:
+        options.duration = 10
+
+    server = None
+    if options.standin is not None:
+        from rackspace_database.standin import StandInServer
+        from rackspace_database.standin import parse_distribution
+
+        latency = options.standin_latency and \
+            parse_distribution(options.standin_latency) or None
+        server = StandInServer(latency=latency).start()
+        for i in range(options.standin):
+            server.add_instance('loadgen_%06d' % (i))
+        options.auth_url = server.auth_url
+        options.auth_version = '1.1'
+
+    try:
+        generator = LoadGenerator(_driver_factory(options),
+                                  parse_mix(options.mix),
+                                  workers=options.workers,
+                                  duration=options.duration,
+                                  requests=options.requests,
+                                  rate=options.rate, mode=options.mode,
+                                  instance_ids=options.instances)
+        report = generator.run()
+    finally:
+        if server is not None:
+            server.stop()
+
+    sys.stdout.write(report.format() + '\n')
+    if options.json:
+        fp = open(options.json, 'w')
+        try:
+            json.dump(report.summary(), fp, indent=2)
+        finally:
+            fp.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,283 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Low overhead request metrics for the database drivers.
+
+A L{MetricsRegistry} keeps one series per (kind, operation, status) triple.
+Each series holds a latency histogram with fixed log-scale buckets plus
+request/response byte counters and an error counter.  Recording is a dict
+lookup, a bisect and a handful of integer additions under a lock, which is
+cheap enough to leave enabled in production.
+"""
+
+import bisect
+import threading
+
+__all__ = [
+    'DEFAULT_BUCKETS',
+    'Histogram',
+    'MetricsRegistry',
+    'ByteCounters',
+    'render_prometheus'
+]
+
+# 1ms, 2ms, 4ms, ... ~32.8s
+DEFAULT_BUCKETS = tuple([0.001 * (2 ** i) for i in range(16)])
+
+
+class Histogram(object):
+    """
+    Fixed bucket histogram.
+
+    C{counts[i]} holds the number of observations which are less than or
+    equal to C{bounds[i]} and greater than C{bounds[i - 1]}.  The last slot
+    counts everything above the largest bound (+Inf).
+    """
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class _Series(object):
+    def __init__(self, bounds):
+        self.histogram = Histogram(bounds)
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.errors = 0
+
+
+class MetricsRegistry(object):
+    """
+    Thread-safe container for driver request metrics.
+
+    Series kinds recorded by the Rackspace driver:
+
+        - C{http}: a single HTTP exchange in
+          L{RackspaceDatabaseConnection.request}
+        - C{call}: a whole driver call, including response mapping
+        - C{auth}: the authentication round trip
+        - C{circuit}: a circuit breaker state change, labelled with the
+          endpoint and the new state
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, kind, operation, status, duration, request_bytes=0,
+                response_bytes=0, error=False):
+        """
+        Record a single observation.
+
+        @type kind: C{str}
+        @param kind: Series kind (C{http}, C{call}, C{auth}, C{circuit}).
+
+        @type operation: C{str}
+        @param operation: Operation name, e.g. C{list_instances}.
+
+        @param status: HTTP status code or a short status string.
+
+        @type duration: C{float}
+        @param duration: Latency in seconds.
+        """
+        key = (kind, operation, str(status))
+        self._lock.acquire()
+        try:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(self.buckets)
+            series.histogram.observe(duration)
+            series.request_bytes += request_bytes
+            series.response_bytes += response_bytes
+            if error:
+                series.errors += 1
+        finally:
+            self._lock.release()
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self._series = {}
+        finally:
+            self._lock.release()
+
+    def snapshot(self):
+        """
+        Return a consistent copy of all the recorded series.
+
+        @rtype: C{dict}
+        @return: C{{'buckets': [...], 'series': [{...}, ...]}} where each
+                 series has C{kind}, C{operation}, C{status}, C{count},
+                 C{sum}, C{buckets} (non-cumulative counts, the last one
+                 being +Inf), C{request_bytes}, C{response_bytes} and
+                 C{errors}.
+        """
+        self._lock.acquire()
+        try:
+            items = [(key, s.histogram.count, s.histogram.sum,
+                      list(s.histogram.counts), s.request_bytes,
+                      s.response_bytes, s.errors)
+                     for key, s in self._series.items()]
+        finally:
+            self._lock.release()
+
+        series = []
+        for (kind, operation, status), count, total, counts, req_bytes,\
+                resp_bytes, errors in sorted(items):
+            series.append({'kind': kind, 'operation': operation,
+                           'status': status, 'count': count, 'sum': total,
+                           'buckets': counts, 'request_bytes': req_bytes,
+                           'response_bytes': resp_bytes, 'errors': errors})
+
+        return {'buckets': list(self.buckets), 'series': series}
+
+
+class ByteCounters(object):
+    """
+    Thread-safe counters of the response bytes read off the wire and the
+    bytes they decoded to, per content encoding.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def record(self, encoding, wire_bytes, body_bytes):
+        """
+        Record one response.
+
+        @type encoding: C{str}
+        @param encoding: Content encoding, C{None} for an uncompressed body.
+        """
+        encoding = encoding or 'identity'
+        self._lock.acquire()
+        try:
+            counters = self._counters.get(encoding)
+            if counters is None:
+                counters = self._counters[encoding] = [0, 0, 0]
+            counters[0] += 1
+            counters[1] += wire_bytes
+            counters[2] += body_bytes
+        finally:
+            self._lock.release()
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self._counters = {}
+        finally:
+            self._lock.release()
+
+    def snapshot(self):
+        """
+        @rtype: C{dict}
+        @return: C{{'encodings': {encoding: {'responses', 'wire_bytes',
+                 'body_bytes'}}, 'wire_bytes', 'body_bytes',
+                 'saved_bytes'}}, C{saved_bytes} being what compression
+                 kept off the wire.
+        """
+        self._lock.acquire()
+        try:
+            items = [(encoding, list(counters))
+                     for encoding, counters in self._counters.items()]
+        finally:
+            self._lock.release()
+
+        encodings = {}
+        wire_total = body_total = 0
+        for encoding, (responses, wire_bytes, body_bytes) in items:
+            encodings[encoding] = {'responses': responses,
+                                   'wire_bytes': wire_bytes,
+                                   'body_bytes': body_bytes}
+            wire_total += wire_bytes
+            body_total += body_bytes
+
+        return {'encodings': encodings, 'wire_bytes': wire_total,
+                'body_bytes': body_total,
+                'saved_bytes': body_total - wire_total}
+
+
+def _format_labels(labels):
+    return ','.join(['%s="%s"' % (name, str(value).replace('\\', '\\\\')
+                                               .replace('"', '\\"'))
+                     for name, value in labels])
+
+
+def _format_float(value):
+    return repr(float(value))
+
+
+def render_prometheus(snapshot, prefix='rackspace_database'):
+    """
+    Render a L{MetricsRegistry.snapshot} using the Prometheus text
+    exposition format (version 0.0.4).
+
+    @rtype: C{str}
+    """
+    bounds = snapshot['buckets']
+    by_kind = {}
+    for series in snapshot['series']:
+        by_kind.setdefault(series['kind'], []).append(series)
+
+    lines = []
+    for kind in sorted(by_kind):
+        name = '%s_%s' % (prefix, kind)
+        items = by_kind[kind]
+
+        lines.append('# HELP %s_duration_seconds Latency of %s requests.' %
+                     (name, kind))
+        lines.append('# TYPE %s_duration_seconds histogram' % (name))
+        for s in items:
+            labels = [('operation', s['operation']), ('status', s['status'])]
+            cumulative = 0
+            for bound, count in zip(bounds, s['buckets']):
+                cumulative += count
+                lines.append('%s_duration_seconds_bucket{%s} %d' %
+                    (name, _format_labels(labels + [('le', repr(bound))]),
+                     cumulative))
+            lines.append('%s_duration_seconds_bucket{%s} %d' %
+                (name, _format_labels(labels + [('le', '+Inf')]),
+                 s['count']))
+            lines.append('%s_duration_seconds_sum{%s} %s' %
+                (name, _format_labels(labels), _format_float(s['sum'])))
+            lines.append('%s_duration_seconds_count{%s} %d' %
+                (name, _format_labels(labels), s['count']))
+
+        for counter, field, help in [
+                ('errors_total', 'errors', 'Failed %s requests.'),
+                ('request_bytes_total', 'request_bytes',
+                 'Bytes sent in %s request bodies.'),
+                ('response_bytes_total', 'response_bytes',
+                 'Bytes received in %s response bodies.')]:
+            lines.append('# HELP %s_%s %s' % (name, counter, help % (kind)))
+            lines.append('# TYPE %s_%s counter' % (name, counter))
+            for s in items:
+                labels = [('operation', s['operation']),
+                          ('status', s['status'])]
+                lines.append('%s_%s{%s} %d' % (name, counter,
+                                               _format_labels(labels),
+                                               s[field]))
+
+    return '\n'.join(lines) + '\n'
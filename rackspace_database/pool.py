@@ -0,0 +1,210 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Pool of drivers shared by the requests of many tenants.
+
+L{DriverPool.get} returns the driver of a C{(user, auth URL, region)}
+tenant, creating it on first use, so the authentication token and the
+service catalog of a tenant are reused across requests.  All the drivers
+of a pool send their requests through one L{PooledTransport}, which caps
+the number of connections open to the API across every tenant.
+
+Drivers unused for C{idle_timeout} seconds are dropped, and once the pool
+holds C{max_drivers} the least recently used one makes room for the new
+one.
+
+Example::
+
+    pool = DriverPool(max_drivers=500, idle_timeout=600,
+                      max_connections=50)
+    driver = pool.get(account.user, account.api_key, region='dfw')
+    instances = driver.list_instances()
+"""
+
+import hashlib
+import threading
+
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+from rackspace_database.transports import PooledTransport
+
+__all__ = [
+    'DriverPool'
+]
+
+
+class _Entry(object):
+    def __init__(self, driver, secret, now):
+        self.driver = driver
+        self.secret = secret
+        self.created = now
+        self.last_used = now
+
+
+def _digest(key):
+    # Only a digest of the API key is kept next to the driver
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return hashlib.sha1(key).hexdigest()
+
+
+class DriverPool(object):
+    """
+    LRU pool of drivers keyed by C{(user, auth URL, region)}.
+
+    @type max_drivers: C{int}
+    @param max_drivers: Maximum number of drivers kept.
+
+    @type idle_timeout: C{float}
+    @param idle_timeout: Seconds after which an unused driver is dropped,
+                         C{None} to keep drivers until they are evicted.
+
+    @type max_connections: C{int}
+    @param max_connections: Cap on the connections open at a time across
+                            all the drivers, see L{PooledTransport}.
+
+    @type factory: C{callable}
+    @param factory: Called as C{factory(user, key, auth_url, region)} to
+                    create a driver, defaults to a L{RackspaceDatabaseDriver}
+                    using the pool transport and C{driver_kwargs}.
+
+    @param driver_kwargs: Extra arguments of the default factory, e.g.
+                          C{ex_force_auth_version}.
+    """
+
+    def __init__(self, max_drivers=100, idle_timeout=300,
+                 max_connections=None, max_idle_connections=10,
+                 factory=None, clock=timer, **driver_kwargs):
+        self.max_drivers = max_drivers
+        self.idle_timeout = idle_timeout
+        self.transport = PooledTransport(max_idle=max_idle_connections,
+                                         max_connections=max_connections)
+        self.factory = factory or self._create
+        self.clock = clock
+        self.driver_kwargs = driver_kwargs
+        self.stats = {'hits': 0, 'misses': 0, 'evicted_lru': 0,
+                      'evicted_idle': 0, 'evicted_credentials': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _create(self, user, key, auth_url, region):
+        from rackspace_database.drivers.rackspace import \
+            RackspaceDatabaseDriver
+
+        kwargs = dict(self.driver_kwargs)
+        kwargs['ex_transport'] = self.transport
+        kwargs['ex_force_region'] = region
+        if auth_url is not None:
+            kwargs['ex_force_auth_url'] = auth_url
+        return RackspaceDatabaseDriver(user, key, **kwargs)
+
+    def get(self, user, key, auth_url=None, region='ord'):
+        """
+        Return the driver of a tenant, creating it when needed.  A driver
+        created with another API key for the same tenant is replaced.
+        """
+        tenant = (user, auth_url, region)
+        secret = _digest(key)
+        now = self.clock()
+        self._lock.acquire()
+        try:
+            self._evict_idle(now)
+            entry = self._entries.pop(tenant, None)
+            if entry is not None and entry.secret != secret:
+                self.stats['evicted_credentials'] += 1
+                entry = None
+            if entry is not None:
+                self.stats['hits'] += 1
+            else:
+                self.stats['misses'] += 1
+                entry = _Entry(self.factory(user, key, auth_url, region),
+                               secret, now)
+                while len(self._entries) >= self.max_drivers:
+                    self._entries.popitem(last=False)
+                    self.stats['evicted_lru'] += 1
+            entry.last_used = now
+            self._entries[tenant] = entry
+            return entry.driver
+        finally:
+            self._lock.release()
+
+    def _evict_idle(self, now):
+        # Called with the lock held, entries are in least recently used
+        # order
+        if self.idle_timeout is None:
+            return
+        while self._entries:
+            tenant, entry = next(iter(self._entries.items()))
+            if now - entry.last_used < self.idle_timeout:
+                break
+            del self._entries[tenant]
+            self.stats['evicted_idle'] += 1
+
+    def evict_idle(self):
+        """
+        Drop the drivers unused for C{idle_timeout} seconds.
+        """
+        self._lock.acquire()
+        try:
+            self._evict_idle(self.clock())
+        finally:
+            self._lock.release()
+
+    def remove(self, user, auth_url=None, region='ord'):
+        """
+        Drop the driver of a tenant, e.g. after its credentials were
+        revoked.
+        """
+        self._lock.acquire()
+        try:
+            return self._entries.pop((user, auth_url, region),
+                                     None) is not None
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def snapshot(self):
+        """
+        @rtype: C{dict}
+        @return: Occupancy (C{drivers}, C{max_drivers}, C{open_connections},
+                 C{idle_connections}), the C{hits} and C{misses} of L{get},
+                 the evictions per cause and the transport counters.
+        """
+        self._lock.acquire()
+        try:
+            result = dict(self.stats)
+            result['drivers'] = len(self._entries)
+        finally:
+            self._lock.release()
+        result['max_drivers'] = self.max_drivers
+        result['open_connections'] = self.transport.open()
+        result['idle_connections'] = self.transport.idle()
+        result['transport'] = dict(self.transport.stats)
+        return result
+
+    def close(self):
+        """
+        Drop every driver and close the idle connections.
+        """
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+        finally:
+            self._lock.release()
+        self.transport.close()
@@ -13,10 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from libcloud.utils.misc import get_driver as get_provider_driver
 from rackspace_database.types import Provider
 
 DRIVERS = {
+    Provider.DUMMY:
+        ('rackspace_database.drivers.dummy',
+         'DummyDatabaseDriver'),
     Provider.RACKSPACE:
         ('rackspace_database.drivers.rackspace',
          'RackspaceDatabaseDriver'),
@@ -24,4 +26,17 @@ DRIVERS = {
 
 
 def get_driver(provider):
-    return get_provider_driver(DRIVERS, provider)
+    """
+    Return the driver class for C{provider}.
+
+    The driver module, and libcloud with it, is only imported the first
+    time the driver is requested.
+
+    @type provider: L{rackspace_database.types.Provider}
+    """
+    if provider in DRIVERS:
+        mod_name, driver_name = DRIVERS[provider]
+        _mod = __import__(mod_name, globals(), locals(), [driver_name])
+        return getattr(_mod, driver_name)
+
+    raise AttributeError('Provider %s does not exist' % (provider))
@@ -0,0 +1,356 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Rolling restart / resize / volume resize across many instances.
+
+The instances are taken in batches of C{batch_size}.  An instance is
+unavailable from the moment its action is issued until it is seen
+C{ACTIVE} again, and a new batch starts as soon as it fits under
+C{max_unavailable}: with C{max_unavailable} larger than C{batch_size} the
+next batch is issued while the previous one is still converging.
+
+Progress is watched with a single C{list_instances} call per tick for all
+the instances in flight.  An instance has converged once it was seen
+leaving C{ACTIVE} and back; the API can take a while before it moves an
+instance out of C{ACTIVE}, so an instance never seen leaving it only
+counts as converged after C{settle_time}, when one is given, and times
+out otherwise.  When more than C{max_failure_rate} of the
+instances finished in this run have failed, no new batch is started and
+the run stops once the instances in flight have settled.  A failed poll
+is counted and retried on the next tick, the instances it could not see
+still time out.  Repeated ids are acted upon once.
+
+With C{state_file} set the state of every instance is saved after each
+change, and a later run with the same file resumes where the previous one
+stopped: finished instances are skipped and instances whose action was
+already issued are only watched.
+
+Example::
+
+    rolling = RollingOperation(driver, 'resize_volume', instance_ids,
+                               argument=10, batch_size=5,
+                               max_unavailable=10,
+                               state_file='resize.state')
+    report = rolling.run()
+"""
+
+import os
+import time
+
+from collections import deque
+from timeit import default_timer as timer
+
+try:
+    import simplejson as json
+except:
+    import json
+
+from rackspace_database.base import InstanceStatus
+from rackspace_database.concurrency import bounded_map
+
+__all__ = [
+    'OPERATIONS',
+    'RollingOperation',
+    'RollingReport'
+]
+
+# Operation name -> driver method and whether it takes an argument
+OPERATIONS = {
+    'restart': ('restart_instance', False),
+    'resize': ('resize_instance', True),
+    'resize_volume': ('resize_instance_volume', True)
+}
+
+PENDING = 'pending'
+IN_PROGRESS = 'in_progress'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class RollingReport(object):
+    """
+    Outcome of a L{RollingOperation} run.
+
+    @ivar failed: C{id -> reason} for the instances which failed.
+    @ivar skipped: Ids never started because the run was halted.
+    @ivar poll_errors: Number of C{list_instances} polls which failed.
+    """
+
+    def __init__(self):
+        self.done = []
+        self.failed = {}
+        self.skipped = []
+        self.halted = False
+        self.batches = 0
+        self.polls = 0
+        self.poll_errors = 0
+        self.peak_unavailable = 0
+        self.elapsed = None
+
+    def summary(self):
+        return {'done': len(self.done), 'failed': len(self.failed),
+                'skipped': len(self.skipped), 'halted': self.halted,
+                'batches': self.batches, 'polls': self.polls,
+                'poll_errors': self.poll_errors,
+                'peak_unavailable': self.peak_unavailable,
+                'elapsed': self.elapsed}
+
+    def format(self):
+        summary = self.summary()
+        lines = ['done=%d failed=%d skipped=%d halted=%s batches=%d '
+                 'polls=%d poll_errors=%d peak_unavailable=%d '
+                 'elapsed=%.2fs' %
+                 (summary['done'], summary['failed'], summary['skipped'],
+                  summary['halted'], summary['batches'], summary['polls'],
+                  summary['poll_errors'], summary['peak_unavailable'],
+                  summary['elapsed'])]
+        for instance_id in sorted(self.failed):
+            lines.append('  failed %s: %s' % (instance_id,
+                                               self.failed[instance_id]))
+        return '\n'.join(lines)
+
+
+class RollingOperation(object):
+    """
+    Applies an operation to instances in rolling batches.
+
+    @type operation: C{str}
+    @param operation: One of L{OPERATIONS}.
+
+    @param argument: C{flavorRef} for C{resize}, the new size for
+                     C{resize_volume}.
+
+    @type max_unavailable: C{int}
+    @param max_unavailable: Maximum number of instances unavailable at a
+                            time, at least C{batch_size}.  Defaults to
+                            C{batch_size}, which disables pipelining.
+
+    @type max_failure_rate: C{float}
+    @param max_failure_rate: Fraction of failed instances above which the
+                             run halts, evaluated once at least
+                             C{batch_size} instances finished.
+
+    @type settle_time: C{float}
+    @param settle_time: Seconds after which an instance still reported
+                        C{ACTIVE} counts as converged although no
+                        transition was seen, for actions too quick to be
+                        seen between two polls.  Defaults to C{None}: a
+                        transition must be seen.
+
+    @type timeout: C{float}
+    @param timeout: Seconds an instance may take to converge.
+
+    @type state_file: C{str}
+    @param state_file: Path of the JSON file used to save and resume
+                       progress.
+
+    @type retry_failed: C{bool}
+    @param retry_failed: Start the instances recorded as failed in
+                         C{state_file} again.
+
+    @type limiter: L{AdaptiveLimiter}
+    @param limiter: Limits the calls starting a batch, which otherwise all
+                    start at once.
+    """
+
+    def __init__(self, driver, operation, instance_ids, argument=None,
+                 batch_size=5, max_unavailable=None, max_failure_rate=0.2,
+                 poll_interval=5, settle_time=None, timeout=1800,
+                 state_file=None, retry_failed=False, limiter=None):
+        if operation not in OPERATIONS:
+            raise ValueError('Unknown operation %s, expected one of %s' %
+                             (operation, ', '.join(sorted(OPERATIONS))))
+        method, takes_argument = OPERATIONS[operation]
+        if takes_argument and argument is None:
+            raise ValueError('%s requires an argument' % (operation))
+        max_unavailable = max_unavailable or batch_size
+        if max_unavailable < batch_size:
+            raise ValueError('max_unavailable must be at least batch_size')
+
+        self.driver = driver
+        self.operation = operation
+        self.argument = argument
+        self.instance_ids = []
+        self.batch_size = batch_size
+        self.max_unavailable = max_unavailable
+        self.limiter = limiter
+        self.max_failure_rate = max_failure_rate
+        self.poll_interval = poll_interval
+        self.settle_time = settle_time
+        self.timeout = timeout
+        self.state_file = state_file
+        self.retry_failed = retry_failed
+        self._method = getattr(driver, method)
+        self._takes_argument = takes_argument
+        self.states = {}
+        for instance_id in instance_ids:
+            # A repeated id is acted upon once
+            if instance_id not in self.states:
+                self.states[instance_id] = {'state': PENDING}
+                self.instance_ids.append(instance_id)
+
+    def _load(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        fp = open(self.state_file)
+        try:
+            saved = json.load(fp)
+        finally:
+            fp.close()
+        if saved['operation'] != self.operation or \
+           saved['argument'] != self.argument:
+            raise ValueError('%s was written for %s %s' %
+                             (self.state_file, saved['operation'],
+                              saved['argument']))
+        for instance_id, state in saved['instances'].items():
+            if instance_id not in self.states:
+                continue
+            if state['state'] == FAILED and self.retry_failed:
+                state = {'state': PENDING}
+            self.states[instance_id] = state
+
+    def _save(self):
+        if not self.state_file:
+            return
+        # Write aside and rename so an interruption never leaves a
+        # truncated file behind
+        path = self.state_file + '.tmp'
+        fp = open(path, 'w')
+        try:
+            json.dump({'operation': self.operation,
+                       'argument': self.argument,
+                       'instances': self.states}, fp, indent=2,
+                      sort_keys=True)
+        finally:
+            fp.close()
+        os.rename(path, self.state_file)
+
+    def _act(self, instance_id):
+        if self._takes_argument:
+            return self._method(instance_id, self.argument)
+        return self._method(instance_id)
+
+    def _start_batch(self, batch, watching, report):
+        tasks = bounded_map(self._act, batch, self.limiter or len(batch))
+        now = time.time()
+        for instance_id, task in zip(batch, tasks):
+            if task.error is None:
+                self.states[instance_id] = {'state': IN_PROGRESS,
+                                            'started': now}
+                watching[instance_id] = False
+            else:
+                self._fail(instance_id, str(task.error), report)
+        report.batches += 1
+        report.peak_unavailable = max(report.peak_unavailable,
+                                      len(watching))
+
+    def _fail(self, instance_id, reason, report):
+        self.states[instance_id] = {'state': FAILED, 'reason': reason}
+        report.failed[instance_id] = reason
+
+    def _poll(self, watching, report):
+        report.polls += 1
+        try:
+            statuses = dict([(i.id, i.status) for i in
+                             self.driver.list_instances()])
+        except Exception:
+            # The actions are issued already, a transient error only
+            # delays seeing them through
+            report.poll_errors += 1
+            statuses = None
+        now = time.time()
+        for instance_id in list(watching):
+            started = self.states[instance_id]['started']
+            if statuses is None:
+                if now - started <= self.timeout:
+                    continue
+                self._fail(instance_id, 'timed out', report)
+                del watching[instance_id]
+                continue
+            status = statuses.get(instance_id)
+            if status == InstanceStatus.ACTIVE and \
+                    not watching[instance_id] and \
+                    (self.settle_time is None or
+                     now - started < self.settle_time):
+                # The action has not shown up yet
+                if now - started <= self.timeout:
+                    continue
+                self._fail(instance_id, 'timed out', report)
+            elif status == InstanceStatus.ACTIVE:
+                self.states[instance_id] = {'state': DONE}
+                report.done.append(instance_id)
+            elif status is None:
+                self._fail(instance_id, 'instance disappeared', report)
+            elif status == InstanceStatus.FAILED:
+                self._fail(instance_id, 'instance is FAILED', report)
+            elif now - started > self.timeout:
+                self._fail(instance_id, 'timed out', report)
+            else:
+                # Left ACTIVE, the next ACTIVE means converged
+                watching[instance_id] = True
+                self.states[instance_id]['left'] = True
+                continue
+            del watching[instance_id]
+
+    def _failure_rate_exceeded(self, report):
+        finished = len(report.done) + len(report.failed)
+        if not report.failed or finished < self.batch_size:
+            return False
+        return float(len(report.failed)) / finished > self.max_failure_rate
+
+    def run(self):
+        """
+        Run (or resume) the operation and return a L{RollingReport}.
+        """
+        start = timer()
+        self._load()
+        report = RollingReport()
+
+        # Instance id -> whether it was seen leaving ACTIVE
+        watching = {}
+        queue = deque()
+        for instance_id in self.instance_ids:
+            state = self.states[instance_id]['state']
+            if state == PENDING:
+                queue.append(instance_id)
+            elif state == IN_PROGRESS:
+                watching[instance_id] = \
+                    self.states[instance_id].get('left', False)
+        self._save()
+
+        while queue or watching:
+            if self._failure_rate_exceeded(report):
+                report.halted = True
+            while not report.halted and queue and \
+                    len(watching) + min(self.batch_size, len(queue)) <= \
+                    self.max_unavailable:
+                batch = [queue.popleft() for _ in
+                         range(min(self.batch_size, len(queue)))]
+                self._start_batch(batch, watching, report)
+                self._save()
+                if self._failure_rate_exceeded(report):
+                    report.halted = True
+            if not watching:
+                if report.halted:
+                    break
+                continue
+            time.sleep(self.poll_interval)
+            self._poll(watching, report)
+            self._save()
+
+        report.skipped = list(queue)
+        report.elapsed = timer() - start
+        return report
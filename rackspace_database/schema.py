@@ -0,0 +1,351 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Declarative response schemas compiled into specialized mappers.
+
+A L{Schema} describes how the fields of an API object map onto the
+arguments of a model class.  L{Schema.compile} turns it into a plain
+function, generated once, which builds the model with a single expression
+per field: lookup tables are precomputed, nested schemas are inlined as
+list comprehensions and no per-call dispatch on the field kinds is left.
+
+Key literals are emitted with the string type the JSON decoder produces,
+so on Python 2 the stdlib decoder's C{unicode} keys are not compared
+against C{str} literals on every lookup.
+
+The compiled function has the usual mapper signature C{(obj, value_dict)}
+and carries a C{many} attribute mapping a whole list in one call::
+
+    schema = Schema(Database, [Value('name'),
+                               Value('collate', 'collate', required=False)])
+    mapper = schema.compile()
+    database = mapper({'name': 'a'})
+    databases = mapper.many([{'name': 'a'}, {'name': 'b'}])
+
+L{Schema.project} compiles the same way a mapper returning only some of
+the fields, as plain tuples or as rows of a L{Projection}, without
+building the model objects.
+"""
+
+from collections import namedtuple
+
+__all__ = [
+    'Field',
+    'Value',
+    'Path',
+    'Lookup',
+    'SelfLink',
+    'Nested',
+    'Schema',
+    'Projection',
+    'enum_table',
+    'self_link'
+]
+
+
+# Default of the fields without one
+_MISSING = object()
+
+
+def enum_table(enum):
+    """
+    Return a C{name -> value} dict for the public attributes of an enum
+    class such as L{InstanceStatus}.
+    """
+    return dict([(name, value) for name, value in enum.__dict__.items()
+                 if not name.startswith('_')])
+
+
+def self_link(obj, key_type=str):
+    """
+    Return the C{href} of the C{self} link in C{obj['links']}, or C{None}.
+
+    The API lists the C{self} link first, so that entry is checked before
+    falling back to a scan.
+    """
+    return _self_link_function(key_type)(obj)
+
+
+def _self_link_function(key_type):
+    links_key = key_type('links')
+    rel_key = key_type('rel')
+    href_key = key_type('href')
+    rel = key_type('self')
+
+    def self_link(obj):
+        links = obj[links_key]
+        if links and links[0][rel_key] == rel:
+            return links[0][href_key]
+        for link in links:
+            if link[rel_key] == rel:
+                return link[href_key]
+        return None
+
+    return self_link
+
+
+def _factory_source(env, expression):
+    """
+    Return the source of a factory function which takes the helpers in
+    C{env} as arguments, so the mappers reach them as closure variables
+    instead of globals, and returns a C{(mapper, many)} pair evaluating
+    C{expression} on C{obj}.
+    """
+    return ('def factory(%s):\n'
+            '    def mapper(obj, value_dict=None):\n'
+            '        return %s\n'
+            '\n'
+            '    def many(objs, value_dict=None):\n'
+            '        return [%s for obj in objs]\n'
+            '\n'
+            '    return mapper, many\n' %
+            (', '.join(sorted(env)), expression, expression))
+
+
+class Field(object):
+    """
+    Base class for the schema fields.
+
+    @type arg: C{str}
+    @param arg: Keyword argument of the model constructor receiving the
+                value, or C{None} to pass it positionally.
+
+    @type name: C{str}
+    @param name: Name of the field in projections, defaults to C{arg} or
+                 to C{key}.
+    """
+
+    def __init__(self, key, arg=None, name=None):
+        self.key = key
+        self.arg = arg
+        self.name = name or arg or key
+
+    def expression(self, obj, env, key_type):
+        """
+        Return the Python source of an expression evaluating the field on
+        the dict named C{obj}.  Helpers the expression refers to are added
+        to the C{env} dict and key literals are built with C{key_type}.
+        """
+        raise NotImplementedError()
+
+
+class Value(Field):
+    """
+    A plain value, C{obj[key]} when required else C{obj.get(key)}.
+    """
+
+    def __init__(self, key, arg=None, required=True, name=None):
+        super(Value, self).__init__(key, arg, name)
+        self.required = required
+
+    def expression(self, obj, env, key_type):
+        if self.required:
+            return '%s[%r]' % (obj, key_type(self.key))
+        return '%s.get(%r)' % (obj, key_type(self.key))
+
+
+class Path(Field):
+    """
+    A value nested in sub-dicts, C{None} when any step is missing or
+    empty.  C{key} is a sequence of keys.
+    """
+
+    def expression(self, obj, env, key_type):
+        expression = '%s.get(%r)' % (obj, key_type(self.key[0]))
+        for key in self.key[1:]:
+            expression = '(%s or _empty).get(%r)' % (expression,
+                                                     key_type(key))
+        env['_empty'] = {}
+        return '(%s or None)' % (expression)
+
+
+class Lookup(Field):
+    """
+    A value translated through a precomputed table.  Unknown values are
+    translated to C{default} when one is given and raise C{KeyError}
+    otherwise.
+    """
+
+    def __init__(self, key, table, arg=None, name=None, default=_MISSING):
+        super(Lookup, self).__init__(key, arg, name)
+        self.table = table
+        self.default = default
+
+    def expression(self, obj, env, key_type):
+        name = '_table_%d' % (len(env))
+        env[name] = dict([(key_type(k), v) for k, v in self.table.items()])
+        if self.default is _MISSING:
+            return '%s[%s[%r]]' % (name, obj, key_type(self.key))
+        default = '_default_%d' % (len(env))
+        env[default] = self.default
+        return '%s.get(%s[%r], %s)' % (name, obj, key_type(self.key),
+                                       default)
+
+
+class SelfLink(Field):
+    """
+    The C{href} of the C{self} link, either on the object itself (C{key} is
+    C{None}) or on the sub-object stored under C{key}.
+    """
+
+    def __init__(self, key=None, arg=None, name=None):
+        super(SelfLink, self).__init__(key, arg, name)
+
+    def expression(self, obj, env, key_type):
+        env['_self_link'] = _self_link_function(key_type)
+        if self.key is None:
+            return '_self_link(%s)' % (obj)
+        return '_self_link(%s[%r])' % (obj, key_type(self.key))
+
+
+class Nested(Field):
+    """
+    A list of sub-objects mapped with another schema, C{None} when the list
+    is missing or empty.
+    """
+
+    def __init__(self, key, schema, arg=None, name=None):
+        super(Nested, self).__init__(key, arg, name)
+        self.schema = schema
+
+    def expression(self, obj, env, key_type):
+        name = '_nested_%d' % (len(env))
+        env[name] = self.schema.compile(key_type)
+        items = '%s.get(%r)' % (obj, key_type(self.key))
+        return '(%s and [%s(x) for x in %s] or None)' % (items, name, items)
+
+
+class Schema(object):
+    """
+    Describes how to build C{model} out of an API object.
+
+    @type model: C{type}
+    @param model: Class (or any callable) receiving the field values.
+
+    @type fields: C{list}
+    @param fields: L{Field} instances.  Fields without C{arg} are passed
+                   positionally, in order.
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = list(fields)
+        self._compiled = {}
+
+    def field_names(self):
+        return [field.name for field in self.fields]
+
+    def source(self, env, key_type=str):
+        """
+        Return the source of the mapper factory, collecting its helpers in
+        C{env}.
+        """
+        args = []
+        kwargs = []
+        for field in self.fields:
+            expression = field.expression('obj', env, key_type)
+            if field.arg is None:
+                args.append(expression)
+            else:
+                kwargs.append('%s=%s' % (field.arg, expression))
+        env['_model'] = self.model
+        call = '_model(%s)' % (', '.join(args + kwargs))
+        return _factory_source(env, call)
+
+    def _build(self, source, env, name):
+        code = compile(source, '<schema %s>' % (name), 'exec')
+        namespace = {}
+        exec(code, namespace)
+        mapper, many = namespace['factory'](**env)
+        mapper.many = many
+        mapper.schema = self
+        mapper.__name__ = 'map_%s' % (name.lower())
+        return mapper
+
+    def compile(self, key_type=str):
+        """
+        Return the mapper function for this schema.  The function is
+        generated on the first call and cached afterwards.
+
+        @type key_type: C{type}
+        @param key_type: String type of the keys and values produced by the
+                         JSON decoder feeding the mapper.
+        """
+        mapper = self._compiled.get(key_type)
+        if mapper is None:
+            env = {}
+            source = self.source(env, key_type)
+            name = getattr(self.model, '__name__', 'model')
+            mapper = self._build(source, env, name)
+            self._compiled[key_type] = mapper
+        return mapper
+
+    def project(self, fields, key_type=str, row=None):
+        """
+        Return a mapper producing only C{fields} for each object.
+
+        @type fields: C{tuple}
+        @param fields: Field names, see L{Field}.
+
+        @type row: C{type}
+        @param row: Class receiving the values positionally, C{None} to
+                    return plain tuples.
+
+        @raise ValueError: When a field name is not part of the schema.
+        """
+        fields = tuple(fields)
+        cache_key = (fields, key_type, row)
+        mapper = self._compiled.get(cache_key)
+        if mapper is not None:
+            return mapper
+
+        by_name = dict([(field.name, field) for field in self.fields])
+        env = {}
+        expressions = []
+        for name in fields:
+            if name not in by_name:
+                raise ValueError('Unknown field %s, expected one of %s' %
+                                 (name, ', '.join(self.field_names())))
+            expressions.append(by_name[name].expression('obj', env,
+                                                        key_type))
+
+        if row is None:
+            value = '(%s,)' % (', '.join(expressions))
+        else:
+            env['_row'] = row
+            value = '_row(%s)' % (', '.join(expressions))
+
+        source = _factory_source(env, value)
+        name = getattr(row, '__name__', 'tuple')
+        mapper = self._build(source, env, name)
+        self._compiled[cache_key] = mapper
+        return mapper
+
+
+class Projection(object):
+    """
+    A named selection of fields.  Mapping with a projection returns
+    C{namedtuple} rows called C{name}.
+    """
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = tuple(fields)
+        self.row = namedtuple(name, self.fields)
+
+    def __repr__(self):
+        return '<Projection: name=%s, fields=%s >' % (self.name,
+                                                      ', '.join(self.fields))
@@ -0,0 +1,197 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Log of the driver calls slower than a threshold.
+
+A driver created with C{ex_slow_call_threshold=0.5} (or with a shared
+C{ex_slow_call_log}) times every call; the ones over the threshold add a
+record to the L{SlowCallLog}, a ring buffer keeping the latest
+C{capacity} records.  Calls under the threshold only pay for two clock
+reads, a comparison and the bookkeeping of the last HTTP exchange: the
+record, including the call-site stack, is built after the fact and only
+for slow calls.
+
+Records are dicts::
+
+    {'time': 1350000000.0, 'duration': 0.73,
+     'operation': 'list_databases',
+     'url': '/instances/{instance_id}/databases',
+     'instance_id': '...', 'status': 200,
+     'request_bytes': 0, 'response_bytes': 18734, 'objects': 412,
+     'error': None,
+     'stack': ['app/views.py:88 in show_instance', ...]}
+
+C{dump} writes them as JSON lines, and L{SlowCallLog.install_signal_handler}
+dumps them on a signal (C{SIGUSR1} by default) of a running process.
+"""
+
+import os
+import re
+import sys
+import time
+import threading
+import traceback
+
+from collections import deque
+
+try:
+    import simplejson as json
+except:
+    import json
+
+__all__ = [
+    'SlowCallLog',
+    'url_template'
+]
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+_URL_PARTS = [
+    (re.compile(r'^(/instances/)(?!detail(?:/|$))([^/?]+)'),
+     '{instance_id}'),
+    (re.compile(r'(/databases/)([^/?]+)'), '{database}'),
+    (re.compile(r'(/users/)([^/?]+)'), '{user}'),
+    (re.compile(r'(/flavors/)(?!detail(?:/|$))([^/?]+)'), '{flavor_id}')
+]
+
+
+def url_template(url):
+    """
+    Return the C{(template, instance_id)} of a request URL, the template
+    having its identifiers replaced with placeholders.
+    """
+    instance_id = None
+    template = url or ''
+    for pattern, placeholder in _URL_PARTS:
+        match = pattern.search(template)
+        if match is None:
+            continue
+        if placeholder == '{instance_id}':
+            instance_id = match.group(2)
+        template = template[:match.start(2)] + placeholder + \
+            template[match.end(2):]
+    return template, instance_id
+
+
+def _call_site(depth, skip=PACKAGE_DIRECTORY):
+    """
+    Return the last C{depth} frames of the current stack outside the
+    package, innermost last.
+    """
+    frames = [frame for frame in traceback.extract_stack()
+              if not os.path.abspath(frame[0]).startswith(skip)]
+    return ['%s:%d in %s' % (filename, line, function)
+            for filename, line, function, text in frames[-depth:]]
+
+
+class SlowCallLog(object):
+    """
+    Ring buffer of the slow call records.
+
+    @type threshold: C{float}
+    @param threshold: Duration in seconds from which a call is logged.
+
+    @type capacity: C{int}
+    @param capacity: Number of records kept, the oldest are dropped first.
+
+    @type stack_depth: C{int}
+    @param stack_depth: Number of call-site frames kept per record.
+    """
+
+    def __init__(self, threshold, capacity=1000, stack_depth=8):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.stack_depth = stack_depth
+        self.dropped = 0
+        self._records = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def record(self, operation, url, duration, exchange=None, result=None,
+               error=None):
+        """
+        Add the record of a slow call.
+
+        @type exchange: C{tuple}
+        @param exchange: C{(status, request_bytes, response_bytes)} of the
+                         last HTTP exchange of the call.
+        """
+        template, instance_id = url_template(url)
+        status, request_bytes, response_bytes = exchange or (None, None,
+                                                             None)
+        if isinstance(result, (list, tuple)):
+            objects = len(result)
+        else:
+            objects = result is not None and 1 or 0
+        record = {'time': time.time(), 'duration': duration,
+                  'operation': operation, 'url': template,
+                  'instance_id': instance_id, 'status': status,
+                  'request_bytes': request_bytes,
+                  'response_bytes': response_bytes, 'objects': objects,
+                  'error': error is not None and str(error) or None,
+                  'stack': _call_site(self.stack_depth)}
+        self._lock.acquire()
+        try:
+            if len(self._records) == self.capacity:
+                self.dropped += 1
+            self._records.append(record)
+        finally:
+            self._lock.release()
+
+    def records(self):
+        """
+        Return a copy of the records, oldest first.
+        """
+        # Copying a deque is atomic, and not taking the lock keeps the
+        # signal handler from deadlocking on a thread interrupted in record
+        return list(self._records)
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._records.clear()
+            self.dropped = 0
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._records)
+
+    def dump(self, fp=None):
+        """
+        Write the records to C{fp} (standard error by default) as JSON lines
+        and return their number.
+        """
+        fp = fp or sys.stderr
+        records = self.records()
+        for record in records:
+            fp.write(json.dumps(record, sort_keys=True) + '\n')
+        fp.flush()
+        return len(records)
+
+    def install_signal_handler(self, signum=None, fp=None):
+        """
+        Dump the records to C{fp} whenever the process receives C{signum},
+        C{SIGUSR1} by default.  Must be called from the main thread.
+        """
+        import signal
+
+        if signum is None:
+            signum = signal.SIGUSR1
+
+        def handler(signum, frame):
+            self.dump(fp)
+
+        return signal.signal(signum, handler)
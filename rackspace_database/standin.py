@@ -0,0 +1,1101 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+A local stand-in for the Cloud Databases v1.0 API.
+
+L{StandInServer} implements the auth (v1.1 and v2.0) and database endpoints
+used by L{RackspaceDatabaseDriver} on top of an in-memory state, simulates
+the BUILD -> ACTIVE style status transitions and can inject latency, errors
+and rate limiting::
+
+    server = StandInServer(latency=lognormal(0.02, 0.5), error_rate=0.01)
+    server.start()
+    driver = RackspaceDatabaseDriver('user', 'key', **server.driver_kwargs())
+
+With C{http2=True} (and the optional C{h2} package) the API is also served
+over HTTP/2 on C{http2_port}, cleartext with prior knowledge or over TLS
+with ALPN when a C{certfile} is given; C{driver_kwargs(http2=True)} points
+the driver's API requests at it.
+
+It can also be run on its own::
+
+    python -m rackspace_database.standin --port 8080 \\
+        --latency lognormal:0.02,0.5 --error-rate 0.01 --rate-limit 50
+"""
+
+import re
+import sys
+import math
+import time
+import random
+import zlib
+import socket
+import threading
+
+from optparse import OptionParser
+
+try:
+    import simplejson as json
+except:
+    import json
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+try:
+    import h2.config
+    import h2.events
+    import h2.exceptions
+    import h2.connection
+except ImportError:
+    h2 = None
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+
+__all__ = [
+    'StandInServer',
+    'TokenBucket',
+    'constant',
+    'uniform',
+    'exponential',
+    'lognormal',
+    'parse_distribution'
+]
+
+FLAVORS = [
+    (1, 'm1.tiny', 1, 512),
+    (2, 'm1.small', 1, 1024),
+    (3, 'm1.medium', 1, 2048),
+    (4, 'm1.large', 1, 4096),
+]
+
+ERROR_NAMES = {
+    400: 'badRequest',
+    401: 'unauthorized',
+    404: 'itemNotFound',
+    409: 'conflict',
+    413: 'overLimit',
+    422: 'unprocessableEntity',
+    500: 'instanceFault',
+    503: 'serviceUnavailable',
+}
+
+
+def constant(value):
+    """
+    Distribution which always returns C{value} seconds.
+    """
+    return lambda: value
+
+
+def uniform(low, high):
+    return lambda: random.uniform(low, high)
+
+
+def exponential(mean):
+    return lambda: random.expovariate(1.0 / mean)
+
+
+def lognormal(median, sigma):
+    """
+    Log-normal distribution with the given C{median} (in seconds) and shape
+    C{sigma}, a good fit for the long tail of real API latencies.
+    """
+    mu = math.log(median)
+    return lambda: random.lognormvariate(mu, sigma)
+
+
+DISTRIBUTIONS = {
+    'constant': constant,
+    'uniform': uniform,
+    'exponential': exponential,
+    'lognormal': lognormal,
+}
+
+
+def parse_distribution(spec):
+    """
+    Parse a distribution spec such as C{lognormal:0.02,0.5} or C{0.1}.
+    """
+    if ':' not in spec:
+        return constant(float(spec))
+
+    name, args = spec.split(':', 1)
+    if name not in DISTRIBUTIONS:
+        raise ValueError('Unknown distribution: %s' % (name))
+    return DISTRIBUTIONS[name](*[float(arg) for arg in args.split(',')])
+
+
+def _sampler(value):
+    if value is None:
+        return None
+    if callable(value):
+        return value
+    return constant(float(value))
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket allowing C{rate} requests per second with
+    bursts of up to C{burst} requests.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self._tokens = self.burst
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token.
+
+        @rtype: C{tuple}
+        @return: C{(allowed, retry_after)} where C{retry_after} is the
+                 number of seconds until a token becomes available.
+        """
+        self._lock.acquire()
+        try:
+            now = time.time()
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True, 0
+            return False, (1 - self._tokens) / self.rate
+        finally:
+            self._lock.release()
+
+
+class _Instance(object):
+    def __init__(self, seq, instance_id, name, flavor_id, size):
+        self.seq = seq
+        self.id = instance_id
+        self.name = name
+        self.flavor_id = flavor_id
+        self.size = size
+        self.status = 'BUILD'
+        self.databases = {}
+        self.users = {}
+        self.root_enabled = False
+        self.created = self.updated = time.time()
+        # (status, ready_at, changes) applied once ready_at has passed,
+        # a status of None deletes the instance
+        self.pending = None
+
+
+def _timestamp(value):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(value))
+
+
+class _Error(Exception):
+    def __init__(self, status, message, headers=None):
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class StandInServer(object):
+    """
+    In-memory Cloud Databases API stand-in.
+
+    @param latency: Distribution (a callable returning seconds or a number)
+                    of the delay added to every response.
+    @param error_rate: Probability of answering an API request with one of
+                       C{error_codes}.
+    @param rate_limit: Allowed API requests per second, excess requests get
+                       a 413 overLimit response with a Retry-After header.
+    @param build_time: Seconds (or distribution) an instance spends in
+                       BUILD before turning ACTIVE.
+    @param resize_time: Seconds an instance spends in RESIZE.
+    @param restart_time: Seconds an instance spends in REBOOT while it is
+                         being restarted.
+    @param delete_time: Seconds an instance stays listed after a delete.
+    @param token_ttl: Lifetime of the issued auth tokens in seconds.
+    @param credentials: Optional C{{username: api_key}} mapping, any
+                        credentials are accepted when C{None}.
+    @param compress_min_size: Compress response bodies of at least this
+                              many bytes when the client accepts gzip or
+                              deflate, C{None} never compresses.
+    @param http2: Also serve the API over HTTP/2, requires the C{h2}
+                  package.
+    @param http2_port: Port of the HTTP/2 listener, 0 picks a free one.
+    @param certfile: PEM file with the certificate and private key, makes
+                     the HTTP/2 listener use TLS.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, account_id='586067',
+                 latency=None, error_rate=0.0, error_codes=(500, 503),
+                 rate_limit=None, burst=None, build_time=0.5,
+                 resize_time=0.5, restart_time=0.5, delete_time=0,
+                 token_ttl=86400, credentials=None, regions=('ORD', 'DFW'),
+                 compress_min_size=None, http2=False, http2_port=0,
+                 certfile=None):
+        self.host = host
+        self.port = port
+        self.account_id = account_id
+        self.latency = _sampler(latency)
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.rate_limiter = rate_limit and TokenBucket(rate_limit, burst) \
+            or None
+        self.build_time = _sampler(build_time)
+        self.resize_time = _sampler(resize_time)
+        self.restart_time = _sampler(restart_time)
+        self.delete_time = _sampler(delete_time)
+        self.token_ttl = token_ttl
+        self.credentials = credentials
+        self.regions = regions
+        self.compress_min_size = compress_min_size
+        self.http2 = http2
+        self.http2_port = http2_port
+        self.certfile = certfile
+
+        self.instances = {}
+        self.tokens = {}
+        self.stats = {}
+        self._seq = 0
+        self._lock = threading.RLock()
+        self._httpd = None
+        self._thread = None
+        self._h2 = None
+        self._routes = [(method, re.compile(pattern), getattr(self, name))
+                        for method, pattern, name in self.ROUTES]
+
+    ROUTES = [
+        ('POST', r'^/v1\.1/auth$', '_auth_v1_1'),
+        ('POST', r'^/v2\.0/tokens$', '_auth_v2_0'),
+        ('GET', r'^/instances$', '_list_instances'),
+        ('GET', r'^/instances/detail$', '_list_instances_detail'),
+        ('POST', r'^/instances$', '_create_instance'),
+        ('GET', r'^/instances/([^/]+)$', '_get_instance'),
+        ('DELETE', r'^/instances/([^/]+)$', '_delete_instance'),
+        ('POST', r'^/instances/([^/]+)/action$', '_instance_action'),
+        ('GET', r'^/instances/([^/]+)/databases$', '_list_databases'),
+        ('POST', r'^/instances/([^/]+)/databases$', '_create_databases'),
+        ('DELETE', r'^/instances/([^/]+)/databases/([^/]+)$',
+         '_delete_database'),
+        ('GET', r'^/instances/([^/]+)/users$', '_list_users'),
+        ('POST', r'^/instances/([^/]+)/users$', '_create_users'),
+        ('DELETE', r'^/instances/([^/]+)/users/([^/]+)$', '_delete_user'),
+        ('GET', r'^/instances/([^/]+)/root$', '_has_root_enabled'),
+        ('POST', r'^/instances/([^/]+)/root$', '_enable_root'),
+        ('GET', r'^/flavors$', '_list_flavors'),
+        ('GET', r'^/flavors/detail$', '_list_flavors'),
+        ('GET', r'^/flavors/([^/]+)$', '_get_flavor'),
+    ]
+
+    # Server lifecycle
+
+    def start(self):
+        """
+        Start serving in a background thread.
+        """
+        self._httpd = _ThreadingHTTPServer((self.host, self.port),
+                                           _RequestHandler)
+        self._httpd.standin = self
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        kwargs={'poll_interval': 0.05})
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+        if self.http2:
+            if h2 is None:
+                raise RuntimeError('http2 requires the h2 package')
+            self._h2 = _HTTP2Listener(self, self.host, self.http2_port,
+                                      self.certfile)
+            self.http2_port = self._h2.start()
+        return self
+
+    def stop(self):
+        if self._h2 is not None:
+            self._h2.stop()
+            self._h2 = None
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.close_requests()
+            self._httpd.server_close()
+            self._thread.join()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.stop()
+        return False
+
+    @property
+    def base_url(self):
+        return 'http://%s:%d' % (self.host, self.port)
+
+    @property
+    def auth_url(self):
+        return self.base_url + '/'
+
+    @property
+    def endpoint(self):
+        return '%s/v1.0/%s' % (self.base_url, self.account_id)
+
+    @property
+    def http2_endpoint(self):
+        return '%s://%s:%d/v1.0/%s' % (self.certfile and 'https' or 'http',
+                                       self.host, self.http2_port,
+                                       self.account_id)
+
+    def driver_kwargs(self, auth_version='1.1', region='ord', http2=False):
+        """
+        Keyword arguments pointing L{RackspaceDatabaseDriver} at this
+        server.  With C{http2} the API requests go to the HTTP/2 listener,
+        authentication stays on HTTP/1.1.
+        """
+        kwargs = {'ex_force_auth_url': self.auth_url,
+                  'ex_force_auth_version': auth_version,
+                  'ex_force_region': region}
+        if http2:
+            kwargs['ex_force_base_url'] = self.http2_endpoint
+        return kwargs
+
+    # State helpers
+
+    def add_instance(self, name, flavor_id=1, size=1, status='ACTIVE',
+                     databases=(), users=()):
+        """
+        Seed an instance and return its id.
+        """
+        self._lock.acquire()
+        try:
+            instance = self._new_instance(name, flavor_id, size)
+            instance.status = status
+            for database in databases:
+                instance.databases[database] = self._database(database)
+            for user in users:
+                instance.users[user] = {'name': user, 'databases': []}
+            return instance.id
+        finally:
+            self._lock.release()
+
+    def _new_instance(self, name, flavor_id, size):
+        self._seq += 1
+        instance_id = '%08x-0000-4000-8000-%012x' % (
+            random.getrandbits(32), self._seq)
+        instance = _Instance(self._seq, instance_id, name, flavor_id, size)
+        self.instances[instance_id] = instance
+        return instance
+
+    def _database(self, name, character_set='utf8',
+                  collate='utf8_general_ci'):
+        return {'name': name, 'character_set': character_set,
+                'collate': collate}
+
+    def _transition(self, instance, status, duration, target='ACTIVE',
+                    **changes):
+        instance.status = status
+        instance.updated = time.time()
+        delay = duration and duration() or 0
+        instance.pending = (target, time.time() + delay, changes)
+
+    def _refresh(self):
+        now = time.time()
+        for instance in list(self.instances.values()):
+            if instance.pending and instance.pending[1] <= now:
+                target, ready_at, changes = instance.pending
+                instance.pending = None
+                if target is None:
+                    del self.instances[instance.id]
+                    continue
+                instance.status = target
+                instance.updated = ready_at
+                for key, value in changes.items():
+                    setattr(instance, key, value)
+
+    def _instance(self, instance_id):
+        self._refresh()
+        instance = self.instances.get(instance_id)
+        if instance is None:
+            raise _Error(404, 'The resource could not be found.')
+        return instance
+
+    def _links(self, path):
+        return [{'href': '%s/%s' % (self.endpoint, path), 'rel': 'self'},
+                {'href': '%s/%s' % (self.base_url, path), 'rel': 'bookmark'}]
+
+    def _flavor_ref(self, value):
+        try:
+            flavor_id = int(str(value).rstrip('/').split('/')[-1])
+        except ValueError:
+            flavor_id = None
+        if flavor_id not in [f[0] for f in FLAVORS]:
+            raise _Error(400, 'Invalid flavorRef: %s' % (value))
+        return flavor_id
+
+    def _instance_summary(self, instance):
+        return {'id': instance.id, 'name': instance.name,
+                'status': instance.status,
+                'links': self._links('instances/%s' % (instance.id))}
+
+    def _instance_detail(self, instance, full=False):
+        data = self._instance_summary(instance)
+        data.update({
+            'created': _timestamp(instance.created),
+            'updated': _timestamp(instance.updated),
+            'hostname': '%s.rackspaceclouddb.com' % (
+                instance.id.replace('-', '')),
+            'flavor': {'id': str(instance.flavor_id),
+                       'links': self._links('flavors/%d' %
+                                            (instance.flavor_id))},
+            'volume': {'size': instance.size}})
+        if full:
+            data['databases'] = [instance.databases[name] for name in
+                                 sorted(instance.databases)]
+            data['rootEnabled'] = instance.root_enabled
+        return data
+
+    def _sorted_instances(self):
+        self._refresh()
+        return sorted(self.instances.values(), key=lambda i: i.seq)
+
+    # Request handling
+
+    def handle(self, method, path, headers, body):
+        """
+        Handle a single request and return C{(status, headers, body)}.
+        """
+        path = path.split('?', 1)[0]
+        if len(path) > 1:
+            path = path.rstrip('/')
+
+        if self.latency is not None:
+            time.sleep(max(self.latency(), 0))
+
+        try:
+            if path.startswith('/v1.0/'):
+                parts = path.split('/', 3)
+                if len(parts) < 4 or parts[2] != self.account_id:
+                    raise _Error(404, 'Unknown account')
+                path = '/' + parts[3]
+                self._check_token(headers)
+                self._inject_faults()
+                api = True
+            else:
+                api = False
+
+            for route_method, pattern, handler in self._routes:
+                if route_method != method:
+                    continue
+                match = pattern.match(path)
+                if match is None:
+                    continue
+                if api == handler.__name__.startswith('_auth'):
+                    continue
+
+                self._count(handler.__name__[1:])
+                try:
+                    data = body and json.loads(body) or None
+                except ValueError:
+                    raise _Error(400, 'Malformed request body')
+                self._lock.acquire()
+                try:
+                    status, result = handler(data, *match.groups())
+                finally:
+                    self._lock.release()
+                return self._response(status, result)
+
+            raise _Error(404, 'The resource could not be found.')
+        except _Error:
+            e = sys.exc_info()[1]
+            self._count('error_%d' % (e.status))
+            body = {ERROR_NAMES.get(e.status, 'error'):
+                    {'code': e.status, 'message': e.message}}
+            if e.status == 400:
+                # RackspaceDatabaseResponse.parse_error expects a flat body
+                body = {'code': 400, 'type': 'ValidationError',
+                        'message': e.message, 'details': e.message}
+            status, headers, body = self._response(e.status, body)
+            headers.update(e.headers)
+            return status, headers, body
+
+    def _count(self, name):
+        self._lock.acquire()
+        try:
+            self.stats[name] = self.stats.get(name, 0) + 1
+        finally:
+            self._lock.release()
+
+    def _response(self, status, result):
+        if result is None:
+            return status, {}, ''
+        return status, {'Content-Type': 'application/json; charset=UTF-8'},\
+            json.dumps(result)
+
+    def encode(self, body, accept_encoding):
+        """
+        Compress C{body} for a client sending C{accept_encoding}, return
+        C{(body, content_encoding)}.
+        """
+        if self.compress_min_size is None or \
+                len(body) < self.compress_min_size or not accept_encoding:
+            return body, None
+
+        accepted = [value.split(';')[0].strip().lower()
+                    for value in accept_encoding.split(',')]
+        if 'gzip' in accepted:
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            encoding = 'gzip'
+        elif 'deflate' in accepted:
+            compressor = zlib.compressobj(6)
+            encoding = 'deflate'
+        else:
+            return body, None
+
+        self._count('%s_responses' % (encoding))
+        return compressor.compress(body) + compressor.flush(), encoding
+
+    def _check_token(self, headers):
+        token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+        self._lock.acquire()
+        try:
+            expires = self.tokens.get(token)
+        finally:
+            self._lock.release()
+        if expires is None or expires < time.time():
+            raise _Error(401, 'This server could not verify that you are '
+                              'authorized to access the requested URL.')
+
+    def _inject_faults(self):
+        if self.rate_limiter is not None:
+            allowed, retry_after = self.rate_limiter.acquire()
+            if not allowed:
+                raise _Error(413, 'Too many requests.',
+                             {'Retry-After': str(int(math.ceil(retry_after)))})
+        if self.error_rate and random.random() < self.error_rate:
+            raise _Error(random.choice(self.error_codes),
+                         'Injected failure.')
+
+    def _issue_token(self, username, key):
+        if self.credentials is not None and \
+                self.credentials.get(username) != key:
+            raise _Error(401, 'Invalid credentials.')
+        token = '%032x' % (random.getrandbits(128))
+        expires = time.time() + self.token_ttl
+        self.tokens[token] = expires
+        return token, time.strftime('%Y-%m-%dT%H:%M:%S.000+00:00',
+                                    time.gmtime(expires))
+
+    def _auth_v1_1(self, data):
+        credentials = (data or {}).get('credentials', {})
+        token, expires = self._issue_token(credentials.get('username'),
+                                           credentials.get('key'))
+        return 200, {'auth': {
+            'token': {'id': token, 'expires': expires},
+            'serviceCatalog': {
+                'cloudDatabases': [{'region': region,
+                                    'publicURL': self.endpoint}
+                                   for region in self.regions],
+                'cloudServers': [{'publicURL': self.endpoint}]}}}
+
+    def _auth_v2_0(self, data):
+        auth = (data or {}).get('auth', {})
+        credentials = auth.get('RAX-KSKEY:apiKeyCredentials') or \
+            auth.get('passwordCredentials') or {}
+        token, expires = self._issue_token(
+            credentials.get('username'),
+            credentials.get('apiKey', credentials.get('password')))
+        return 200, {'access': {
+            'token': {'id': token, 'expires': expires,
+                      'tenant': {'id': self.account_id,
+                                 'name': self.account_id}},
+            'serviceCatalog': [
+                {'name': 'cloudDatabases', 'type': 'rax:database',
+                 'endpoints': [{'region': region, 'tenantId': self.account_id,
+                                'publicURL': self.endpoint}
+                               for region in self.regions]}],
+            'user': {'id': '1', 'name': credentials.get('username')}}}
+
+    def _list_instances(self, data):
+        return 200, {'instances': [self._instance_summary(i)
+                                   for i in self._sorted_instances()]}
+
+    def _list_instances_detail(self, data):
+        return 200, {'instances': [self._instance_detail(i)
+                                   for i in self._sorted_instances()]}
+
+    def _create_instance(self, data):
+        spec = (data or {}).get('instance')
+        if not spec or 'flavorRef' not in spec:
+            raise _Error(400, 'Missing flavorRef')
+        size = spec.get('volume', {}).get('size')
+        if not isinstance(size, int) or not 1 <= size <= 50:
+            raise _Error(400, 'Volume size must be between 1 and 50')
+
+        instance = self._new_instance(spec.get('name'),
+                                      self._flavor_ref(spec['flavorRef']),
+                                      size)
+        for database in spec.get('databases', []):
+            instance.databases[database['name']] = self._database(
+                database['name'],
+                database.get('character_set', 'utf8'),
+                database.get('collate', 'utf8_general_ci'))
+        self._transition(instance, 'BUILD', self.build_time)
+        return 200, {'instance': self._instance_detail(instance, full=True)}
+
+    def _get_instance(self, data, instance_id):
+        instance = self._instance(instance_id)
+        return 200, {'instance': self._instance_detail(instance, full=True)}
+
+    def _delete_instance(self, data, instance_id):
+        instance = self._instance(instance_id)
+        if instance.pending and instance.pending[0] is None:
+            raise _Error(422, 'Instance is already being deleted.')
+        self._transition(instance, 'SHUTDOWN', self.delete_time, target=None)
+        self._refresh()
+        return 202, None
+
+    def _instance_action(self, data, instance_id):
+        instance = self._instance(instance_id)
+        if instance.status != 'ACTIVE':
+            raise _Error(422, 'Instance %s is not ACTIVE.' % (instance_id))
+
+        data = data or {}
+        if 'restart' in data:
+            self._transition(instance, 'REBOOT', self.restart_time)
+        elif 'resize' in data and 'flavorRef' in data['resize']:
+            flavor_id = self._flavor_ref(data['resize']['flavorRef'])
+            self._transition(instance, 'RESIZE', self.resize_time,
+                             flavor_id=flavor_id)
+        elif 'resize' in data and 'volume' in data['resize']:
+            size = data['resize']['volume'].get('size')
+            if not isinstance(size, int) or not instance.size < size <= 50:
+                raise _Error(400, 'Volume size must be larger than the '
+                                  'current size and at most 50')
+            self._transition(instance, 'RESIZE', self.resize_time, size=size)
+        else:
+            raise _Error(400, 'Invalid action')
+        return 202, None
+
+    def _list_databases(self, data, instance_id):
+        instance = self._instance(instance_id)
+        return 200, {'databases': [instance.databases[name] for name in
+                                   sorted(instance.databases)]}
+
+    def _create_databases(self, data, instance_id):
+        instance = self._instance(instance_id)
+        databases = (data or {}).get('databases')
+        if not databases:
+            raise _Error(400, 'Missing databases')
+        for database in databases:
+            if database['name'] in instance.databases:
+                raise _Error(409, 'Database %s already exists.' %
+                             (database['name']))
+        for database in databases:
+            instance.databases[database['name']] = self._database(
+                database['name'],
+                database.get('character_set', 'utf8'),
+                database.get('collate', 'utf8_general_ci'))
+        return 202, None
+
+    def _delete_database(self, data, instance_id, name):
+        instance = self._instance(instance_id)
+        if instance.databases.pop(name, None) is None:
+            raise _Error(404, 'Database %s does not exist.' % (name))
+        return 202, None
+
+    def _list_users(self, data, instance_id):
+        instance = self._instance(instance_id)
+        return 200, {'users': [{'name': name} for name in
+                               sorted(instance.users)]}
+
+    def _create_users(self, data, instance_id):
+        instance = self._instance(instance_id)
+        users = (data or {}).get('users')
+        if not users:
+            raise _Error(400, 'Missing users')
+        for user in users:
+            if user['name'] in instance.users:
+                raise _Error(409, 'User %s already exists.' % (user['name']))
+        for user in users:
+            instance.users[user['name']] = {
+                'name': user['name'],
+                'databases': [d['name'] for d in user.get('databases', [])]}
+        return 202, None
+
+    def _delete_user(self, data, instance_id, name):
+        instance = self._instance(instance_id)
+        if instance.users.pop(name, None) is None:
+            raise _Error(404, 'User %s does not exist.' % (name))
+        return 202, None
+
+    def _has_root_enabled(self, data, instance_id):
+        instance = self._instance(instance_id)
+        return 200, {'rootEnabled': instance.root_enabled}
+
+    def _enable_root(self, data, instance_id):
+        instance = self._instance(instance_id)
+        instance.root_enabled = True
+        return 200, {'user': {'name': 'root',
+                              'password': '%016x' % random.getrandbits(64)}}
+
+    def _flavor(self, flavor):
+        flavor_id, name, vcpus, ram = flavor
+        return {'id': flavor_id, 'name': name, 'vcpus': vcpus, 'ram': ram,
+                'links': self._links('flavors/%d' % (flavor_id))}
+
+    def _list_flavors(self, data):
+        return 200, {'flavors': [self._flavor(f) for f in FLAVORS]}
+
+    def _get_flavor(self, data, flavor_id):
+        for flavor in FLAVORS:
+            if str(flavor[0]) == flavor_id:
+                return 200, {'flavor': self._flavor(flavor)}
+        raise _Error(404, 'The resource could not be found.')
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # The default backlog of 5 drops the connects of concurrent clients,
+    # which then retry a second later
+    request_queue_size = 128
+
+    def __init__(self, *args, **kwargs):
+        HTTPServer.__init__(self, *args, **kwargs)
+        self._requests = set()
+        self._requests_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        self._requests_lock.acquire()
+        try:
+            self._requests.add(request)
+        finally:
+            self._requests_lock.release()
+        ThreadingMixIn.process_request(self, request, client_address)
+
+    def shutdown_request(self, request):
+        self._requests_lock.acquire()
+        try:
+            self._requests.discard(request)
+        finally:
+            self._requests_lock.release()
+        HTTPServer.shutdown_request(self, request)
+
+    def close_requests(self):
+        """
+        Close the kept-alive client connections so their handler threads
+        exit.
+        """
+        self._requests_lock.acquire()
+        try:
+            requests = list(self._requests)
+        finally:
+            self._requests_lock.release()
+        for request in requests:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = length and self.rfile.read(length) or None
+        if body is not None and not isinstance(body, str):
+            body = body.decode('utf-8')
+
+        status, headers, body = self.server.standin.handle(
+            method, self.path, self.headers, body)
+        body, encoding = self.server.standin.encode(
+            body.encode('utf-8'), self.headers.get('Accept-Encoding'))
+
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _HTTP2Listener(object):
+    """
+    Serves the stand-in over HTTP/2.  Every stream is handled on its own
+    thread, so requests multiplexed on one connection run concurrently.
+    """
+
+    def __init__(self, standin, host, port, certfile=None):
+        self.standin = standin
+        self.host = host
+        self.port = port
+        self.certfile = certfile
+        self._sock = None
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen(16)
+        self._sock.settimeout(0.05)
+        self.port = self._sock.getsockname()[1]
+        thread = threading.Thread(target=self._accept_loop)
+        thread.setDaemon(True)
+        thread.start()
+        return self.port
+
+    def stop(self):
+        self._stopped.set()
+        self._sock.close()
+        self._lock.acquire()
+        try:
+            clients = list(self._clients)
+        finally:
+            self._lock.release()
+        for client in clients:
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+    def _accept_loop(self):
+        while not self._stopped.isSet():
+            try:
+                client, address = self._sock.accept()
+            except socket.timeout:
+                continue
+            except socket.error:
+                return
+            client.settimeout(None)
+            thread = threading.Thread(target=self._serve, args=(client,))
+            thread.setDaemon(True)
+            thread.start()
+
+    def _serve(self, client):
+        if self.certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+            context.load_cert_chain(self.certfile)
+            context.set_alpn_protocols(['h2'])
+            try:
+                client = context.wrap_socket(client, server_side=True)
+            except (ssl.SSLError, socket.error):
+                client.close()
+                return
+
+        self._lock.acquire()
+        try:
+            self._clients.add(client)
+        finally:
+            self._lock.release()
+
+        connection = _HTTP2ServerConnection(self.standin, client)
+        try:
+            connection.run()
+        finally:
+            self._lock.acquire()
+            try:
+                self._clients.discard(client)
+            finally:
+                self._lock.release()
+            client.close()
+
+
+class _HTTP2ServerConnection(object):
+    def __init__(self, standin, sock):
+        self.standin = standin
+        self.sock = sock
+        self.conn = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False))
+        self.requests = {}
+        self.lock = threading.Lock()
+        self.window = threading.Condition(self.lock)
+        self.closed = False
+
+    def run(self):
+        self.lock.acquire()
+        try:
+            self.conn.initiate_connection()
+            self._flush()
+        finally:
+            self.lock.release()
+
+        try:
+            while True:
+                data = self.sock.recv(65535)
+                if not data:
+                    break
+                self.lock.acquire()
+                try:
+                    events = self.conn.receive_data(data)
+                    ended = [self._handle(event) for event in events]
+                    self._flush()
+                    self.window.notifyAll()
+                finally:
+                    self.lock.release()
+                for stream_id in ended:
+                    if stream_id is not None:
+                        thread = threading.Thread(target=self._respond,
+                                                  args=(stream_id,))
+                        thread.setDaemon(True)
+                        thread.start()
+        except (socket.error, h2.exceptions.ProtocolError):
+            pass
+        finally:
+            self.lock.acquire()
+            try:
+                self.closed = True
+                self.window.notifyAll()
+            finally:
+                self.lock.release()
+
+    def _handle(self, event):
+        if isinstance(event, h2.events.RequestReceived):
+            self.requests[event.stream_id] = (dict(event.headers), [])
+        elif isinstance(event, h2.events.DataReceived):
+            self.requests[event.stream_id][1].append(event.data)
+            self.conn.acknowledge_received_data(
+                event.flow_controlled_length, event.stream_id)
+        elif isinstance(event, h2.events.StreamEnded):
+            return event.stream_id
+        return None
+
+    def _flush(self):
+        data = self.conn.data_to_send()
+        if data:
+            self.sock.sendall(data)
+
+    def _respond(self, stream_id):
+        self.lock.acquire()
+        try:
+            headers, data = self.requests.pop(stream_id)
+        finally:
+            self.lock.release()
+
+        self.standin._count('http2_streams')
+        body = ''.join(data) or None
+        status, response_headers, body = self.standin.handle(
+            headers[':method'], headers[':path'], headers, body)
+        body, encoding = self.standin.encode(body.encode('utf-8'),
+                                             headers.get('accept-encoding'))
+
+        response_headers = [(':status', str(status))] + \
+            [(key.lower(), str(value))
+             for key, value in response_headers.items()] + \
+            [('content-length', str(len(body)))]
+        if encoding is not None:
+            response_headers.append(('content-encoding', encoding))
+
+        self.lock.acquire()
+        try:
+            self.conn.send_headers(stream_id, response_headers,
+                                   end_stream=not body)
+            self._flush()
+            while body and not self.closed:
+                window = min(self.conn.local_flow_control_window(stream_id),
+                             self.conn.max_outbound_frame_size)
+                if window <= 0:
+                    self.window.wait()
+                    continue
+                chunk, body = body[:window], body[window:]
+                self.conn.send_data(stream_id, chunk, end_stream=not body)
+                self._flush()
+        except (socket.error, h2.exceptions.ProtocolError):
+            pass
+        finally:
+            self.lock.release()
+
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--host', default='127.0.0.1')
+    parser.add_option('--port', type='int', default=8080)
+    parser.add_option('--account-id', default='586067')
+    parser.add_option('--latency', default=None,
+                      help='latency distribution, e.g. 0.05, '
+                           'uniform:0.01,0.1 or lognormal:0.02,0.5')
+    parser.add_option('--error-rate', type='float', default=0.0)
+    parser.add_option('--rate-limit', type='float', default=None,
+                      help='API requests per second')
+    parser.add_option('--burst', type='float', default=None)
+    parser.add_option('--build-time', default='0.5')
+    parser.add_option('--compress-min-size', type='int', default=None,
+                      help='gzip/deflate response bodies of at least this '
+                           'many bytes')
+    parser.add_option('--http2-port', type='int', default=None,
+                      help='also serve the API over HTTP/2 on this port')
+    parser.add_option('--certfile', default=None,
+                      help='PEM certificate and key, serves HTTP/2 over TLS')
+    parser.add_option('--instances', type='int', default=0,
+                      help='number of ACTIVE instances to seed')
+    options, args = parser.parse_args(argv)
+
+    server = StandInServer(
+        host=options.host, port=options.port, account_id=options.account_id,
+        latency=options.latency and parse_distribution(options.latency),
+        error_rate=options.error_rate, rate_limit=options.rate_limit,
+        burst=options.burst,
+        build_time=parse_distribution(options.build_time),
+        compress_min_size=options.compress_min_size,
+        http2=options.http2_port is not None,
+        http2_port=options.http2_port or 0, certfile=options.certfile)
+    for i in range(options.instances):
+        server.add_instance('instance_%06d' % (i), databases=['db%d' % (i)])
+
+    server.start()
+    sys.stdout.write('Serving on %s (auth URL %s)\n' % (server.endpoint,
+                                                       server.auth_url))
+    if server.http2:
+        sys.stdout.write('Serving HTTP/2 on %s\n' % (server.http2_endpoint))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
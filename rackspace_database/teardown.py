@@ -0,0 +1,196 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Bulk teardown of instances.
+
+L{teardown} deletes a set of instances, given by id or selected with a
+name pattern and / or a status, with at most C{concurrency} deletes in
+flight.  It then waits for them to disappear, using a single
+C{list_instances} call per tick for the whole set rather than one
+C{get_instance} per instance.  Instances which are already gone (the
+delete returns a 404) count as torn down.  A failed poll is counted and
+retried on the next tick, until the timeout.
+
+Example::
+
+    report = teardown(driver, name='loadtest-*', concurrency=16)
+    print(report.format())
+"""
+
+import time
+import fnmatch
+
+from timeit import default_timer as timer
+
+from rackspace_database.base import status_code
+from rackspace_database.concurrency import bounded_map
+
+__all__ = [
+    'TeardownReport',
+    'teardown'
+]
+
+
+class TeardownReport(object):
+    """
+    Outcome of a L{teardown}.
+
+    @ivar deleted: Ids whose delete was accepted and which disappeared.
+    @ivar already_gone: Ids for which the delete returned a 404.
+    @ivar failed: C{id -> error} for the deletes which failed.
+    @ivar stragglers: Ids still listed when the timeout expired.
+    @ivar poll_errors: Number of C{list_instances} polls which failed.
+    """
+
+    def __init__(self, instance_ids):
+        self.instance_ids = list(instance_ids)
+        self.deleted = []
+        self.already_gone = []
+        self.failed = {}
+        self.stragglers = []
+        self.polls = 0
+        self.poll_errors = 0
+        self.delete_elapsed = None
+        self.elapsed = None
+
+    @property
+    def success(self):
+        return not self.failed and not self.stragglers
+
+    def summary(self):
+        return {'requested': len(self.instance_ids),
+                'deleted': len(self.deleted),
+                'already_gone': len(self.already_gone),
+                'failed': len(self.failed),
+                'stragglers': list(self.stragglers),
+                'polls': self.polls,
+                'poll_errors': self.poll_errors,
+                'delete_elapsed': self.delete_elapsed,
+                'elapsed': self.elapsed}
+
+    def format(self):
+        summary = self.summary()
+        lines = ['requested=%d deleted=%d already_gone=%d failed=%d '
+                 'stragglers=%d polls=%d poll_errors=%d delete_elapsed=%.2fs '
+                 'elapsed=%.2fs' %
+                 (summary['requested'], summary['deleted'],
+                  summary['already_gone'], summary['failed'],
+                  len(summary['stragglers']), summary['polls'],
+                  summary['poll_errors'], summary['delete_elapsed'],
+                  summary['elapsed'])]
+        for instance_id in sorted(self.failed):
+            lines.append('  failed %s: %s' % (instance_id,
+                                               self.failed[instance_id]))
+        for instance_id in self.stragglers:
+            lines.append('  straggler %s' % (instance_id))
+        return '\n'.join(lines)
+
+
+def _select(instances, name, status):
+    if status is not None and not isinstance(status, (list, tuple, set)):
+        status = [status]
+    selected = []
+    for instance in instances:
+        if name is not None and not fnmatch.fnmatchcase(instance.name or '',
+                                                        name):
+            continue
+        if status is not None and instance.status not in status:
+            continue
+        selected.append(instance.id)
+    return selected
+
+
+def _unique(instance_ids):
+    seen = set()
+    unique = []
+    for instance_id in instance_ids:
+        if instance_id not in seen:
+            seen.add(instance_id)
+            unique.append(instance_id)
+    return unique
+
+
+def teardown(driver, instance_ids=None, name=None, status=None,
+             concurrency=10, poll_interval=5, timeout=600):
+    """
+    Delete instances and wait until they are gone.
+
+    @type instance_ids: C{list}
+    @param instance_ids: Ids of the instances to delete, each deleted once
+                         however often it is listed.  When omitted the
+                         instances are selected with C{name} and C{status}
+                         out of one C{list_instances} call.
+
+    @type name: C{str}
+    @param name: C{fnmatch} pattern the instance names must match.
+
+    @type status: C{int} or C{list}
+    @param status: L{InstanceStatus} value(s) the instances must be in.
+
+    @type concurrency: C{int} or L{AdaptiveLimiter}
+    @param concurrency: Maximum number of deletes in flight, or the limiter
+                        deciding it.
+
+    @type poll_interval: C{float}
+    @param poll_interval: Seconds between two C{list_instances} polls.
+
+    @type timeout: C{float}
+    @param timeout: Seconds to wait, from the start of the teardown, before
+                    giving up on the instances still listed.
+
+    @rtype: L{TeardownReport}
+    """
+    start = timer()
+    if instance_ids is None:
+        if name is None and status is None:
+            raise ValueError('instance_ids or a name / status filter is '
+                             'required')
+        instance_ids = _select(driver.list_instances(), name, status)
+    report = TeardownReport(_unique(instance_ids))
+
+    tasks = bounded_map(driver.delete_instance, report.instance_ids,
+                        concurrency)
+    pending = set()
+    for instance_id, task in zip(report.instance_ids, tasks):
+        if task.error is None:
+            pending.add(instance_id)
+        elif status_code(task.error) == 404:
+            report.already_gone.append(instance_id)
+        else:
+            report.failed[instance_id] = task.error
+    report.delete_elapsed = timer() - start
+
+    while pending:
+        report.polls += 1
+        try:
+            listed = set([instance.id for instance in
+                          driver.list_instances()])
+        except Exception:
+            # The deletes are issued already, a transient error only
+            # delays seeing them through
+            report.poll_errors += 1
+        else:
+            gone = pending - listed
+            report.deleted.extend([i for i in report.instance_ids
+                                   if i in gone])
+            pending -= gone
+        if not pending or timer() - start + poll_interval > timeout:
+            break
+        time.sleep(poll_interval)
+
+    report.stragglers = [i for i in report.instance_ids if i in pending]
+    report.elapsed = timer() - start
+    return report
@@ -0,0 +1,222 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Opt-in phase tracing for the database drivers.
+
+Every driver call produces a tree of spans, one per phase:
+
+    - C{call}: the whole driver method
+    - C{auth}: (re-)authentication against the identity service
+    - C{network}: the HTTP exchange
+    - C{decode}: JSON decoding of the response body
+    - C{map}: construction of the model objects
+
+Spans can be exported as JSON lines or in the Chrome trace-event format
+(load the file in chrome://tracing or Perfetto).
+"""
+
+import os
+import time
+import itertools
+import threading
+
+from collections import deque
+
+try:
+    import simplejson as json
+except:
+    import json
+
+from timeit import default_timer as timer
+
+__all__ = [
+    'Span',
+    'Tracer',
+    'NULL_SPAN',
+    'start_span'
+]
+
+
+class Span(object):
+    """
+    A single timed phase.
+
+    @ivar start: Wall clock start time in seconds since the epoch.
+    @ivar duration: Duration in seconds, C{None} while the span is open.
+    @ivar attrs: Free form attributes (payload sizes, object counts, ...).
+    """
+
+    def __init__(self, tracer, name, phase, parent_id, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.phase = phase
+        self.span_id = next(tracer._ids)
+        self.parent_id = parent_id
+        self.thread_id = threading.currentThread().ident
+        self.attrs = attrs
+        self.start = None
+        self.duration = None
+        self.error = None
+        self._started = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.tracer._push(self)
+        self.start = time.time()
+        self._started = timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.duration = timer() - self._started
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        self.tracer._pop(self)
+        return False
+
+    def to_dict(self):
+        return {'name': self.name, 'phase': self.phase,
+                'span_id': self.span_id, 'parent_id': self.parent_id,
+                'thread_id': self.thread_id, 'start': self.start,
+                'duration': self.duration, 'error': self.error,
+                'attrs': self.attrs}
+
+
+class _NullSpan(object):
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+def start_span(tracer, name, phase, **attrs):
+    """
+    Return a new span on C{tracer} or L{NULL_SPAN} when tracing is off.
+    """
+    if tracer is None:
+        return NULL_SPAN
+    return tracer.span(name, phase, **attrs)
+
+
+class Tracer(object):
+    """
+    Collects finished spans in a bounded buffer.
+
+    @type max_spans: C{int}
+    @param max_spans: Number of finished spans to keep, older spans are
+                      discarded first.
+    """
+
+    def __init__(self, max_spans=100000):
+        self._spans = deque(maxlen=max_spans)
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def span(self, name, phase, **attrs):
+        stack = self._stack()
+        parent_id = stack and stack[-1].span_id or None
+        return Span(self, name, phase, parent_id, attrs)
+
+    def current(self):
+        stack = self._stack()
+        return stack and stack[-1] or None
+
+    def spans(self):
+        self._lock.acquire()
+        try:
+            return list(self._spans)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._spans.clear()
+        finally:
+            self._lock.release()
+
+    def phase_totals(self):
+        """
+        Sum the self time (duration minus the duration of child spans) of
+        all the finished spans by phase.
+
+        @rtype: C{dict}
+        @return: Mapping of phase name to seconds.
+        """
+        spans = self.spans()
+        children = {}
+        for span in spans:
+            if span.parent_id is not None:
+                children[span.parent_id] = children.get(span.parent_id, 0) + \
+                    span.duration
+
+        totals = {}
+        for span in spans:
+            own = span.duration - children.get(span.span_id, 0)
+            totals[span.phase] = totals.get(span.phase, 0) + own
+        return totals
+
+    def export_jsonl(self, fp):
+        """
+        Write one JSON object per finished span to the file object C{fp}.
+        """
+        for span in self.spans():
+            fp.write(json.dumps(span.to_dict()))
+            fp.write('\n')
+
+    def export_chrome(self, fp):
+        """
+        Write the finished spans to C{fp} in the Chrome trace-event format.
+        """
+        pid = os.getpid()
+        events = []
+        for span in self.spans():
+            args = dict(span.attrs)
+            if span.error:
+                args['error'] = span.error
+            events.append({'name': span.name, 'cat': span.phase, 'ph': 'X',
+                           'ts': int(span.start * 1000000),
+                           'dur': int(span.duration * 1000000),
+                           'pid': pid, 'tid': span.thread_id, 'args': args})
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fp)
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _push(self, span):
+        self._stack().append(span)
+
+    def _pop(self, span):
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+        self._lock.acquire()
+        try:
+            self._spans.append(span)
+        finally:
+            self._lock.release()
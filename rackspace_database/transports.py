@@ -0,0 +1,697 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+HTTP transports for L{RackspaceDatabaseConnection}.
+
+A transport hands out C{httplib} style connection objects (C{request},
+C{getresponse}) and decides what happens underneath:
+
+    - C{libcloud} (the default): a new libcloud connection per request,
+      exactly as C{Connection.connect} does it.
+    - C{pooled}: HTTP/1.1 keep-alive connections kept in a per-host pool
+      and shared by every thread using the transport.
+    - C{h2}: a single HTTP/2 connection per host multiplexing all the
+      concurrent requests as streams.  Requires the optional C{h2}
+      package; C{https} endpoints negotiate it with ALPN, C{http} ones use
+      prior knowledge (h2c).
+
+Select one with the C{ex_transport} driver argument, either by name or
+with a L{Transport} instance, which can be shared between drivers.
+"""
+
+import sys
+import errno
+import socket
+import threading
+
+from collections import deque
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+try:
+    import h2.config
+    import h2.events
+    import h2.connection
+    import h2.errors
+    import h2.exceptions
+except ImportError:
+    h2 = None
+
+from libcloud.utils.py3 import httplib, StringIO
+from libcloud.common.base import LibcloudHTTPConnection
+from libcloud.common.base import LibcloudHTTPSConnection
+
+__all__ = [
+    'Transport',
+    'LibcloudTransport',
+    'PooledTransport',
+    'HTTP2Transport',
+    'TRANSPORTS',
+    'get_transport'
+]
+
+# Headers which are meaningless (or forbidden) in HTTP/2
+HOP_BY_HOP_HEADERS = ['connection', 'keep-alive', 'proxy-connection',
+                      'transfer-encoding', 'upgrade', 'host']
+
+# Methods sent again when a reused connection turns out to be closed.  A
+# POST or DELETE may have been acted upon, and is never replayed.
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Errors of a connection reset by the server
+RESET_ERRNOS = (errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED)
+
+# BadStatusLine lines of a connection closed before any byte of the
+# response, depending on the version of httplib
+EMPTY_STATUS_LINES = ('', "''", 'No status line received - the server has '
+                      'closed the connection')
+
+
+def _stale(error):
+    """
+    Return True if C{error} means that the server closed an idle
+    connection: a reset, or the connection closed before any byte of the
+    response.  A timeout does not count.
+    """
+    if isinstance(error, getattr(httplib, 'RemoteDisconnected', ())):
+        return True
+    if isinstance(error, httplib.BadStatusLine):
+        return error.line in EMPTY_STATUS_LINES
+    if isinstance(error, socket.timeout):
+        return False
+    return isinstance(error, socket.error) and error.errno in RESET_ERRNOS
+
+
+class Transport(object):
+    """
+    Base class for the transports.
+    """
+
+    name = None
+
+    def connection(self, host, port, secure, timeout=None):
+        """
+        Return an C{httplib} style connection for a single request.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Close the idle connections held by the transport.
+        """
+        pass
+
+
+class LibcloudTransport(Transport):
+    """
+    One fresh libcloud connection per request.
+
+    @param conn_classes: C{(http, https)} connection classes.
+    """
+
+    name = 'libcloud'
+
+    def __init__(self, conn_classes=None):
+        self.conn_classes = conn_classes or (LibcloudHTTPConnection,
+                                             LibcloudHTTPSConnection)
+
+    def connection(self, host, port, secure, timeout=None):
+        kwargs = {'host': host, 'port': port}
+        if timeout:
+            kwargs['timeout'] = timeout
+        return self.conn_classes[secure](**kwargs)
+
+
+class PooledTransport(LibcloudTransport):
+    """
+    HTTP/1.1 keep-alive connections pooled per C{(host, port, secure)}.
+
+    A connection is checked out for the duration of a request and goes back
+    to the pool once its response has been read.  A C{GET}, C{HEAD} or
+    C{OPTIONS} request failing on a reused connection because the server
+    closed it while it was idle is retried once on a new connection.
+    Other methods, and timeouts, are never retried.
+
+    @param max_idle: Idle connections kept per host.
+
+    @param max_connections: Cap on the connections open at a time, idle
+                            or in use, across all the hosts.  When it is
+                            reached an idle connection to another host is
+                            closed to make room, or the request waits for a
+                            connection to be returned.  C{None} for no cap.
+    """
+
+    name = 'pooled'
+
+    def __init__(self, max_idle=10, conn_classes=None, max_connections=None):
+        super(PooledTransport, self).__init__(conn_classes)
+        self.max_idle = max_idle
+        self.max_connections = max_connections
+        self.stats = {'created': 0, 'reused': 0, 'retried': 0, 'waited': 0}
+        self._pools = {}
+        self._open = 0
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+
+    def connection(self, host, port, secure, timeout=None):
+        return _PooledConnection(self, (host, port, secure), timeout)
+
+    def _checkout(self, key, timeout, reuse=True):
+        evicted = None
+        self._lock.acquire()
+        try:
+            pool = self._pools.get(key)
+            if reuse and pool:
+                self.stats['reused'] += 1
+                return pool.pop(), True
+            while self.max_connections and \
+                    self._open >= self.max_connections:
+                evicted = self._pop_idle()
+                if evicted is not None:
+                    self._open -= 1
+                    break
+                self.stats['waited'] += 1
+                self._released.wait()
+                pool = self._pools.get(key)
+                if reuse and pool:
+                    self.stats['reused'] += 1
+                    return pool.pop(), True
+            self._open += 1
+            self.stats['created'] += 1
+        finally:
+            self._lock.release()
+        if evicted is not None:
+            evicted.close()
+        host, port, secure = key
+        try:
+            return super(PooledTransport, self).connection(host, port, secure,
+                                                           timeout), False
+        except Exception:
+            self._discard(None)
+            raise
+
+    def _pop_idle(self):
+        # Called with the lock held
+        for pool in self._pools.values():
+            if pool:
+                return pool.popleft()
+        return None
+
+    def _checkin(self, key, conn):
+        self._lock.acquire()
+        try:
+            pool = self._pools.setdefault(key, deque())
+            if len(pool) < self.max_idle:
+                pool.append(conn)
+                self._released.notify()
+                return
+        finally:
+            self._lock.release()
+        self._discard(conn)
+
+    def _discard(self, conn):
+        """
+        Close a connection which will not be returned to the pool.
+        """
+        self._lock.acquire()
+        try:
+            self._open -= 1
+            self._released.notify()
+        finally:
+            self._lock.release()
+        if conn is not None:
+            conn.close()
+
+    def idle(self):
+        """
+        Return the number of idle connections in the pools.
+        """
+        self._lock.acquire()
+        try:
+            return sum([len(pool) for pool in self._pools.values()])
+        finally:
+            self._lock.release()
+
+    def open(self):
+        """
+        Return the number of open connections, idle or in use.
+        """
+        return self._open
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            pools = self._pools
+            self._pools = {}
+            for pool in pools.values():
+                self._open -= len(pool)
+            self._released.notifyAll()
+        finally:
+            self._lock.release()
+        for pool in pools.values():
+            for conn in pool:
+                conn.close()
+
+
+class _PooledConnection(object):
+    def __init__(self, transport, key, timeout):
+        self._transport = transport
+        self._key = key
+        self._timeout = timeout
+        self._request = None
+
+    def request(self, method, url, body=None, headers=None):
+        self._request = (method, url, body, headers or {})
+
+    def getresponse(self):
+        conn, reused = self._transport._checkout(self._key, self._timeout)
+        try:
+            response = self._send(conn)
+        except (socket.error, httplib.HTTPException):
+            self._transport._discard(conn)
+            if not reused or not _stale(sys.exc_info()[1]) or \
+                    self._request[0].upper() not in IDEMPOTENT_METHODS:
+                raise
+            self._transport.stats['retried'] += 1
+            conn, reused = self._transport._checkout(self._key,
+                                                     self._timeout,
+                                                     reuse=False)
+            try:
+                response = self._send(conn)
+            except Exception:
+                self._transport._discard(conn)
+                raise
+        return _PooledResponse(response, self._transport, self._key, conn)
+
+    def _send(self, conn):
+        method, url, body, headers = self._request
+        conn.request(method, url, body, headers)
+        return conn.getresponse()
+
+    def close(self):
+        pass
+
+
+class _PooledResponse(object):
+    """
+    Response returning its connection to the pool once fully read.
+    """
+
+    def __init__(self, response, transport, key, conn):
+        self._response = response
+        self._transport = transport
+        self._key = key
+        self._conn = conn
+        self.status = response.status
+        self.reason = response.reason
+        self.version = response.version
+
+    def getheaders(self):
+        return self._response.getheaders()
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def read(self, amt=None):
+        try:
+            if amt is None:
+                data = self._response.read()
+            else:
+                data = self._response.read(amt)
+        except Exception:
+            self._release(False)
+            raise
+        if amt is None or not data or self._response.isclosed():
+            self._release(True)
+        return data
+
+    def _release(self, reusable):
+        conn = self._conn
+        if conn is None:
+            return
+        self._conn = None
+        if reusable and not self._response.will_close:
+            self._transport._checkin(self._key, conn)
+        else:
+            self._transport._discard(conn)
+
+
+class HTTP2Transport(Transport):
+    """
+    One multiplexed HTTP/2 connection per C{(host, port, secure)}.
+
+    @param max_streams: Upper bound of concurrent streams, the server's
+                        C{SETTINGS_MAX_CONCURRENT_STREAMS} applies too.
+    @param verify: Verify the server certificate, defaults to libcloud's
+                   C{VERIFY_SSL_CERT}.
+    """
+
+    name = 'h2'
+
+    def __init__(self, max_streams=100, verify=None):
+        if h2 is None:
+            raise RuntimeError('The h2 transport requires the h2 package')
+        if verify is None:
+            import libcloud.security
+            verify = libcloud.security.VERIFY_SSL_CERT
+        self.max_streams = max_streams
+        self.verify = verify
+        self.stats = {'connections': 0, 'streams': 0}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def connection(self, host, port, secure, timeout=None):
+        return _HTTP2Connection(self, (host, port, secure), timeout)
+
+    def _client(self, key, timeout):
+        self._lock.acquire()
+        try:
+            client = self._clients.get(key)
+            if client is None or client.closed:
+                host, port, secure = key
+                client = _HTTP2Client(host, port, secure, timeout,
+                                      self.max_streams, self.verify)
+                self._clients[key] = client
+                self.stats['connections'] += 1
+            self.stats['streams'] += 1
+            return client
+        finally:
+            self._lock.release()
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            clients = self._clients
+            self._clients = {}
+        finally:
+            self._lock.release()
+        for client in clients.values():
+            client.close()
+
+
+class _HTTP2Connection(object):
+    def __init__(self, transport, key, timeout):
+        self._transport = transport
+        self._key = key
+        self._timeout = timeout
+        self._client = None
+        self._stream_id = None
+
+    def request(self, method, url, body=None, headers=None):
+        self._client = self._transport._client(self._key, self._timeout)
+        self._stream_id = self._client.request(method, url, body,
+                                               headers or {})
+
+    def getresponse(self):
+        return self._client.response(self._stream_id, self._timeout)
+
+    def close(self):
+        pass
+
+
+class _HTTP2Stream(object):
+    def __init__(self):
+        self.status = None
+        self.headers = []
+        self.data = []
+        self.error = None
+        self.done = threading.Event()
+
+
+class _HTTP2Response(object):
+    version = 20
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.reason = httplib.responses.get(status, '')
+        self._headers = headers
+        self._body = StringIO(body)
+
+    def getheaders(self):
+        return list(self._headers)
+
+    def getheader(self, name, default=None):
+        name = name.lower()
+        for key, value in self._headers:
+            if key == name:
+                return value
+        return default
+
+    def read(self, amt=None):
+        if amt is None:
+            return self._body.read()
+        return self._body.read(amt)
+
+
+class _HTTP2Client(object):
+    """
+    A single HTTP/2 connection.  Requests are sent from the calling
+    threads under a lock, a reader thread dispatches the frames received to
+    the streams waiting for them.
+    """
+
+    def __init__(self, host, port, secure, timeout, max_streams, verify):
+        self.host = host
+        self.port = port
+        self.secure = secure
+        self.max_streams = max_streams
+        self.closed = False
+        self._streams = {}
+        self._lock = threading.Lock()
+        self._window = threading.Condition(self._lock)
+
+        sock = socket.create_connection((host, port), timeout)
+        sock.settimeout(None)
+        if secure:
+            sock = self._wrap(sock, host, verify)
+        self._sock = sock
+
+        config = h2.config.H2Configuration(client_side=True)
+        self._conn = h2.connection.H2Connection(config=config)
+        self._conn.initiate_connection()
+        self._sock.sendall(self._conn.data_to_send())
+
+        self._reader = threading.Thread(target=self._read_loop,
+                                        name='h2-%s:%s' % (host, port))
+        self._reader.setDaemon(True)
+        self._reader.start()
+
+    def _wrap(self, sock, host, verify):
+        if ssl is None or not getattr(ssl, 'HAS_ALPN', False):
+            raise RuntimeError('HTTP/2 over TLS requires ALPN support')
+        context = ssl.create_default_context()
+        if not verify:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        context.set_alpn_protocols(['h2'])
+        sock = context.wrap_socket(sock, server_hostname=host)
+        if sock.selected_alpn_protocol() != 'h2':
+            sock.close()
+            raise RuntimeError('%s:%s did not negotiate HTTP/2' %
+                               (host, self.port))
+        return sock
+
+    def request(self, method, url, body, headers):
+        request_headers = [(':method', method), (':path', url),
+                           (':scheme', self.secure and 'https' or 'http'),
+                           (':authority', '%s:%s' % (self.host, self.port))]
+        for name, value in headers.items():
+            name = name.lower()
+            if name not in HOP_BY_HOP_HEADERS:
+                request_headers.append((name, str(value)))
+
+        stream = _HTTP2Stream()
+        self._lock.acquire()
+        try:
+            while not self.closed and self._conn.open_outbound_streams >= \
+                    min(self.max_streams,
+                        self._conn.remote_settings.max_concurrent_streams):
+                self._window.wait()
+            self._check_open()
+            stream_id = self._conn.get_next_available_stream_id()
+            self._streams[stream_id] = stream
+            self._conn.send_headers(stream_id, request_headers,
+                                    end_stream=not body)
+            self._flush()
+
+            while body:
+                window = min(self._conn.local_flow_control_window(stream_id),
+                             self._conn.max_outbound_frame_size)
+                if window <= 0:
+                    self._window.wait()
+                    self._check_open()
+                    continue
+                chunk, body = body[:window], body[window:]
+                self._conn.send_data(stream_id, chunk,
+                                     end_stream=not body)
+                self._flush()
+        finally:
+            self._lock.release()
+        return stream_id
+
+    def response(self, stream_id, timeout=None):
+        stream = self._streams[stream_id]
+        if not stream.done.wait(timeout):
+            self._cancel(stream_id)
+            raise socket.timeout('HTTP/2 stream %d timed out' % (stream_id))
+
+        self._lock.acquire()
+        try:
+            self._streams.pop(stream_id, None)
+        finally:
+            self._lock.release()
+
+        if stream.error is not None:
+            raise stream.error
+        return _HTTP2Response(stream.status, stream.headers,
+                              ''.join(stream.data))
+
+    def _cancel(self, stream_id):
+        """
+        Forget a stream nobody waits for any more and ask the server to
+        stop sending it.
+        """
+        self._lock.acquire()
+        try:
+            self._streams.pop(stream_id, None)
+            if self.closed:
+                return
+            try:
+                self._conn.reset_stream(stream_id,
+                                        h2.errors.ErrorCodes.CANCEL)
+                self._flush()
+            except (h2.exceptions.StreamClosedError, socket.error):
+                # Ended meanwhile, or the reader fails the connection
+                pass
+        finally:
+            self._lock.release()
+
+    def close(self):
+        self._lock.acquire()
+        try:
+            if not self.closed:
+                self._conn.close_connection()
+                try:
+                    self._flush()
+                except socket.error:
+                    pass
+        finally:
+            self._lock.release()
+        self._fail(httplib.HTTPException('HTTP/2 connection closed'))
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self._sock.close()
+
+    def _check_open(self):
+        if self.closed:
+            raise httplib.HTTPException('HTTP/2 connection to %s:%s is '
+                                        'closed' % (self.host, self.port))
+
+    def _flush(self):
+        data = self._conn.data_to_send()
+        if data:
+            self._sock.sendall(data)
+
+    def _read_loop(self):
+        try:
+            while True:
+                data = self._sock.recv(65535)
+                if not data:
+                    raise httplib.HTTPException('HTTP/2 connection closed '
+                                                'by %s:%s' %
+                                                (self.host, self.port))
+                self._lock.acquire()
+                try:
+                    events = self._conn.receive_data(data)
+                    for event in events:
+                        self._handle(event)
+                    self._flush()
+                    self._window.notifyAll()
+                finally:
+                    self._lock.release()
+        except Exception:
+            self._fail(sys.exc_info()[1])
+
+    def _handle(self, event):
+        stream = self._streams.get(getattr(event, 'stream_id', None))
+
+        if isinstance(event, h2.events.ResponseReceived):
+            if stream is None:
+                # Cancelled after a timeout
+                return
+            for name, value in event.headers:
+                if name == ':status':
+                    stream.status = int(value)
+                else:
+                    stream.headers.append((name, value))
+        elif isinstance(event, h2.events.DataReceived):
+            if stream is not None:
+                stream.data.append(event.data)
+            self._conn.acknowledge_received_data(
+                event.flow_controlled_length, event.stream_id)
+        elif isinstance(event, h2.events.StreamEnded):
+            if stream is not None:
+                stream.done.set()
+        elif isinstance(event, h2.events.StreamReset):
+            if stream is not None:
+                stream.error = httplib.HTTPException(
+                    'HTTP/2 stream %d reset (error code %s)' %
+                    (event.stream_id, event.error_code))
+                stream.done.set()
+        elif isinstance(event, h2.events.ConnectionTerminated):
+            raise httplib.HTTPException('HTTP/2 connection terminated '
+                                        '(error code %s)' %
+                                        (event.error_code))
+
+    def _fail(self, error):
+        self._lock.acquire()
+        try:
+            self.closed = True
+            streams = list(self._streams.values())
+            self._window.notifyAll()
+        finally:
+            self._lock.release()
+        for stream in streams:
+            if not stream.done.isSet():
+                stream.error = error
+                stream.done.set()
+
+
+TRANSPORTS = {
+    'libcloud': LibcloudTransport,
+    'pooled': PooledTransport,
+    'h2': HTTP2Transport
+}
+
+
+def get_transport(transport):
+    """
+    Return a L{Transport} instance for C{transport}, a name from
+    L{TRANSPORTS} or an existing instance.
+
+    @raise ValueError: For an unknown name.
+    """
+    if isinstance(transport, Transport):
+        return transport
+    if transport not in TRANSPORTS:
+        raise ValueError('Unknown transport %s, expected one of %s' %
+                         (transport, ', '.join(sorted(TRANSPORTS))))
+    return TRANSPORTS[transport]()
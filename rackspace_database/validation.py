@@ -0,0 +1,136 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Client-side checks of the constraints the API puts on the models.
+
+Each function returns the list of the problems found, empty when the
+model is valid, so that callers decide whether to raise or to set the
+item aside.  The constraints are the documented ones:
+
+    - database names: at most 64 characters, none of C{' " ` ; , \\ /}
+      and no leading or trailing space.
+    - user names: at most 16 characters, none of the above nor
+      C{? # @}.
+    - passwords: none of C{' " ` ; , \\ /} and no space.
+    - character sets and collations: MySQL names, the collation starting
+      with its character set.
+    - instances: a C{flavorRef} and a volume size between 1 and 50 GB.
+
+L{RackspaceDatabaseDriver} runs them before sending a model, unless it was
+created with C{ex_validate=False}, and leaves the invalid items out of the
+bulk calls.  L{DummyDatabaseDriver} rejects the calls they fail, as the API
+does.
+"""
+
+import re
+
+__all__ = [
+    'DATABASE_NAME_MAX_LENGTH',
+    'USER_NAME_MAX_LENGTH',
+    'INSTANCE_NAME_MAX_LENGTH',
+    'MIN_VOLUME_SIZE',
+    'MAX_VOLUME_SIZE',
+    'database_errors',
+    'user_errors',
+    'instance_errors'
+]
+
+DATABASE_NAME_MAX_LENGTH = 64
+USER_NAME_MAX_LENGTH = 16
+INSTANCE_NAME_MAX_LENGTH = 255
+MIN_VOLUME_SIZE = 1
+MAX_VOLUME_SIZE = 50
+
+_FORBIDDEN = '\'"`;,\\/'
+_USER_NAME_FORBIDDEN = _FORBIDDEN + '?#@'
+_CHARSET = re.compile(r'^[a-z0-9]+$')
+_COLLATION = re.compile(r'^[a-z0-9]+_[a-z0-9_]+$')
+
+
+def _name_errors(kind, name, max_length, forbidden):
+    if not name:
+        return ['%s name is required' % (kind)]
+    errors = []
+    if len(name) > max_length:
+        errors.append('%s name %r is longer than %d characters' %
+                      (kind, name, max_length))
+    found = sorted(set([c for c in name if c in forbidden]))
+    if found:
+        errors.append('%s name %r contains %s' % (kind, name,
+                                                   ' '.join(found)))
+    if name != name.strip(' '):
+        errors.append('%s name %r starts or ends with a space' %
+                      (kind, name))
+    return errors
+
+
+def database_errors(database):
+    """
+    @type database: L{Database}
+    @rtype: C{list}
+    """
+    errors = _name_errors('Database', database.name,
+                          DATABASE_NAME_MAX_LENGTH, _FORBIDDEN)
+    character_set, collate = database.character_set, database.collate
+    if character_set and not _CHARSET.match(character_set):
+        errors.append('Invalid character set %r' % (character_set))
+    if collate:
+        if not _COLLATION.match(collate):
+            errors.append('Invalid collation %r' % (collate))
+        elif character_set and not collate.startswith(character_set + '_'):
+            errors.append('Collation %r does not belong to character set %r'
+                          % (collate, character_set))
+    return errors
+
+
+def user_errors(user):
+    """
+    @type user: L{User}
+    @rtype: C{list}
+    """
+    errors = _name_errors('User', user.name, USER_NAME_MAX_LENGTH,
+                          _USER_NAME_FORBIDDEN)
+    if user.password:
+        found = sorted(set([c for c in user.password
+                            if c in _FORBIDDEN + ' ']))
+        if found:
+            # The password itself is never part of the message
+            errors.append('Password of user %r contains %s' %
+                          (user.name, ' '.join([repr(c) for c in found])))
+    return errors
+
+
+def instance_errors(instance):
+    """
+    Check an instance to create, its databases included.
+
+    @type instance: L{Instance}
+    @rtype: C{list}
+    """
+    errors = []
+    if not instance.flavorRef:
+        errors.append('flavorRef is required')
+    size = instance.size
+    if not isinstance(size, (int, long)) or isinstance(size, bool) or \
+            not MIN_VOLUME_SIZE <= size <= MAX_VOLUME_SIZE:
+        errors.append('Volume size must be between %d and %d, got %r' %
+                      (MIN_VOLUME_SIZE, MAX_VOLUME_SIZE, size))
+    if instance.name and len(instance.name) > INSTANCE_NAME_MAX_LENGTH:
+        errors.append('Instance name is longer than %d characters' %
+                      (INSTANCE_NAME_MAX_LENGTH))
+    for database in instance.databases or ():
+        errors.extend(database_errors(database))
+    return errors
@@ -98,6 +98,39 @@ class TestCommand(Command):
         return not res.wasSuccessful()
 
 
+class BenchmarkCommand(Command):
+    description = "run client-side benchmarks"
+    user_options = [
+        ('sizes=', None, 'comma separated fixture sizes'),
+        ('output=', None, 'write the JSON report to this file'),
+        ('compare=', None, 'JSON report to compare the results against'),
+    ]
+
+    def initialize_options(self):
+        THIS_DIR = os.path.abspath(os.path.split(__file__)[0])
+        sys.path.insert(0, THIS_DIR)
+        for test_path in TEST_PATHS:
+            sys.path.insert(0, pjoin(THIS_DIR, test_path))
+        self.sizes = None
+        self.output = None
+        self.compare = None
+
+    def finalize_options(self):
+        pass
+
+    def run(self):
+        from test.benchmarks import bench_rackspace
+
+        argv = []
+        if self.sizes:
+            argv.extend(['--sizes', self.sizes])
+        if self.output:
+            argv.extend(['--output', self.output])
+        if self.compare:
+            argv.extend(['--compare', self.compare])
+        sys.exit(bench_rackspace.main(argv))
+
+
 class Pep8Command(Command):
     description = "run pep8 script"
     user_options = []
@@ -174,6 +207,10 @@ setup(
     author='Rackspace',
     author_email='tyler.kahn@rackspace.com',
     install_requires=['apache-libcloud >= 0.7.1'],
+    extras_require={
+        'http2': ['h2 >= 2.6'],
+        'arrow': ['pyarrow'],
+    },
     packages=[
         'rackspace_database',
         'rackspace_database.drivers',
@@ -185,6 +222,7 @@ setup(
     url='https://github.com/racker/rackspace-database',
     cmdclass={
         'test': TestCommand,
+        'bench': BenchmarkCommand,
         'pep8': Pep8Command,
         'apidocs': ApiDocsCommand,
         'coverage': CoverageCommand
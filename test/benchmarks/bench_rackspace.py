@@ -0,0 +1,427 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Client-side benchmarks for the Rackspace database driver.
+
+The driver talks to L{BenchMockHttp}, which serves synthetic fixtures of a
+configurable size, so the numbers only include the client-side cost
+(request building, response decoding and object mapping).
+
+Usage::
+
+    python -m test.benchmarks.bench_rackspace --sizes 10,1000,100000 \\
+        --output bench.json --compare previous.json
+"""
+
+import gc
+import os
+import sys
+import time
+import platform
+
+from optparse import OptionParser
+from timeit import default_timer as timer
+
+try:
+    import simplejson as json
+except:
+    import json
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from libcloud.utils.py3 import httplib
+
+from rackspace_database import __version__
+from rackspace_database.base import Instance, InstanceStatus, Database
+from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+from rackspace_database.drivers.rackspace import INSTANCE_SUMMARY
+from rackspace_database.index import InstanceIndex
+
+from test import MockHttp
+from test.file_fixtures import FIXTURES_ROOT, FileFixtures
+from test.benchmarks import fixtures
+
+FIXTURES_ROOT.setdefault('database', os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures'))
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+
+class BenchMockHttp(MockHttp):
+    """
+    MockHttp serving the bodies in L{bodies}, keyed by operation name.
+    """
+    auth_fixtures = FileFixtures('database', 'rackspace/auth')
+    json_content_headers = {'content-type': 'application/json; charset=UTF-8'}
+    bodies = {}
+
+    def _ok(self, name):
+        return (httplib.OK, self.bodies[name], self.json_content_headers,
+                httplib.responses[httplib.OK])
+
+    def _v1_1_auth(self, method, url, body, headers):
+        body = self.auth_fixtures.load('_v1_1_tokens.json')
+        return (httplib.OK, body, self.json_content_headers,
+                httplib.responses[httplib.OK])
+
+    def _v1_0_586067_instances_detail(self, method, url, body, headers):
+        return self._ok('list_instances')
+
+    def _v1_0_586067_instances_bench(self, method, url, body, headers):
+        return self._ok('get_instance')
+
+    def _v1_0_586067_instances_bench_databases(self, method, url, body,
+                                               headers):
+        return self._ok('list_databases')
+
+    def _v1_0_586067_instances_bench_users(self, method, url, body, headers):
+        return self._ok('list_users')
+
+    def _v1_0_586067_flavors_detail(self, method, url, body, headers):
+        return self._ok('list_flavors')
+
+
+def get_driver():
+    """
+    Return an authenticated driver wired to L{BenchMockHttp}.
+    """
+    RackspaceDatabaseDriver.connectionCls.conn_classes = (BenchMockHttp,
+                                                          BenchMockHttp)
+    RackspaceDatabaseDriver.connectionCls.auth_url = \
+        'https://auth.api.example.com/v1.1/'
+    driver = RackspaceDatabaseDriver('bench', 'bench')
+    driver.connection._populate_hosts_and_request_paths()
+    return driver
+
+
+def _bench_list_instances(driver, size):
+    BenchMockHttp.bodies['list_instances'] = \
+        fixtures.list_instances_body(size)
+    return driver.list_instances
+
+
+def _bench_list_instances_summary(driver, size):
+    BenchMockHttp.bodies['list_instances'] = \
+        fixtures.list_instances_body(size)
+    return lambda: driver.list_instances(ex_projection=INSTANCE_SUMMARY)
+
+
+def _bench_get_instance(driver, size):
+    BenchMockHttp.bodies['get_instance'] = fixtures.get_instance_body(size)
+    return lambda: driver.get_instance('bench')
+
+
+def _bench_list_databases(driver, size):
+    BenchMockHttp.bodies['list_databases'] = \
+        fixtures.list_databases_body(size)
+    return lambda: driver.list_databases('bench')
+
+
+def _bench_list_users(driver, size):
+    BenchMockHttp.bodies['list_users'] = fixtures.list_users_body(size)
+    return lambda: driver.list_users('bench')
+
+
+def _bench_from_instance(driver, size):
+    instance = Instance(fixtures.flavor(1)['links'][0]['href'], size=2,
+                        name='bench',
+                        databases=[Database(d['name'], d['character_set'],
+                                            d['collate'])
+                                   for d in [fixtures.database(i)
+                                             for i in range(size)]])
+    return lambda: json.dumps({'instance': driver._from_instance(instance)})
+
+
+def _mapper_bench(mapper_name, generator):
+    def setup(driver, size):
+        mapper = getattr(driver, mapper_name)
+        # Round trip through JSON so the keys have the decoded string type
+        objs = json.loads(json.dumps([generator(i) for i in range(size)]))
+        value_dict = {}
+        return lambda: [mapper(obj, value_dict) for obj in objs]
+    return setup
+
+
+def _dict_walk_to_instance(obj, value_dict):
+    """
+    The per-call dict walking instance mapper the compiled schema mappers
+    replaced, kept as the reference point for L{speedups}.
+    """
+    status = InstanceStatus.__dict__[obj['status']]
+    flavorRef = None
+    for link in obj['flavor']['links']:
+        if link['rel'] == 'self':
+            flavorRef = link['href']
+            break
+    rootEnabled = obj.get('rootEnabled')
+    if obj.get('databases'):
+        databases = [Database(d['name'],
+                              character_set=d.get('character_set', None),
+                              collate=d.get('collate', None))
+                     for d in obj.get('databases', [])]
+    else:
+        databases = None
+
+    if obj.get('volume') and obj['volume'].get('size'):
+        size = obj['volume']['size']
+    else:
+        size = None
+
+    return Instance(flavorRef, size=size, id=obj['id'], name=obj['name'],
+                    status=status, rootEnabled=rootEnabled,
+                    databases=databases)
+
+
+def _bench_map_instances(compiled):
+    def setup(driver, size):
+        objs = json.loads(fixtures.list_instances_body(size))['instances']
+        value_dict = {}
+        if compiled:
+            return lambda: driver._to_instance.many(objs, value_dict)
+        return lambda: [_dict_walk_to_instance(obj, value_dict)
+                        for obj in objs]
+    return setup
+
+
+def _bench_query_instances(indexed):
+    def setup(driver, size):
+        objs = json.loads(fixtures.list_instances_body(size))['instances']
+        instances = driver._to_instance.many(objs, {})
+        conditions = {'status': InstanceStatus.ACTIVE, 'min_size': 2}
+        if indexed:
+            index = InstanceIndex(instances)
+            return lambda: index.query(order_by='-size', limit=10,
+                                       **conditions)
+
+        def scan():
+            result = [i for i in instances
+                      if i.status == conditions['status'] and
+                      i.size is not None and i.size >= conditions['min_size']]
+            result.sort(key=lambda i: i.size, reverse=True)
+            return result[:10]
+        return scan
+    return setup
+
+
+BENCHMARKS = [
+    ('list_instances', _bench_list_instances),
+    ('list_instances_summary', _bench_list_instances_summary),
+    ('get_instance', _bench_get_instance),
+    ('list_databases', _bench_list_databases),
+    ('list_users', _bench_list_users),
+    ('from_instance', _bench_from_instance),
+    ('to_instance', _mapper_bench('_to_instance', fixtures.instance)),
+    ('to_database', _mapper_bench('_to_database', fixtures.database)),
+    ('to_flavor', _mapper_bench('_to_flavor', fixtures.flavor)),
+    ('to_user', _mapper_bench('_to_user', fixtures.user)),
+    ('map_instances_dict_walk', _bench_map_instances(False)),
+    ('map_instances_compiled', _bench_map_instances(True)),
+    ('query_instances_scan', _bench_query_instances(False)),
+    ('query_instances_index', _bench_query_instances(True)),
+]
+
+# (baseline, candidate) benchmark pairs reported by L{speedups}
+SPEEDUPS = [
+    ('map_instances_dict_walk', 'map_instances_compiled'),
+    ('list_instances', 'list_instances_summary'),
+    ('query_instances_scan', 'query_instances_index'),
+]
+
+
+def measure(func, min_time=0.2, repeat=3):
+    """
+    Time C{func} and return C{(loops, best, mean)} where C{best} and
+    C{mean} are seconds per call over C{repeat} rounds of C{loops} calls.
+    """
+    func()
+
+    loops = 1
+    while True:
+        start = timer()
+        for _ in range(loops):
+            func()
+        elapsed = timer() - start
+        if elapsed >= min_time / repeat or loops >= 1 << 20:
+            break
+        loops *= 2
+
+    timings = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = timer()
+        for _ in range(loops):
+            func()
+        timings.append((timer() - start) / loops)
+
+    return loops, min(timings), sum(timings) / len(timings)
+
+
+def allocations(func):
+    """
+    Return C{(tracked_objects, peak_bytes)} for a single call of C{func}.
+
+    C{tracked_objects} is the number of gc-tracked objects retained by the
+    result, C{peak_bytes} is the peak traced allocation (C{None} when
+    tracemalloc is not available).
+    """
+    gc.collect()
+    before = len(gc.get_objects())
+    result = func()
+    tracked = len(gc.get_objects()) - before
+    del result
+
+    peak = None
+    if tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = func()
+            peak = tracemalloc.get_traced_memory()[1]
+            del result
+        finally:
+            tracemalloc.stop()
+
+    return tracked, peak
+
+
+def run(sizes=None, names=None, min_time=0.2, repeat=3, out=None):
+    """
+    Run the benchmarks and return a JSON serializable report.
+    """
+    sizes = sizes or DEFAULT_SIZES
+    driver = get_driver()
+    results = []
+
+    for name, setup in BENCHMARKS:
+        if names and name not in names:
+            continue
+
+        for size in sizes:
+            func = setup(driver, size)
+            loops, best, mean = measure(func, min_time=min_time,
+                                        repeat=repeat)
+            tracked, peak = allocations(func)
+            result = {'name': name, 'size': size, 'loops': loops,
+                      'best': best, 'mean': mean,
+                      'ops_per_sec': 1.0 / best,
+                      'items_per_sec': size / best,
+                      'tracked_objects': tracked, 'peak_bytes': peak}
+            results.append(result)
+
+            if out is not None:
+                out.write('%-16s %8d %12.6fs %14.0f items/s %10d objects\n' %
+                          (name, size, best, result['items_per_sec'],
+                           tracked))
+
+    return {'version': __version__,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'timestamp': int(time.time()),
+            'results': results}
+
+
+def compare(baseline, current, tolerance=0.1):
+    """
+    Compare two reports and return the regressions.
+
+    @rtype: C{list}
+    @return: C{(name, size, baseline_best, current_best)} tuples for every
+             benchmark which got slower by more than C{tolerance}.
+    """
+    previous = dict([((r['name'], r['size']), r['best'])
+                     for r in baseline['results']])
+    regressions = []
+    for result in current['results']:
+        key = (result['name'], result['size'])
+        if key in previous and \
+                result['best'] > previous[key] * (1 + tolerance):
+            regressions.append((key[0], key[1], previous[key],
+                                result['best']))
+    return regressions
+
+
+def speedups(report):
+    """
+    Return C{(baseline, candidate, size, ratio)} tuples for the L{SPEEDUPS}
+    pairs present in C{report}, C{ratio} being how many times faster the
+    candidate is.
+    """
+    best = dict([((r['name'], r['size']), r['best'])
+                 for r in report['results']])
+    result = []
+    for baseline, candidate in SPEEDUPS:
+        for (name, size), value in sorted(best.items()):
+            if name == baseline and (candidate, size) in best:
+                result.append((baseline, candidate, size,
+                               value / best[(candidate, size)]))
+    return result
+
+
+def main(argv=None):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                      help='comma separated fixture sizes '
+                           '(default: %default)')
+    parser.add_option('--only', default=None,
+                      help='comma separated benchmark names to run')
+    parser.add_option('--min-time', type='float', default=0.2,
+                      help='minimum seconds spent per benchmark')
+    parser.add_option('--repeat', type='int', default=3)
+    parser.add_option('--output', default=None,
+                      help='write the JSON report to this file')
+    parser.add_option('--compare', default=None,
+                      help='JSON report to compare the results against')
+    parser.add_option('--tolerance', type='float', default=0.1,
+                      help='allowed slowdown ratio before failing '
+                           '(default: %default)')
+    options, args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in options.sizes.split(',')]
+    names = options.only and options.only.split(',') or None
+    report = run(sizes=sizes, names=names, min_time=options.min_time,
+                 repeat=options.repeat, out=sys.stdout)
+
+    for baseline, candidate, size, ratio in speedups(report):
+        sys.stdout.write('SPEEDUP %s -> %s[%d]: %.2fx\n' %
+                         (baseline, candidate, size, ratio))
+
+    if options.output:
+        fp = open(options.output, 'w')
+        try:
+            json.dump(report, fp, indent=2)
+        finally:
+            fp.close()
+
+    if options.compare:
+        fp = open(options.compare)
+        try:
+            baseline = json.load(fp)
+        finally:
+            fp.close()
+        regressions = compare(baseline, report, options.tolerance)
+        for name, size, before, after in regressions:
+            sys.stdout.write('REGRESSION %s[%d]: %.6fs -> %.6fs\n' %
+                             (name, size, before, after))
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Synthetic fixtures shaped like the ones in test/fixtures/rackspace/v1.0,
+# scaled to an arbitrary number of elements.
+
+try:
+    import simplejson as json
+except:
+    import json
+
+BASE_URL = 'http://ord.databases.api.rackspacecloud.com'
+ACCOUNT_ID = '586067'
+
+STATUSES = ['ACTIVE', 'ACTIVE', 'ACTIVE', 'BUILD', 'SHUTDOWN', 'RESIZE']
+
+
+def _links(path):
+    return [
+        {'href': '%s/v1.0/%s/%s' % (BASE_URL, ACCOUNT_ID, path),
+         'rel': 'self'},
+        {'href': '%s/%s' % (BASE_URL, path), 'rel': 'bookmark'}
+    ]
+
+
+def flavor(i):
+    flavor_id = i % 4 + 1
+    return {'id': flavor_id,
+            'name': 'm1.flavor%d' % (flavor_id),
+            'vcpus': 1,
+            'ram': 512 * 2 ** (flavor_id - 1),
+            'links': _links('flavors/%d' % (flavor_id))}
+
+
+def database(i):
+    return {'name': 'database_%06d' % (i),
+            'character_set': 'utf8',
+            'collate': 'utf8_general_ci'}
+
+
+def user(i):
+    return {'name': 'user_%06d' % (i)}
+
+
+def instance(i, databases=0):
+    instance_id = '%08x' % (i)
+    data = {'id': instance_id,
+            'name': 'instance_%06d' % (i),
+            'status': STATUSES[i % len(STATUSES)],
+            'created': '2012-01-19T22:20:49Z',
+            'updated': '2012-01-19T22:21:12Z',
+            'hostname': '%040x.rackspaceclouddb.com' % (i),
+            'links': _links('instances/%s' % (instance_id)),
+            'flavor': {'id': str(i % 4 + 1),
+                       'links': _links('flavors/%d' % (i % 4 + 1))},
+            'volume': {'size': i % 50 + 1}}
+    if databases:
+        data['databases'] = [database(n) for n in range(databases)]
+        data['rootEnabled'] = False
+    return data
+
+
+def list_instances_body(count):
+    return json.dumps({'instances': [instance(i) for i in range(count)]})
+
+
+def get_instance_body(databases):
+    return json.dumps({'instance': instance(0, databases=databases)})
+
+
+def list_databases_body(count):
+    return json.dumps({'databases': [database(i) for i in range(count)]})
+
+
+def list_users_body(count):
+    return json.dumps({'users': [user(i) for i in range(count)]})
+
+
+def list_flavors_body(count):
+    return json.dumps({'flavors': [flavor(i) for i in range(count)]})
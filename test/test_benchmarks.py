@@ -0,0 +1,54 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import unittest
+try:
+    import simplejson as json
+except:
+    import json
+
+from test.benchmarks import fixtures, bench_rackspace
+
+
+class FixturesTests(unittest.TestCase):
+    def test_list_instances_body(self):
+        body = json.loads(fixtures.list_instances_body(25))
+        self.assertEqual(len(body['instances']), 25)
+        self.assertEqual(len(set([i['id'] for i in body['instances']])), 25)
+
+    def test_get_instance_body(self):
+        body = json.loads(fixtures.get_instance_body(7))
+        self.assertEqual(len(body['instance']['databases']), 7)
+
+
+class BenchmarkTests(unittest.TestCase):
+    def test_run_and_compare(self):
+        report = bench_rackspace.run(sizes=[5], min_time=0.001, repeat=1)
+        names = [r['name'] for r in report['results']]
+        self.assertEqual(names, [b[0] for b in bench_rackspace.BENCHMARKS])
+        json.dumps(report)
+
+        self.assertEqual(bench_rackspace.compare(report, report), [])
+
+        slower = json.loads(json.dumps(report))
+        slower['results'][0]['best'] *= 10
+        regressions = bench_rackspace.compare(report, slower)
+        self.assertEqual(len(regressions), 1)
+        self.assertEqual(regressions[0][:2], (names[0], 5))
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
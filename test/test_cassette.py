@@ -0,0 +1,101 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+from libcloud.common.base import LibcloudHTTPConnection
+from libcloud.common.base import LibcloudHTTPSConnection
+
+from rackspace_database.base import User
+from rackspace_database.cassette import (Cassette, CassetteError, REDACTED,
+                                         redact)
+from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+from rackspace_database.standin import StandInServer
+
+
+class CassetteTests(unittest.TestCase):
+    def setUp(self):
+        RackspaceDatabaseDriver.connectionCls.conn_classes = (
+                LibcloudHTTPConnection, LibcloudHTTPSConnection)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _record(self, **server_kwargs):
+        cassette = Cassette()
+        server = StandInServer(**server_kwargs).start()
+        try:
+            instance_id = server.add_instance('recorded', databases=['db'])
+            driver = RackspaceDatabaseDriver('user', 'secret-key',
+                                             ex_record=cassette,
+                                             ex_compression=True,
+                                             **server.driver_kwargs())
+            instances = driver.list_instances()
+            driver.create_user(instance_id, User('bob', 'hunter2'), [])
+            driver.enable_root(instance_id)
+        finally:
+            server.stop()
+        return cassette, instances, instance_id
+
+    def test_redact(self):
+        self.assertEqual(redact({'users': [{'name': 'a', 'password': 'p'}]}),
+                         {'users': [{'name': 'a', 'password': REDACTED}]})
+
+    def test_record_and_replay(self):
+        cassette, instances, instance_id = self._record(latency=0.05)
+        self.assertEqual(len(cassette), 3)
+        self.assertTrue(cassette.base_url.endswith('/v1.0/586067'))
+        self.assertTrue(cassette.interactions[0]['elapsed'] >= 0.05)
+
+        path = os.path.join(self.directory, 'cassette.jsonl.gz')
+        cassette.save(path)
+        content = open(path, 'rb').read()
+        import gzip
+        text = gzip.open(path).read()
+        for secret in ('secret-key', 'hunter2'):
+            self.assertFalse(secret in text)
+        self.assertTrue(len(content) < len(text))
+
+        loaded = Cassette.load(path)
+        self.assertEqual(loaded.base_url, cassette.base_url)
+        start = time.time()
+        driver = RackspaceDatabaseDriver('user', 'key',
+                                         **loaded.driver_kwargs(speed=1))
+        replayed = driver.list_instances()
+        self.assertTrue(time.time() - start >= 0.05)
+        self.assertEqual([(i.id, i.name, i.status) for i in replayed],
+                         [(i.id, i.name, i.status) for i in instances])
+        self.assertEqual(driver.enable_root(instance_id).password, REDACTED)
+        self.assertRaises(CassetteError, driver.get_instance, instance_id)
+
+    def test_replay_without_delay(self):
+        cassette, instances, instance_id = self._record(latency=0.2)
+        kwargs = cassette.driver_kwargs(speed=0, repeat=False)
+        driver = RackspaceDatabaseDriver('user', 'key', **kwargs)
+        start = time.time()
+        self.assertEqual(len(driver.list_instances()), 1)
+        self.assertTrue(time.time() - start < 0.1)
+        self.assertRaises(CassetteError, driver.list_instances)
+        self.assertEqual(kwargs['ex_transport'].stats['served'], 1)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
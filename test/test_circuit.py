@@ -0,0 +1,195 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import socket
+import unittest
+
+from libcloud.common.base import LibcloudHTTPConnection
+from libcloud.common.base import LibcloudHTTPSConnection
+from libcloud.common.types import MalformedResponseError
+
+from rackspace_database.circuit import (CircuitBreaker, CircuitBreakers,
+                                        CircuitOpenError, CLOSED, OPEN,
+                                        HALF_OPEN)
+from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+from rackspace_database.metrics import MetricsRegistry
+from rackspace_database.standin import StandInServer
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.events = []
+        self.breaker = CircuitBreaker(
+            'api', failure_rate=0.5, window=4, min_calls=4, open_duration=10,
+            probes=2, clock=self.clock,
+            listener=lambda b, old, new, duration:
+                self.events.append((old, new)))
+
+    def _call(self, failed, duration=0.01):
+        self.breaker.before_call()
+        self.breaker.record(duration, failed)
+
+    def test_opens_on_error_rate(self):
+        self._call(True)
+        self._call(False)
+        self._call(True)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self._call(False)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.events, [(CLOSED, OPEN)])
+
+        self.clock.now = 5
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            e = sys.exc_info()[1]
+            self.assertEqual(e.retry_after, 5)
+            self.assertEqual(e.key, 'api')
+        else:
+            self.fail('CircuitOpenError not raised')
+        self.assertEqual(self.breaker.stats['rejected'], 1)
+
+    def test_half_open_probes(self):
+        for _ in range(4):
+            self._call(True)
+        self.clock.now = 10
+        self.breaker.before_call()
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        # Only two probes at a time
+        self.assertRaises(CircuitOpenError, self.breaker.before_call)
+        self.breaker.record(0.01, False)
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.breaker.record(0.01, False)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.events, [(CLOSED, OPEN), (OPEN, HALF_OPEN),
+                                       (HALF_OPEN, CLOSED)])
+
+    def test_failed_probe_reopens(self):
+        for _ in range(4):
+            self._call(True)
+        self.clock.now = 10
+        self._call(True)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.opened_at, 10)
+        self.assertEqual(self.breaker.stats['opened'], 2)
+
+    def test_opens_on_latency(self):
+        breaker = CircuitBreaker('api', slow_call_duration=1,
+                                 slow_call_rate=0.75, window=4, min_calls=4)
+        for duration in (2, 2, 0.1, 2):
+            breaker.before_call()
+            breaker.record(duration, False)
+        self.assertEqual(breaker.state, OPEN)
+        self.assertEqual(breaker.snapshot()['slow_calls'], 3)
+
+
+class ConnectionCircuitBreakerTests(unittest.TestCase):
+    def setUp(self):
+        RackspaceDatabaseDriver.connectionCls.conn_classes = (
+                LibcloudHTTPConnection, LibcloudHTTPSConnection)
+        self.server = StandInServer(error_codes=(503,)).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_fails_fast_while_open(self):
+        metrics = MetricsRegistry()
+        breakers = CircuitBreakers(metrics=metrics, failure_rate=1.0,
+                                   min_calls=3, window=3,
+                                   open_duration=60)
+        changes = []
+        breakers.add_listener(lambda b, old, new: changes.append(new))
+        driver = RackspaceDatabaseDriver('user', 'key',
+                                         ex_circuit_breaker=breakers,
+                                         **self.server.driver_kwargs())
+        instance_id = self.server.add_instance('a')
+
+        # Client errors do not count against the endpoint
+        for _ in range(3):
+            self.assertRaises(Exception, driver.get_instance, 'missing')
+        driver.get_instance(instance_id)
+
+        self.server.error_rate = 1.0
+        for _ in range(3):
+            self.assertRaises(Exception, driver.list_instances)
+        requests = dict(self.server.stats)
+        self.assertRaises(CircuitOpenError, driver.list_instances)
+        self.assertEqual(self.server.stats, requests)
+
+        self.assertEqual(changes, [OPEN])
+        snapshot = breakers.snapshot()
+        self.assertEqual(len(snapshot), 1)
+        self.assertEqual(snapshot[0]['state'], OPEN)
+        self.assertEqual(snapshot[0]['rejected'], 1)
+        self.assertTrue(snapshot[0]['key'].endswith('/ord'))
+        series = [s for s in metrics.snapshot()['series']
+                  if s['kind'] == 'circuit']
+        self.assertEqual([(s['status'], s['count']) for s in series],
+                         [(OPEN, 1)])
+
+    def test_only_server_and_network_errors_count(self):
+        breakers = CircuitBreakers(failure_rate=1.0, min_calls=3, window=3,
+                                   open_duration=60)
+        driver = RackspaceDatabaseDriver('user', 'key',
+                                         ex_circuit_breaker=breakers,
+                                         **self.server.driver_kwargs())
+        driver.list_instances()
+        connection = driver.connection
+        errors = []
+
+        def request(*args):
+            raise errors.pop(0)
+
+        connection._request = request
+        errors.extend([MalformedResponseError('Failed to parse JSON',
+                                              body='<html>'),
+                       KeyError('status'), ValueError('decode')])
+        for _ in range(3):
+            self.assertRaises(Exception, driver.list_instances)
+        [breaker] = breakers.snapshot()
+        self.assertEqual(breaker['state'], CLOSED)
+
+        errors.extend([socket.error(104, 'Connection reset by peer'),
+                       socket.timeout('timed out'),
+                       Exception({'serviceUnavailable': {'code': 503}})])
+        for _ in range(3):
+            self.assertRaises(Exception, driver.list_instances)
+        [breaker] = breakers.snapshot()
+        self.assertEqual(breaker['state'], OPEN)
+
+    def test_disabled_by_default(self):
+        driver = RackspaceDatabaseDriver('user', 'key',
+                                         **self.server.driver_kwargs())
+        self.assertEqual(driver.connection.circuit_breakers, None)
+        driver = RackspaceDatabaseDriver('user', 'key',
+                                         ex_circuit_breaker={'min_calls': 1},
+                                         **self.server.driver_kwargs())
+        breakers = driver.connection.circuit_breakers
+        self.assertEqual(breakers.settings, {'min_calls': 1})
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
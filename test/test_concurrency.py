@@ -0,0 +1,159 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import time
+import socket
+import httplib
+import threading
+import unittest
+
+from rackspace_database.concurrency import AdaptiveLimiter, bounded_map
+from rackspace_database.concurrency import shared_limiter
+
+
+class AdaptiveLimiterTests(unittest.TestCase):
+    def setUp(self):
+        self.now = [0.0]
+        self.limiter = AdaptiveLimiter(initial=4, max_limit=16,
+                                       clock=lambda: self.now[0])
+
+    def calls(self, count, latency=0.1, error=None):
+        for _ in range(count):
+            self.limiter.acquire()
+            self.now[0] += latency
+            self.limiter.release(latency, error)
+
+    def test_additive_increase(self):
+        # About one more per round of limit calls
+        self.calls(23)
+        self.assertEqual(self.limiter.snapshot()['limit'], 7)
+        self.calls(1)
+        self.assertEqual(self.limiter.snapshot()['limit'], 8)
+        self.calls(500)
+        snapshot = self.limiter.snapshot()
+        self.assertEqual(snapshot['limit'], 16)
+        self.assertEqual(snapshot['in_flight'], 0)
+        self.assertEqual(snapshot['decreases'], 0)
+        self.assertAlmostEqual(snapshot['latency'], 0.1)
+        self.assertAlmostEqual(snapshot['baseline'], 0.1)
+        self.assertEqual([int(limit) for _, limit in self.limiter.history],
+                         range(4, 17))
+
+    def test_multiplicative_decrease(self):
+        self.calls(500)
+        throttled = Exception({'overLimit': {'code': 413, 'message': ''}})
+        for _ in range(3):
+            self.limiter.acquire()
+        self.assertEqual(self.limiter.snapshot()['in_flight'], 3)
+
+        self.limiter.release(0.1, throttled)
+        self.assertEqual(self.limiter.snapshot()['limit'], 8)
+        # A call which was in flight with it does not cut it again
+        self.now[0] += 0.05
+        self.limiter.release(0.1, throttled)
+        self.assertEqual(self.limiter.snapshot()['limit'], 8)
+        # One round trip later it does
+        self.now[0] += 0.1
+        self.limiter.release(0.1, Exception({'serviceUnavailable':
+                                             {'code': 503, 'message': ''}}))
+        snapshot = self.limiter.snapshot()
+        self.assertEqual(snapshot['limit'], 4)
+        self.assertEqual(snapshot['in_flight'], 0)
+        self.assertEqual(snapshot['throttled'], 2)
+        self.assertEqual(snapshot['errors'], 1)
+        self.assertEqual(snapshot['decreases'], 2)
+
+        self.calls(1000, error=throttled)
+        self.assertEqual(self.limiter.snapshot()['limit'], 1)
+
+    def test_network_errors(self):
+        self.calls(500)
+        self.calls(1, error=socket.timeout('timed out'))
+        self.calls(1, error=socket.error(104, 'Connection reset by peer'))
+        self.calls(1, error=httplib.BadStatusLine(''))
+        snapshot = self.limiter.snapshot()
+        self.assertEqual(snapshot['limit'], 2)
+        self.assertEqual(snapshot['errors'], 3)
+
+    def test_local_errors_are_not_congestion(self):
+        self.calls(500)
+        validation = Exception('Invalid database')
+        validation.code = 400
+        for error in [KeyError('id'), ValueError('size'), validation,
+                      Exception('boom'),
+                      Exception({'itemNotFound': {'code': 404,
+                                                  'message': ''}})]:
+            self.calls(1, error=error)
+        snapshot = self.limiter.snapshot()
+        self.assertEqual(snapshot['limit'], 16)
+        self.assertEqual(snapshot['decreases'], 0)
+        self.assertEqual(snapshot['errors'], 0)
+
+    def test_latency_rise(self):
+        self.calls(500, latency=0.1)
+        self.calls(10, latency=0.5)
+        snapshot = self.limiter.snapshot()
+        self.assertTrue(snapshot['limit'] < 16)
+        self.assertTrue(snapshot['latency_rises'] >= 1)
+        self.assertEqual(snapshot['throttled'], 0)
+
+    def test_converges_below_capacity(self):
+        # Latency grows with the calls in flight past 6 of them
+        for _ in range(2000):
+            latency = 0.1 * max(1, self.limiter.limit / 6.0) ** 2
+            self.calls(1, latency=latency)
+        self.assertTrue(3 <= self.limiter.snapshot()['limit'] <= 9)
+
+    def test_bounded_map(self):
+        limiter = AdaptiveLimiter(initial=2, max_limit=3)
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+
+        def work(value):
+            lock.acquire()
+            try:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            finally:
+                lock.release()
+            time.sleep(0.01)
+            lock.acquire()
+            try:
+                state['running'] -= 1
+            finally:
+                lock.release()
+            return value
+
+        tasks = bounded_map(work, range(30), concurrency=limiter)
+        self.assertEqual([t.value for t in tasks], range(30))
+        self.assertTrue(2 <= state['peak'] <= 3)
+        self.assertEqual(limiter.snapshot()['calls'], 30)
+
+    def test_shared_limiter(self):
+        class Driver(object):
+            pass
+
+        driver = Driver()
+        limiter = shared_limiter(driver, initial=2)
+        self.assertTrue(shared_limiter(driver) is limiter)
+        self.assertFalse(shared_limiter(Driver()) is limiter)
+        self.assertEqual(limiter.snapshot()['limit'], 2)
+        self.assertRaises(ValueError, AdaptiveLimiter, initial=8,
+                          max_limit=4)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,219 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import json
+import time
+import threading
+import unittest
+
+from StringIO import StringIO
+
+from libcloud.common.base import LibcloudHTTPConnection
+from libcloud.common.base import LibcloudHTTPSConnection
+
+from rackspace_database.base import Instance, User, InstanceStatus
+from rackspace_database import crawler as crawler_module
+from rackspace_database.concurrency import AdaptiveLimiter, WorkerPool
+from rackspace_database.crawler import FleetCrawler
+from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+from rackspace_database.standin import StandInServer
+
+
+class _Connection(object):
+    def __init__(self, host):
+        self.host = host
+        self.port = 443
+
+
+class SlowDriver(object):
+    """
+    Fake driver recording the peak number of calls in flight.
+    """
+    def __init__(self, host, count, delay=0.02):
+        self.connection = _Connection(host)
+        self.count = count
+        self.delay = delay
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        self._lock.acquire()
+        try:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        finally:
+            self._lock.release()
+        time.sleep(self.delay)
+        self._lock.acquire()
+        try:
+            self.running -= 1
+        finally:
+            self._lock.release()
+
+    def list_instances(self):
+        return [Instance('flavor', id=str(i), name='i%d' % (i),
+                         status=InstanceStatus.ACTIVE, size=1)
+                for i in range(self.count)]
+
+    def list_databases(self, instance_id):
+        self._enter()
+        return []
+
+    def list_users(self, instance_id):
+        self._enter()
+        if instance_id == '1':
+            raise Exception('boom')
+        return [User('root')]
+
+    def has_root_enabled(self, instance_id):
+        self._enter()
+        return instance_id == '0'
+
+
+class RecordingPool(WorkerPool):
+    """
+    Worker pool recording the exceptions raised on its worker threads.
+    """
+    pools = []
+
+    def __init__(self, *args, **kwargs):
+        WorkerPool.__init__(self, *args, **kwargs)
+        self.errors = []
+        RecordingPool.pools.append(self)
+
+    def _work(self):
+        try:
+            WorkerPool._work(self)
+        except Exception:
+            self.errors.append(sys.exc_info()[1])
+
+
+class FleetCrawlerTests(unittest.TestCase):
+    def setUp(self):
+        RecordingPool.pools = []
+        crawler_module.WorkerPool = RecordingPool
+
+    def tearDown(self):
+        crawler_module.WorkerPool = WorkerPool
+        # The calls running when a crawl was closed finish, the waiting
+        # ones are dropped, and no worker thread raises
+        for pool in RecordingPool.pools:
+            for thread in pool._threads:
+                thread.join(5)
+            self.assertEqual(pool.errors, [])
+
+    def test_per_host_limit(self):
+        first = SlowDriver('a', 8)
+        second = SlowDriver('b', 8)
+        crawler = FleetCrawler([first, second], concurrency=8, per_host=2)
+        records = list(crawler.crawl())
+
+        self.assertEqual(len(records), 16)
+        self.assertEqual(first.peak, 2)
+        self.assertEqual(second.peak, 2)
+        self.assertEqual(crawler.stats['errors'], 2)
+
+        by_id = dict([((r['host'], r['id']), r) for r in records])
+        self.assertEqual(by_id[('a:443', '0')]['root_enabled'], True)
+        self.assertEqual(by_id[('a:443', '0')]['users'], ['root'])
+        self.assertEqual(by_id[('a:443', '0')]['status'], 'ACTIVE')
+        self.assertEqual(by_id[('b:443', '1')]['users'], None)
+        self.assertEqual(by_id[('b:443', '1')]['errors'], {'users': 'boom'})
+
+    def test_slow_host_does_not_take_the_workers(self):
+        slow = SlowDriver('a', 40, delay=0.2)
+        fast = SlowDriver('b', 40, delay=0.02)
+        crawler = FleetCrawler([slow, fast], concurrency=16, per_host=8)
+        records = crawler.crawl()
+        hosts = set()
+        for record in records:
+            hosts.add(record['host'])
+            if record['host'] == 'a:443':
+                break
+        records.close()
+
+        self.assertEqual(slow.peak, 8)
+        # The calls waiting for the slow host do not hold workers
+        self.assertEqual(fast.peak, 16 - 8)
+        self.assertEqual(hosts, set(['a:443', 'b:443']))
+
+    def test_close_early(self):
+        slow = SlowDriver('a', 20, delay=0.05)
+        crawler = FleetCrawler(slow, concurrency=4, per_host=2)
+        records = crawler.crawl()
+        records.next()
+        records.close()
+
+        [pool] = RecordingPool.pools
+        for thread in pool._threads:
+            thread.join(5)
+        self.assertEqual(pool.errors, [])
+        self.assertEqual(slow.running, 0)
+
+    def test_adaptive_limit(self):
+        driver = SlowDriver('a', 8)
+        limiter = AdaptiveLimiter(initial=2, max_limit=3)
+        crawler = FleetCrawler(driver, concurrency=limiter, per_host=8)
+        records = list(crawler.crawl())
+
+        self.assertEqual(len(records), 8)
+        self.assertEqual(crawler.concurrency, 3)
+        self.assertTrue(driver.peak <= 3)
+        snapshot = limiter.snapshot()
+        self.assertEqual(snapshot['calls'], 24)
+        # The failing list_users call raises no network error
+        self.assertEqual(snapshot['errors'], 0)
+        self.assertEqual(crawler.stats['errors'], 1)
+
+    def test_bounded_pending(self):
+        crawler = FleetCrawler(SlowDriver('a', 20, delay=0), concurrency=2,
+                               max_pending=3)
+        records = crawler.crawl()
+        self.assertEqual(records.next()['host'], 'a:443')
+        records.close()
+
+    def test_crawl_standin(self):
+        RackspaceDatabaseDriver.connectionCls.conn_classes = (
+                LibcloudHTTPConnection, LibcloudHTTPSConnection)
+        server = StandInServer(latency=0.02).start()
+        try:
+            for i in range(10):
+                server.add_instance('crawl_%d' % (i), databases=['db%d' % (i)],
+                                    users=['user'])
+            driver = RackspaceDatabaseDriver('user', 'key',
+                                             **server.driver_kwargs())
+            crawler = FleetCrawler(driver, concurrency=10, per_host=10)
+            output = StringIO()
+            start = time.time()
+            count = crawler.write_jsonl(output)
+            elapsed = time.time() - start
+        finally:
+            server.stop()
+
+        self.assertEqual(count, 10)
+        records = [json.loads(line) for line in
+                   output.getvalue().splitlines()]
+        self.assertEqual(sorted([r['databases'][0] for r in records]),
+                         ['db%d' % (i) for i in range(10)])
+        self.assertEqual(set([r['root_enabled'] for r in records]),
+                         set([False]))
+        # 31 calls of 20ms each when made one after the other
+        self.assertTrue(elapsed < 0.4)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
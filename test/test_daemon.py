@@ -0,0 +1,223 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+import socket
+import shutil
+import tempfile
+import threading
+import unittest
+
+from rackspace_database.base import Instance, InstanceStatus, Database, \
+    status_code
+from rackspace_database.crawler import INSTANCE_COLUMNS
+from rackspace_database.daemon import DriverDaemon, DaemonDriver, \
+    DaemonError, DaemonBusyError, HEADER, VERSION, REQUEST, BATCH, \
+    RESPONSE, read_frame, write_frame
+from rackspace_database.drivers.dummy import DummyDatabaseDriver
+
+
+class SlowDummyDriver(DummyDatabaseDriver):
+    def list_instances(self, ex_projection=None):
+        time.sleep(0.05)
+        return super(SlowDummyDriver, self).list_instances(ex_projection)
+
+
+class DaemonTestCase(unittest.TestCase):
+    driver_class = DummyDatabaseDriver
+    daemon_kwargs = {}
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'daemon.sock')
+        self.backend = self.driver_class()
+        self.instance_id = self.backend.ex_add_instance(
+            'db', size=2, databases=['app'], users=['bob'])
+        self.daemon = DriverDaemon(self.backend, self.path,
+                                   **self.daemon_kwargs).start()
+        self.driver = DaemonDriver(self.path)
+
+    def tearDown(self):
+        self.driver.close()
+        self.daemon.stop()
+        shutil.rmtree(self.directory)
+
+
+class DaemonDriverTests(DaemonTestCase):
+    def test_calls(self):
+        instances = self.driver.list_instances()
+        self.assertEqual([(i.id, i.name, i.size) for i in instances],
+                         [(self.instance_id, 'db', 2)])
+        instance = self.driver.get_instance(self.instance_id)
+        self.assertEqual(instance.status, InstanceStatus.ACTIVE)
+        self.assertEqual([d.name for d in instance.databases], ['app'])
+        self.assertEqual(oct(os.stat(self.path).st_mode & 0777), '0600')
+
+        row = self.driver.list_instances(ex_projection=INSTANCE_COLUMNS)[0]
+        self.assertEqual((row.id, row.size), (self.instance_id, 2))
+        self.assertEqual(self.driver.get_flavor(2, ex_projection=('name',)),
+                         ('m1.small',))
+
+        created = self.driver.create_instance(Instance(
+            self.driver.list_flavors()[0].href, name='new', size=1))
+        self.assertEqual(created.name, 'new')
+        self.assertEqual(self.driver.enable_root(created.id).name, 'root')
+        self.assertTrue(self.driver.has_root_enabled(created.id))
+
+    def test_errors(self):
+        try:
+            self.driver.create_database(self.instance_id, Database('app'))
+        except Exception:
+            self.assertEqual(status_code(sys.exc_info()[1]), 409)
+        else:
+            self.fail('create_database did not raise')
+        try:
+            self.driver.get_instance('missing')
+        except Exception:
+            self.assertEqual(status_code(sys.exc_info()[1]), 404)
+        else:
+            self.fail('get_instance did not raise')
+
+    def test_batch(self):
+        results = self.driver.ex_batch([
+            ('list_databases', [self.instance_id]),
+            ('list_users', [self.instance_id]),
+            ('get_instance', ['missing']),
+            ('has_root_enabled', [self.instance_id], {})])
+        self.assertEqual([d.name for d in results[0]], ['app'])
+        self.assertEqual([u.name for u in results[1]], ['bob'])
+        self.assertEqual(status_code(results[2]), 404)
+        self.assertEqual(results[3], False)
+        self.assertEqual(self.daemon.stats['batches'], 1)
+        self.assertEqual(self.driver.ex_batch([]), [])
+
+    def test_cache_is_cleared_by_writes(self):
+        self.driver.list_databases(self.instance_id)
+        self.driver.list_databases(self.instance_id)
+        self.assertEqual(self.daemon.stats['cache_hits'], 1)
+        self.driver.create_database(self.instance_id, Database('other'))
+        self.assertEqual([d.name for d in
+                          self.driver.list_databases(self.instance_id)],
+                         ['app', 'other'])
+
+    def test_unknown_method(self):
+        self.assertRaises(DaemonError, self.driver._call, 'connect', (), {})
+
+    def test_shared_by_threads(self):
+        errors = []
+
+        def run():
+            try:
+                for _ in range(20):
+                    self.driver.get_instance(self.instance_id)
+            except Exception:
+                errors.append(sys.exc_info()[1])
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.daemon.stats['connections'], 8)
+
+
+class DaemonMalformedRequestTests(DaemonTestCase):
+    def setUp(self):
+        super(DaemonMalformedRequestTests, self).setUp()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(5)
+        self.sock.connect(self.path)
+
+    def tearDown(self):
+        self.sock.close()
+        super(DaemonMalformedRequestTests, self).tearDown()
+
+    def _response(self, request_id):
+        kind, response_id, payload = read_frame(self.sock)
+        self.assertEqual((kind, response_id), (RESPONSE, request_id))
+        return payload
+
+    def test_malformed_payload(self):
+        data = '{"method": '
+        self.sock.sendall(HEADER.pack(VERSION, REQUEST, 1, len(data)) + data)
+        error = self._response(1)['error']
+        self.assertEqual(error['type'], 'DaemonError')
+        self.assertTrue(error['message'].startswith('Malformed payload'))
+
+        # The connection is still usable
+        write_frame(self.sock, REQUEST, 2, {'method': 'list_flavors'})
+        self.assertEqual(len(self._response(2)['result']), 4)
+
+    def test_malformed_calls(self):
+        write_frame(self.sock, REQUEST, 1, ['list_flavors'])
+        self.assertTrue('must be an object' in
+                        self._response(1)['error']['message'])
+
+        write_frame(self.sock, BATCH, 2, {'method': 'list_flavors'})
+        self.assertTrue('must be a list' in
+                        self._response(2)['error']['message'])
+
+        write_frame(self.sock, BATCH, 3, [{'method': 'list_flavors'}, 42])
+        results = self._response(3)
+        self.assertEqual(len(results[0]['result']), 4)
+        self.assertTrue('must be an object' in results[1]['error']['message'])
+
+        write_frame(self.sock, RESPONSE, 4, {})
+        self.assertTrue('Unexpected frame kind' in
+                        self._response(4)['error']['message'])
+        self.assertEqual(self.daemon.stats['errors'], 2)
+
+        # The other clients are not affected
+        self.assertEqual(len(self.driver.list_flavors()), 4)
+
+
+class DaemonBackpressureTests(DaemonTestCase):
+    driver_class = SlowDummyDriver
+    daemon_kwargs = {'concurrency': 1, 'max_pending': 1, 'cache_ttl': 0}
+
+    def test_busy_clients_back_off(self):
+        results = []
+
+        def run():
+            driver = DaemonDriver(self.path)
+            results.append(len(driver.list_instances()))
+            driver.close()
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [1, 1, 1, 1])
+        self.assertTrue(self.daemon.stats['busy'] > 0)
+        self.assertEqual(self.daemon.stats['peak_pending'], 1)
+
+    def test_busy_timeout(self):
+        impatient = DaemonDriver(self.path, busy_timeout=0)
+        thread = threading.Thread(target=self.driver.list_instances)
+        thread.start()
+        deadline = time.time() + 5
+        while not self.daemon.pending and time.time() < deadline:
+            time.sleep(0.001)
+        try:
+            self.assertRaises(DaemonBusyError, impatient.list_instances)
+        finally:
+            thread.join()
+            impatient.close()
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,181 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import unittest
+
+from rackspace_database.base import Instance, InstanceStatus, Database, \
+    User, status_code
+from rackspace_database.concurrency import bounded_map
+from rackspace_database.crawler import INSTANCE_COLUMNS, FleetCrawler
+from rackspace_database.drivers.dummy import DummyDatabaseDriver
+from rackspace_database.providers import get_driver
+from rackspace_database.rolling import RollingOperation
+from rackspace_database.teardown import teardown
+from rackspace_database.types import Provider
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class DummyDatabaseDriverTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.driver = get_driver(Provider.DUMMY)(
+            'user', ex_build_time=10, ex_resize_time=5, ex_restart_time=2,
+            ex_delete_time=1, ex_clock=self.clock)
+
+    def assertStatus(self, error, code):
+        self.assertEqual(status_code(error), code)
+
+    def _raises(self, code, func, *args):
+        try:
+            func(*args)
+        except Exception:
+            self.assertStatus(sys.exc_info()[1], code)
+        else:
+            self.fail('%s did not raise' % (func.__name__))
+
+    def test_provider(self):
+        self.assertTrue(isinstance(self.driver, DummyDatabaseDriver))
+
+    def test_instance_lifecycle(self):
+        flavor = self.driver.list_flavors()[1]
+        instance = self.driver.create_instance(Instance(
+            flavor.href, name='db', size=2,
+            databases=[Database('app')]))
+        self.assertEqual(instance.status, InstanceStatus.BUILD)
+        self.assertEqual([d.name for d in instance.databases], ['app'])
+        self._raises(422, self.driver.restart_instance, instance.id)
+
+        self.clock.now = 10
+        instance = self.driver.get_instance(instance.id)
+        self.assertEqual(instance.status, InstanceStatus.ACTIVE)
+        self.assertEqual(instance.flavorRef, flavor.href)
+
+        self.driver.resize_instance_volume(instance.id, 4)
+        self.assertEqual(self.driver.get_instance(instance.id).status,
+                         InstanceStatus.RESIZE)
+        self.clock.now = 15
+        instance = self.driver.get_instance(instance.id)
+        self.assertEqual((instance.status, instance.size),
+                         (InstanceStatus.ACTIVE, 4))
+        self._raises(400, self.driver.resize_instance_volume, instance.id, 3)
+
+        large = self.driver.list_flavors()[3].href
+        self.driver.resize_instance(instance.id, large)
+        self.clock.now = 20
+        self.assertEqual(self.driver.get_instance(instance.id).flavorRef,
+                         large)
+
+        self.driver.delete_instance(instance.id)
+        self._raises(422, self.driver.delete_instance, instance.id)
+        self.assertEqual(len(self.driver.list_instances()), 1)
+        self.clock.now = 21
+        self.assertEqual(self.driver.list_instances(), [])
+        self._raises(404, self.driver.get_instance, instance.id)
+
+    def test_validation(self):
+        self._raises(400, self.driver.create_instance,
+                     Instance('flavors/99', name='db', size=1))
+        self._raises(400, self.driver.create_instance,
+                     Instance('flavors/1', name='db', size=51))
+        self._raises(404, self.driver.get_flavor, 99)
+        self.assertEqual(self.driver.get_flavor('2').name, 'm1.small')
+
+    def test_databases_and_users(self):
+        instance_id = self.driver.ex_add_instance('db', databases=['b'])
+        self.driver.create_databases(instance_id, [Database('a')])
+        self._raises(409, self.driver.create_database, instance_id,
+                     Database('b'))
+        self._raises(409, self.driver.create_databases, instance_id,
+                     [Database('c'), Database('c')])
+        self._raises(400, self.driver.create_database, instance_id,
+                     Database('c;d'))
+        rejected = self.driver.create_databases(
+            instance_id, [Database('c'), Database('c;d')])
+        self.assertEqual([item.name for item, error in rejected], ['c;d'])
+        self.assertStatus(rejected[0][1], 400)
+        self.assertEqual(self.driver.create_databases(instance_id, []), [])
+        self.assertEqual(self.driver.create_databases('missing',
+                                                      [Database('d;')])[0][0]
+                         .name, 'd;')
+        self.assertEqual([d.name for d in
+                          self.driver.list_databases(instance_id)],
+                         ['a', 'b', 'c'])
+        self.driver.delete_database(instance_id, 'a')
+        self._raises(404, self.driver.delete_database, instance_id, 'a')
+
+        self.driver.create_user(instance_id, User('bob', 'secret'),
+                                [Database('b')])
+        self._raises(409, self.driver.create_user, instance_id, User('bob'),
+                     [])
+        self._raises(400, self.driver.create_user, instance_id, User('b?'),
+                     [])
+        pairs = [(User('carol'), [Database('b')]),
+                 (User('dave'), [Database('a,b')])]
+        rejected = self.driver.create_users(instance_id, pairs)
+        self.assertEqual([item for item, error in rejected], [pairs[1]])
+        self.assertEqual(self.driver.create_users(instance_id, []), [])
+        self.assertEqual([u.name for u in
+                          self.driver.list_users(instance_id)],
+                         ['bob', 'carol'])
+        self.driver.delete_user(instance_id, 'bob')
+        self.driver.delete_user(instance_id, 'carol')
+        self.assertEqual(self.driver.list_users(instance_id), [])
+
+        self.assertFalse(self.driver.has_root_enabled(instance_id))
+        self.assertEqual(self.driver.enable_root(instance_id).name, 'root')
+        self.assertTrue(self.driver.has_root_enabled(instance_id))
+        self._raises(404, self.driver.list_users, 'missing')
+
+    def test_projections(self):
+        self.driver.ex_add_instance('db', size=3)
+        row = self.driver.list_instances(ex_projection=INSTANCE_COLUMNS)[0]
+        self.assertEqual((row.name, row.size, row.status),
+                         ('db', 3, InstanceStatus.ACTIVE))
+        self.assertEqual(self.driver.list_flavors(ex_projection=('id',)),
+                         [(1,), (2,), (3,), (4,)])
+
+    def test_orchestration_at_scale(self):
+        driver = DummyDatabaseDriver()
+        ids = [driver.ex_add_instance('load_%05d' % (i),
+                                      databases=['db'], users=['user'])
+               for i in range(2000)]
+        records = list(FleetCrawler(driver, concurrency=8,
+                                    projections=True).crawl())
+        self.assertEqual(len(records), 2000)
+        self.assertEqual(set([tuple(r['databases']) for r in records]),
+                         set([('db',)]))
+
+        report = RollingOperation(driver, 'restart', ids[:100],
+                                  batch_size=20, poll_interval=0,
+                                  settle_time=0).run()
+        self.assertEqual(len(report.done), 100)
+
+        tasks = bounded_map(driver.delete_instance, ids[1000:], 8)
+        self.assertEqual([t.error for t in tasks if t.error], [])
+        report = teardown(driver, name='load_*', poll_interval=0)
+        self.assertEqual(len(report.deleted), 1000)
+        self.assertEqual(driver.ex_count_instances(), 0)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
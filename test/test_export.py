@@ -0,0 +1,112 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import csv
+import json
+import unittest
+
+from StringIO import StringIO
+
+from libcloud.common.base import LibcloudHTTPConnection
+from libcloud.common.base import LibcloudHTTPSConnection
+
+from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+from rackspace_database.export import COLUMNS, FleetExporter, pyarrow
+from rackspace_database.standin import StandInServer
+
+
+class FleetExporterTests(unittest.TestCase):
+    def setUp(self):
+        RackspaceDatabaseDriver.connectionCls.conn_classes = (
+                LibcloudHTTPConnection, LibcloudHTTPSConnection)
+        self.server = StandInServer().start()
+        for i in range(25):
+            self.server.add_instance('export_%02d' % (i), size=i % 3 + 1,
+                                     databases=['db%d' % (i), 'shared'],
+                                     users=['user%d' % (i)])
+        self.driver = RackspaceDatabaseDriver('user', 'key',
+                                              **self.server.driver_kwargs())
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_jsonl_chunks(self):
+        reports = []
+        exporter = FleetExporter(self.driver, chunk_size=10,
+                                 progress=lambda r: reports.append(r.rows),
+                                 concurrency=8)
+        output = StringIO()
+        report = exporter.export(output)
+
+        self.assertEqual((report.rows, report.chunks, report.errors),
+                         (25, 3, 0))
+        self.assertEqual(report.calls, 75)
+        self.assertEqual(reports, [10, 20, 25])
+        self.assertTrue(report.rows_per_second > 0)
+
+        rows = dict([(r['name'], r) for r in
+                     [json.loads(line) for line in
+                      output.getvalue().splitlines()]])
+        self.assertEqual(len(rows), 25)
+        row = rows['export_04']
+        self.assertEqual(sorted(row.keys()), sorted(COLUMNS[:-1]))
+        self.assertEqual(sorted(row['databases']), ['db4', 'shared'])
+        self.assertEqual(row['users'], ['user4'])
+        self.assertEqual((row['status'], row['size'], row['root_enabled']),
+                         ('ACTIVE', 2, False))
+
+    def test_csv(self):
+        output = StringIO()
+        report = FleetExporter(self.driver, format='csv').export(output)
+        self.assertEqual(report.chunks, 1)
+
+        lines = list(csv.reader(StringIO(output.getvalue())))
+        self.assertEqual(lines[0], COLUMNS)
+        self.assertEqual(len(lines), 26)
+        rows = dict([(line[2], dict(zip(COLUMNS, line)))
+                     for line in lines[1:]])
+        self.assertEqual(sorted(rows['export_07']['databases'].split(';')),
+                         ['db7', 'shared'])
+        self.assertEqual(rows['export_07']['size'], '2')
+        self.assertEqual(rows['export_07']['errors'], '')
+
+    def test_errors_are_reported(self):
+        self.server.error_rate = 1.0
+        self.server.error_codes = (503,)
+        output = StringIO()
+        exporter = FleetExporter(self.driver)
+        # Listing the instances fails, nothing is written
+        self.assertRaises(Exception, exporter.export, output)
+        self.assertEqual(output.getvalue(), '')
+
+    def test_arrow(self):
+        if pyarrow is None:
+            return
+        output = pyarrow.BufferOutputStream()
+        report = FleetExporter(self.driver, format='arrow',
+                               chunk_size=10).export(output)
+        self.assertEqual(report.chunks, 3)
+        table = pyarrow.ipc.open_stream(output.getvalue()).read_all()
+        self.assertEqual(table.num_rows, 25)
+        self.assertEqual(table.schema.names, COLUMNS)
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, FleetExporter, self.driver,
+                          format='xml')
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
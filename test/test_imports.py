@@ -0,0 +1,111 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+import subprocess
+try:
+    import simplejson as json
+except:
+    import json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds allowed for importing the light-weight modules in a fresh
+# interpreter
+IMPORT_TIME_BUDGET = 0.25
+
+SCRIPT = """
+import sys
+import json
+from timeit import default_timer as timer
+start = timer()
+%s
+elapsed = timer() - start
+sys.stdout.write(json.dumps({'elapsed': elapsed,
+                             'libcloud': 'libcloud' in sys.modules}))
+"""
+
+
+def run_import(statements):
+    process = subprocess.Popen([sys.executable, '-c', SCRIPT % statements],
+                               cwd=ROOT, stdout=subprocess.PIPE)
+    output = process.communicate()[0]
+    if not isinstance(output, str):
+        output = output.decode('utf-8')
+    return json.loads(output)
+
+
+class ImportTimeTests(unittest.TestCase):
+    def test_light_modules_do_not_import_libcloud(self):
+        result = run_import('import rackspace_database.providers\n'
+                            'import rackspace_database.base\n'
+                            'import rackspace_database.types\n'
+                            'import rackspace_database.metrics\n'
+                            'import rackspace_database.tracing')
+        self.assertFalse(result['libcloud'])
+        self.assertTrue(result['elapsed'] < IMPORT_TIME_BUDGET,
+                        'import took %.3fs, budget is %.3fs' %
+                        (result['elapsed'], IMPORT_TIME_BUDGET))
+
+    def test_get_driver_imports_the_driver_lazily(self):
+        result = run_import(
+            'from rackspace_database.providers import get_driver, Provider\n'
+            'assert "libcloud" not in sys.modules\n'
+            'cls = get_driver(Provider.RACKSPACE)\n'
+            'assert cls.__name__ == "RackspaceDatabaseDriver"')
+        self.assertTrue(result['libcloud'])
+
+    def test_dummy_driver_does_not_import_libcloud(self):
+        result = run_import(
+            'from rackspace_database.providers import get_driver, Provider\n'
+            'cls = get_driver(Provider.DUMMY)\n'
+            'cls().ex_add_instance("db")')
+        self.assertFalse(result['libcloud'])
+
+    def test_bulk_helpers_do_not_import_libcloud(self):
+        result = run_import(
+            'from rackspace_database.providers import get_driver, Provider\n'
+            'from rackspace_database.base import status_code\n'
+            'from rackspace_database.concurrency import AdaptiveLimiter\n'
+            'from rackspace_database.daemon import _encode_error\n'
+            'from rackspace_database.rolling import RollingOperation\n'
+            'from rackspace_database.teardown import teardown\n'
+            'driver = get_driver(Provider.DUMMY)()\n'
+            'instance_id = driver.ex_add_instance("db")\n'
+            'try:\n'
+            '    driver.get_instance("missing")\n'
+            'except Exception:\n'
+            '    error = sys.exc_info()[1]\n'
+            'assert status_code(error) == 404\n'
+            'assert _encode_error(error)\n'
+            'limiter = AdaptiveLimiter()\n'
+            'limiter.release(0.1, error)\n'
+            'assert teardown(driver, [instance_id], poll_interval=0).success')
+        self.assertFalse(result['libcloud'])
+
+    def test_default_connection_class(self):
+        from libcloud.common.base import ConnectionUserAndKey
+        from rackspace_database.base import DatabaseDriver
+        self.assertTrue(DatabaseDriver.connectionCls is ConnectionUserAndKey)
+
+    def test_unknown_provider(self):
+        from rackspace_database.providers import get_driver
+        self.assertRaises(AttributeError, get_driver, 42)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,150 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import random
+import unittest
+
+from rackspace_database.base import Instance, InstanceStatus
+from rackspace_database.index import InstanceIndex
+
+FLAVORS = ['flavor/1', 'flavor/2', 'flavor/3']
+STATUSES = [InstanceStatus.ACTIVE, InstanceStatus.BUILD,
+            InstanceStatus.FAILED]
+PREFIXES = ['web-', 'db-', 'cache-', 'we']
+
+
+def make_instance(i, rand):
+    return Instance(rand.choice(FLAVORS), id='%04d' % (i),
+                    name='%s%d' % (rand.choice(PREFIXES), i),
+                    status=rand.choice(STATUSES),
+                    size=rand.choice([None, 1, 2, 5, 10, 20]))
+
+
+def scan(instances, status=None, flavor=None, name_prefix=None,
+         min_size=None, max_size=None):
+    result = []
+    for i in instances:
+        if status is not None and i.status != status:
+            continue
+        if flavor is not None and i.flavorRef != flavor:
+            continue
+        if name_prefix and not i.name.startswith(name_prefix):
+            continue
+        if min_size is not None and (i.size is None or i.size < min_size):
+            continue
+        if max_size is not None and (i.size is None or i.size > max_size):
+            continue
+        result.append(i)
+    return result
+
+
+class InstanceIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.rand = random.Random(42)
+        self.instances = [make_instance(i, self.rand) for i in range(500)]
+        self.index = InstanceIndex(self.instances)
+
+    def _ids(self, instances):
+        return sorted([i.id for i in instances])
+
+    def test_queries_match_scan(self):
+        for _ in range(200):
+            conditions = {}
+            if self.rand.random() < 0.5:
+                conditions['status'] = self.rand.choice(STATUSES)
+            if self.rand.random() < 0.5:
+                conditions['flavor'] = self.rand.choice(FLAVORS)
+            if self.rand.random() < 0.5:
+                conditions['name_prefix'] = self.rand.choice(PREFIXES)
+            if self.rand.random() < 0.5:
+                conditions['min_size'] = self.rand.choice([1, 5, 10])
+            if self.rand.random() < 0.5:
+                conditions['max_size'] = self.rand.choice([2, 10, 20])
+            expected = self._ids(scan(self.instances, **conditions))
+            self.assertEqual(self._ids(self.index.query(**conditions)),
+                             expected, conditions)
+            self.assertEqual(self.index.count(**conditions), len(expected))
+
+    def test_order_by(self):
+        active = scan(self.instances, status=InstanceStatus.ACTIVE)
+        result = self.index.query(status=InstanceStatus.ACTIVE,
+                                  order_by='size')
+        sizes = [i.size for i in result]
+        sized = [s for s in sizes if s is not None]
+        self.assertEqual(sized, sorted(sized))
+        self.assertEqual(sizes[len(sized):], [None] * (len(sizes) -
+                                                       len(sized)))
+        self.assertEqual(len(result), len(active))
+
+        largest = self.index.query(name_prefix='web-1', order_by='-size',
+                                   limit=3)
+        self.assertEqual([i.size for i in largest],
+                         sorted([i.size for i in scan(
+                             self.instances, name_prefix='web-1')
+                             if i.size is not None], reverse=True)[:3])
+
+        names = [i.name for i in self.index.query(order_by='name')]
+        self.assertEqual(names, sorted(names))
+        self.assertRaises(ValueError, self.index.query, order_by='status')
+
+    def test_empty_and_unsized(self):
+        index = InstanceIndex()
+        self.assertEqual(index.count(), 0)
+        self.assertEqual(index.query(), [])
+        self.assertEqual(index.query(order_by='size'), [])
+        self.assertEqual(index.query(order_by='-name', limit=2), [])
+
+        # No instance has a size, each is listed once
+        index = InstanceIndex([Instance('flavor/1', id='%d' % (i),
+                                        name='i%d' % (i), size=None,
+                                        status=InstanceStatus.ACTIVE)
+                               for i in range(3)])
+        self.assertEqual(index.count(), 3)
+        self.assertEqual(self._ids(index.query(order_by='size')),
+                         ['0', '1', '2'])
+        self.assertEqual(index.query(min_size=1), [])
+
+    def test_group_by(self):
+        groups = self.index.group_by('status', flavor='flavor/1')
+        for status, members in groups.items():
+            self.assertEqual(self._ids(members), self._ids(
+                scan(self.instances, status=status, flavor='flavor/1')))
+        self.assertEqual(sum([len(m) for m in
+                              self.index.group_by('flavor').values()]), 500)
+
+    def test_incremental_updates(self):
+        changed = Instance('flavor/9', id='0001', name='moved', size=50,
+                           status=InstanceStatus.RESIZE)
+        listing = [i for i in self.instances if i.id != '0002']
+        listing[1] = changed
+        listing.append(Instance('flavor/1', id='9999', name='new', size=1,
+                                status=InstanceStatus.BUILD))
+        self.assertEqual(self.index.refresh(listing), (1, 1, 1))
+
+        self.assertFalse('0002' in self.index)
+        self.assertEqual([i.id for i in self.index.query(flavor='flavor/9')],
+                         ['0001'])
+        self.assertEqual(self.index.query(order_by='-size', limit=1)[0].id,
+                         '0001')
+        self.assertEqual(self._ids(self.index.query(name_prefix='new')),
+                         ['9999'])
+        self.assertEqual(self.index.remove('0001').name, 'moved')
+        self.assertEqual(self.index.query(flavor='flavor/9'), [])
+        self.assertEqual(len(self.index), 499)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
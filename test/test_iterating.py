@@ -0,0 +1,350 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import time
+import json
+import random
+import threading
+import unittest
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+try:
+    import iterating
+except ImportError:
+    # iterating.py requires the requests package
+    iterating = None
+
+
+def _utc_string(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000-00:00',
+                         time.gmtime(seconds))
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class AuthServer(object):
+    """
+    Serves the auth endpoint and an API checking the auth token.
+
+    Every authentication issues a new token, valid for the next value of
+    C{lifetimes} seconds (the last one is reused), and revokes the
+    previous ones.  With C{reject_all} set the API answers 401 whatever
+    the token.
+    """
+
+    def __init__(self, lifetimes=(3600,)):
+        self.lifetimes = list(lifetimes)
+        self.tokens = []
+        self.auth_requests = 0
+        self.reject_all = False
+        self.api_requests = 0
+        self.client_ports = set()
+        self._lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), self._handler())
+        self.url = 'http://127.0.0.1:%d' % (self._server.server_address[1])
+        self._thread = None
+
+    def revoke(self):
+        self.tokens.append(None)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, code, body):
+                body = json.dumps(body)
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path == '/auth':
+                    self._reply(200, server._authenticate())
+                else:
+                    self._api()
+
+            def do_GET(self):
+                self._api()
+
+            def _api(self):
+                server._lock.acquire()
+                try:
+                    server.api_requests += 1
+                    server.client_ports.add(self.client_address[1])
+                    valid = server.tokens and server.tokens[-1]
+                finally:
+                    server._lock.release()
+                if server.reject_all or \
+                        self.headers.get('X-Auth-Token') != valid:
+                    self._reply(401, {'unauthorized': {'code': 401}})
+                else:
+                    self._reply(200, {'instances': [{'id': self.path}]})
+
+        return Handler
+
+    def _authenticate(self):
+        self._lock.acquire()
+        try:
+            self.auth_requests += 1
+            token = 'token-%d' % (len(self.tokens) + 1)
+            lifetime = self.lifetimes[min(len(self.tokens),
+                                          len(self.lifetimes) - 1)]
+            self.tokens.append(token)
+        finally:
+            self._lock.release()
+        return {'auth': {
+            'serviceCatalog': {'cloudServers': [
+                {'publicURL': self.url + '/v1.0/account'}]},
+            'token': {'id': token,
+                      'expires': _utc_string(time.time() + lifetime)}}}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.setDaemon(True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@unittest.skipIf(iterating is None, 'requests is not installed')
+class ParseUtcStringTests(unittest.TestCase):
+    def test_formats(self):
+        expected = 1334762407.0  # 2012-04-18T15:20:07Z
+        for value in ['2012-04-18T15:20:07Z',
+                      '2012-04-18T15:20:07',
+                      '2012-04-18T15:20:07.000Z',
+                      '2012-04-18T10:20:07.000-05:00',
+                      '2012-04-18T10:20:07-0500',
+                      '2012-04-18T17:20:07+02:00',
+                      '2012-04-18T15:50:07.123456+0030']:
+            self.assertEqual(iterating.parse_utc_string(value), expected,
+                             value)
+
+    def test_invalid(self):
+        for value in ['', '2012-04-18', '2012-04-18 15:20:07',
+                      '2012-04-18T15:20:07+5']:
+            self.assertRaises(ValueError, iterating.parse_utc_string, value)
+
+
+@unittest.skipIf(iterating is None, 'requests is not installed')
+class ConcurrentMapTests(unittest.TestCase):
+    def test_order(self):
+        def work(value):
+            time.sleep(random.random() * 0.01)
+            return value * 2
+
+        self.assertEqual(iterating.concurrent_map(work, range(40)),
+                         [v * 2 for v in range(40)])
+        self.assertEqual(iterating.concurrent_map(lambda a, b: a + b,
+                                                  [(1, 2), (3, 4)]), [3, 7])
+        self.assertEqual(iterating.concurrent_map(work, []), [])
+
+    def test_exceptions(self):
+        calls = []
+
+        def work(value):
+            calls.append(value)
+            if value in (2, 5):
+                raise ValueError(value)
+            return value
+
+        try:
+            iterating.concurrent_map(work, range(8), max_workers=3)
+        except ValueError:
+            # The first failure in order, once every call ran
+            self.assertEqual(sys.exc_info()[1].args, (2,))
+        else:
+            self.fail('concurrent_map did not raise')
+        self.assertEqual(sorted(calls), range(8))
+
+        results = iterating.concurrent_map(work, range(8),
+                                           return_exceptions=True)
+        self.assertEqual([r for r in results
+                          if not isinstance(r, ValueError)],
+                         [0, 1, 3, 4, 6, 7])
+        self.assertEqual(results[2].args, (2,))
+        self.assertEqual(results[5].args, (5,))
+
+    def test_max_workers(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+
+        def work(value):
+            lock.acquire()
+            try:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            finally:
+                lock.release()
+            time.sleep(0.02)
+            lock.acquire()
+            try:
+                state['running'] -= 1
+            finally:
+                lock.release()
+
+        iterating.concurrent_map(work, range(20), max_workers=4)
+        self.assertEqual(state['peak'], 4)
+
+
+@unittest.skipIf(iterating is None, 'requests is not installed')
+class PooledSessionTests(unittest.TestCase):
+    def setUp(self):
+        self.server = AuthServer().start()
+        self.server._authenticate()
+        self.api = {}
+        self.session = iterating.gen_pooled_session(4)
+        generate = iterating.gen_curried_api_generator_function(
+            self.server.url, {'X-Auth-Token': 'token-1'}, self.api,
+            self.session)
+        generate('list_instances', '/instances', 'get', 'instances')
+        generate('show_instance', '/instances/{0}', 'get', 'instances')
+
+    def tearDown(self):
+        self.session.close()
+        self.server.stop()
+
+    def test_pool_size(self):
+        adapter = self.session.get_adapter('https://example.com')
+        self.assertTrue(self.session.get_adapter('http://example.com') is
+                        adapter)
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter._pool_connections, 4)
+
+    def test_connections_are_reused(self):
+        for i in range(5):
+            self.api['list_instances']()
+            self.api['show_instance'](i)
+        self.assertEqual(self.server.api_requests, 10)
+        self.assertEqual(len(self.server.client_ports), 1)
+
+        self.server.client_ports.clear()
+        results = iterating.concurrent_map(self.api['show_instance'],
+                                           range(40), max_workers=4)
+        self.assertEqual([r[0]['id'] for r in results],
+                         ['/instances/%d' % (i) for i in range(40)])
+        self.assertTrue(len(self.server.client_ports) <= 4)
+
+
+@unittest.skipIf(iterating is None, 'requests is not installed')
+class TokenManagerTests(unittest.TestCase):
+    def setUp(self):
+        self.server = None
+        self.manager = None
+
+    def tearDown(self):
+        if self.manager is not None:
+            self.manager.stop()
+            self.manager.session.close()
+        self.server.stop()
+
+    def _start(self, lifetimes=(3600,), refresh_margin=300,
+               min_refresh_interval=5):
+        self.server = AuthServer(lifetimes).start()
+        session = iterating.gen_pooled_session()
+        self.manager = iterating.TokenManager(
+            self.server.url + '/auth', 'user', 'key', session,
+            refresh_margin=refresh_margin, retry_interval=0.05,
+            min_refresh_interval=min_refresh_interval)
+        self.manager.start()
+        self.api = {}
+        # The endpoints returned by auth_to_service are hardcoded
+        generate = iterating.gen_curried_api_generator_function(
+            self.server.url + '/v1.0/account/', {}, self.api, session,
+            self.manager)
+        generate('list_instances', 'instances', 'get', 'instances')
+        return self.manager
+
+    def test_expiry(self):
+        manager = self._start()
+        self.assertEqual(manager.token, 'token-1')
+        self.assertEqual(manager.account_id, 'account')
+        self.assertEqual(manager.session.headers['X-Auth-Token'], 'token-1')
+        # Second resolution in the timestamp
+        self.assertTrue(abs(manager.expires - (time.time() + 3600)) < 2)
+
+    def test_refresh_before_expiry(self):
+        # The first token is refreshed about a second before it expires
+        manager = self._start(lifetimes=(2, 3600), refresh_margin=1.5,
+                              min_refresh_interval=0.1)
+        self.assertEqual(manager.token, 'token-1')
+        deadline = time.time() + 3
+        while manager.token == 'token-1' and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(manager.token, 'token-2')
+        self.assertEqual(manager.session.headers['X-Auth-Token'], 'token-2')
+        self.assertEqual(self.api['list_instances'](),
+                         [{'id': '/v1.0/account/instances'}])
+        # The new token is far from expiring, no further refresh
+        time.sleep(0.2)
+        self.assertEqual(self.server.auth_requests, 2)
+
+    def test_short_lived_tokens(self):
+        # Every token expires within refresh_margin, renewing them as soon
+        # as they are issued would loop
+        manager = self._start(lifetimes=(2,), refresh_margin=300,
+                              min_refresh_interval=0.2)
+        time.sleep(1.5)
+        self.assertTrue(2 <= self.server.auth_requests <= 10,
+                        self.server.auth_requests)
+        self.assertNotEqual(manager.token, 'token-1')
+
+    def test_retry_once_on_401(self):
+        manager = self._start()
+        self.server.revoke()
+        self.assertEqual(self.api['list_instances'](),
+                         [{'id': '/v1.0/account/instances'}])
+        self.assertEqual(manager.token, 'token-3')
+        self.assertEqual(self.server.api_requests, 2)
+        self.assertEqual(self.server.auth_requests, 2)
+
+    def test_no_retry_loop_on_second_401(self):
+        self._start()
+        self.server.reject_all = True
+        self.assertRaises(StandardError, self.api['list_instances'])
+        self.assertEqual(self.server.api_requests, 2)
+        self.assertEqual(self.server.auth_requests, 2)
+
+    def test_concurrent_401s_reauthenticate_once(self):
+        manager = self._start()
+        self.server.revoke()
+        results = iterating.concurrent_map(
+            lambda i: self.api['list_instances'](), range(8), max_workers=8)
+        self.assertEqual(len(results), 8)
+        # token-1 and a single re-authentication
+        self.assertEqual(self.server.auth_requests, 2)
+        self.assertEqual(manager.token, 'token-3')
+        self.assertEqual(manager.unauthorized('token-1'), 'token-3')
+        self.assertEqual(self.server.auth_requests, 2)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,109 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import time
+import unittest
+
+from libcloud.common.base import LibcloudHTTPConnection
+from libcloud.common.base import LibcloudHTTPSConnection
+
+from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+from rackspace_database.loadgen import (LoadGenerator, LoadReport,
+                                        parse_mix, percentile, _Chooser)
+from rackspace_database.standin import StandInServer
+
+
+class StallingDriver(object):
+    """
+    Fake driver whose first get_instance call stalls.
+    """
+    def __init__(self, stall):
+        self.stall = stall
+
+    def get_instance(self, instance_id):
+        if self.stall:
+            time.sleep(self.stall)
+            self.stall = 0
+
+
+class LoadGeneratorTests(unittest.TestCase):
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix('get_instance=70,list_databases=30'),
+                         [('get_instance', 70.0), ('list_databases', 30.0)])
+        self.assertRaises(ValueError, parse_mix, 'drop_tables=1')
+
+    def test_percentile(self):
+        values = list(range(1, 1001))
+        self.assertEqual(percentile(values, 50), 500)
+        self.assertEqual(percentile(values, 99), 990)
+        self.assertEqual(percentile(values, 99.9), 999)
+        self.assertEqual(percentile([], 50), None)
+
+    def test_report_with_only_errors(self):
+        report = LoadReport('closed', 1, None)
+        report.record('get_instance', 0.01, 0.01)
+        report.record('list_databases', 0.01, 0.01, error='404')
+        report.elapsed = 1.0
+        latency = report.summary()['operations']['list_databases']['latency']
+        self.assertEqual(latency['max'], None)
+        line = report.format().splitlines()[-1]
+        self.assertTrue(line.startswith('list_databases'))
+        self.assertEqual(line.split()[1:4], ['0', '1', '0.0'])
+
+    def test_chooser(self):
+        chooser = _Chooser([('a', 1), ('b', 0)])
+        self.assertEqual(set([chooser.choose() for _ in range(100)]),
+                         set(['a']))
+
+    def test_open_loop_corrects_coordinated_omission(self):
+        generator = LoadGenerator(lambda: StallingDriver(0.2),
+                                  [('get_instance', 1)], workers=1,
+                                  requests=20, rate=100, mode='open',
+                                  instance_ids=['1'])
+        summary = generator.run().summary()
+        op = summary['operations']['get_instance']
+        self.assertEqual(op['count'], 20)
+        # Only one request stalled but the ones scheduled behind it waited
+        self.assertTrue(op['service_time']['p50'] < 0.05)
+        self.assertTrue(op['latency']['p50'] > 0.05)
+
+    def test_run_against_standin(self):
+        RackspaceDatabaseDriver.connectionCls.conn_classes = (
+                LibcloudHTTPConnection, LibcloudHTTPSConnection)
+        server = StandInServer().start()
+        try:
+            for i in range(3):
+                server.add_instance('instance_%d' % (i))
+            factory = lambda: RackspaceDatabaseDriver('user', 'key',
+                                                      **server.driver_kwargs())
+            generator = LoadGenerator(factory,
+                                      parse_mix('get_instance=50,'
+                                                'create_database=25,'
+                                                'delete_database=25'),
+                                      workers=2, requests=30)
+            report = generator.run()
+        finally:
+            server.stop()
+
+        summary = report.summary()
+        self.assertEqual(summary['requests'], 30)
+        self.assertEqual(sum([o['errors'] for o in
+                              summary['operations'].values()]), 0)
+        self.assertTrue('get_instance' in report.format())
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
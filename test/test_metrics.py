@@ -0,0 +1,164 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import unittest
+
+from rackspace_database.metrics import (Histogram, MetricsRegistry,
+                                        ByteCounters, render_prometheus)
+from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+
+from test import test_rackspace
+from secrets import RACKSPACE_PARAMS
+
+
+class HistogramTests(unittest.TestCase):
+    def test_observe_bucket_boundaries(self):
+        h = Histogram(bounds=(0.001, 0.01, 0.1))
+        h.observe(0.0005)
+        h.observe(0.001)
+        h.observe(0.05)
+        h.observe(5)
+        self.assertEqual(h.counts, [2, 0, 1, 1])
+        self.assertEqual(h.count, 4)
+        self.assertAlmostEqual(h.sum, 5.0515)
+
+
+class MetricsRegistryTests(unittest.TestCase):
+    def test_snapshot(self):
+        registry = MetricsRegistry(buckets=(0.1, 1))
+        registry.observe('http', 'list_instances', 200, 0.05,
+                         request_bytes=0, response_bytes=100)
+        registry.observe('http', 'list_instances', 200, 0.5,
+                         response_bytes=50)
+        registry.observe('http', 'get_instance', 404, 2, error=True)
+
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot['buckets'], [0.1, 1])
+        self.assertEqual(len(snapshot['series']), 2)
+
+        get, listing = snapshot['series']
+        self.assertEqual(get['operation'], 'get_instance')
+        self.assertEqual(get['status'], '404')
+        self.assertEqual(get['errors'], 1)
+        self.assertEqual(get['buckets'], [0, 0, 1])
+        self.assertEqual(listing['count'], 2)
+        self.assertEqual(listing['buckets'], [1, 1, 0])
+        self.assertEqual(listing['response_bytes'], 150)
+
+        registry.reset()
+        self.assertEqual(registry.snapshot()['series'], [])
+
+    def test_render_prometheus(self):
+        registry = MetricsRegistry(buckets=(0.1, 1))
+        registry.observe('http', 'list_instances', 200, 0.05,
+                         response_bytes=10)
+        registry.observe('http', 'list_instances', 200, 0.5)
+        text = render_prometheus(registry.snapshot())
+
+        self.assertTrue('# TYPE rackspace_database_http_duration_seconds '
+                        'histogram' in text)
+        self.assertTrue('rackspace_database_http_duration_seconds_bucket'
+                        '{operation="list_instances",status="200",le="0.1"}'
+                        ' 1' in text)
+        self.assertTrue('rackspace_database_http_duration_seconds_bucket'
+                        '{operation="list_instances",status="200",le="1"} 2'
+                        in text)
+        self.assertTrue('rackspace_database_http_duration_seconds_bucket'
+                        '{operation="list_instances",status="200",le="+Inf"}'
+                        ' 2' in text)
+        self.assertTrue('rackspace_database_http_response_bytes_total'
+                        '{operation="list_instances",status="200"} 10'
+                        in text)
+        self.assertTrue(text.endswith('\n'))
+
+
+class ByteCountersTests(unittest.TestCase):
+    def test_snapshot(self):
+        counters = ByteCounters()
+        counters.record('gzip', 100, 400)
+        counters.record('gzip', 50, 200)
+        counters.record(None, 30, 30)
+
+        snapshot = counters.snapshot()
+        self.assertEqual(snapshot['encodings']['gzip'],
+                         {'responses': 2, 'wire_bytes': 150,
+                          'body_bytes': 600})
+        self.assertEqual(snapshot['encodings']['identity']['responses'], 1)
+        self.assertEqual(snapshot['saved_bytes'], 450)
+
+        counters.reset()
+        self.assertEqual(counters.snapshot()['encodings'], {})
+
+
+class DriverMetricsTests(unittest.TestCase):
+    def setUp(self):
+        RackspaceDatabaseDriver.connectionCls.conn_classes = (
+                test_rackspace.RackspaceMockHttp,
+                test_rackspace.RackspaceMockHttp)
+        RackspaceDatabaseDriver.connectionCls.auth_url = \
+                'https://auth.api.example.com/v1.1/'
+        test_rackspace.RackspaceMockHttp.type = None
+
+        self.registry = MetricsRegistry()
+        self.driver = RackspaceDatabaseDriver(key=RACKSPACE_PARAMS[0],
+                                              secret=RACKSPACE_PARAMS[1],
+                                              ex_metrics=self.registry)
+
+    def _series(self, kind, operation):
+        return [s for s in self.registry.snapshot()['series']
+                if s['kind'] == kind and s['operation'] == operation]
+
+    def test_list_instances_is_recorded(self):
+        self.driver.list_instances()
+        self.driver.list_instances()
+
+        http = self._series('http', 'list_instances')
+        self.assertEqual(len(http), 1)
+        self.assertEqual(http[0]['status'], '200')
+        self.assertEqual(http[0]['count'], 2)
+        self.assertTrue(http[0]['response_bytes'] > 0)
+
+        call = self._series('call', 'list_instances')
+        self.assertEqual(call[0]['status'], 'ok')
+        self.assertEqual(call[0]['count'], 2)
+
+        auth = self._series('auth', 'authenticate')
+        self.assertEqual(auth[0]['count'], 1)
+
+    def test_request_bytes_are_recorded(self):
+        self.driver.restart_instance('123456')
+        http = self._series('http', 'restart_instance')
+        self.assertEqual(http[0]['status'], '204')
+        self.assertEqual(http[0]['request_bytes'],
+                         len('{"restart": {}}'))
+
+    def test_api_error_status_is_recorded(self):
+        self.assertRaises(Exception, self.driver.get_instance, 'missing')
+        http = self._series('http', 'get_instance')
+        self.assertEqual(http[0]['status'], '404')
+        self.assertEqual(http[0]['errors'], 1)
+        call = self._series('call', 'get_instance')
+        self.assertEqual(call[0]['status'], 'error')
+
+    def test_metrics_disabled_by_default(self):
+        driver = RackspaceDatabaseDriver(key=RACKSPACE_PARAMS[0],
+                                         secret=RACKSPACE_PARAMS[1])
+        self.assertEqual(driver.connection.metrics, None)
+        driver.list_flavors()
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
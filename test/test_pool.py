@@ -0,0 +1,132 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import threading
+import unittest
+
+from libcloud.common.base import LibcloudHTTPConnection
+from libcloud.common.base import LibcloudHTTPSConnection
+
+from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+from rackspace_database.pool import DriverPool
+from rackspace_database.standin import StandInServer
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class DriverPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.created = []
+        self.pool = DriverPool(max_drivers=2, idle_timeout=60,
+                               factory=self._factory, clock=self.clock)
+
+    def _factory(self, user, key, auth_url, region):
+        driver = object()
+        self.created.append((user, region))
+        return driver
+
+    def test_reuse(self):
+        first = self.pool.get('alice', 'key')
+        self.assertTrue(self.pool.get('alice', 'key') is first)
+        self.assertFalse(self.pool.get('alice', 'key', region='dfw') is first)
+        self.assertEqual(self.created, [('alice', 'ord'), ('alice', 'dfw')])
+        snapshot = self.pool.snapshot()
+        self.assertEqual(snapshot['hits'], 1)
+        self.assertEqual(snapshot['misses'], 2)
+        self.assertEqual(snapshot['drivers'], 2)
+
+    def test_lru_eviction(self):
+        alice = self.pool.get('alice', 'key')
+        self.pool.get('bob', 'key')
+        self.pool.get('alice', 'key')
+        self.pool.get('carol', 'key')
+        # bob was the least recently used
+        self.assertTrue(self.pool.get('alice', 'key') is alice)
+        self.pool.get('bob', 'key')
+        self.assertEqual(self.pool.snapshot()['evicted_lru'], 2)
+        self.assertEqual(len(self.pool), 2)
+
+    def test_idle_timeout(self):
+        alice = self.pool.get('alice', 'key')
+        self.clock.now = 30
+        self.pool.get('bob', 'key')
+        self.clock.now = 70
+        self.pool.evict_idle()
+        self.assertEqual(len(self.pool), 1)
+        self.assertFalse(self.pool.get('alice', 'key') is alice)
+        self.assertEqual(self.pool.snapshot()['evicted_idle'], 1)
+
+    def test_credentials_change(self):
+        alice = self.pool.get('alice', 'key')
+        self.assertFalse(self.pool.get('alice', 'other') is alice)
+        self.assertEqual(self.pool.snapshot()['evicted_credentials'], 1)
+        self.assertTrue(self.pool.remove('alice'))
+        self.assertFalse(self.pool.remove('alice'))
+
+
+class DriverPoolStandInTests(unittest.TestCase):
+    def setUp(self):
+        RackspaceDatabaseDriver.connectionCls.conn_classes = (
+                LibcloudHTTPConnection, LibcloudHTTPSConnection)
+        self.server = StandInServer(latency=0.05).start()
+        kwargs = self.server.driver_kwargs()
+        self.pool = DriverPool(max_connections=2,
+                               ex_force_auth_version=kwargs[
+                                   'ex_force_auth_version'])
+        self.auth_url = kwargs['ex_force_auth_url']
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def test_shared_auth_and_connection_cap(self):
+        self.server.add_instance('a')
+        errors = []
+
+        def work(user):
+            try:
+                for _ in range(3):
+                    driver = self.pool.get(user, 'key', self.auth_url)
+                    self.assertEqual(len(driver.list_instances()), 1)
+            except Exception:
+                errors.append(sys.exc_info()[1])
+
+        threads = [threading.Thread(target=work, args=('user%d' % (i % 3),))
+                   for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        snapshot = self.pool.snapshot()
+        self.assertEqual(snapshot['drivers'], 3)
+        self.assertEqual(snapshot['misses'], 3)
+        self.assertEqual(self.server.stats['auth_v1_1'], 3)
+        self.assertTrue(snapshot['open_connections'] <= 2)
+        self.assertTrue(snapshot['transport']['created'] <= 2)
+        self.assertTrue(snapshot['transport']['waited'] > 0)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
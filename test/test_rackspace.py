@@ -28,7 +28,9 @@ from rackspace_database.base import (DatabaseDriver, Instance,
                                 InstanceStatus, Flavor, Database, User)
 
 from rackspace_database.drivers.rackspace import (RackspaceDatabaseDriver,
-                                            RackspaceDatabaseValidationError)
+                                            RackspaceDatabaseValidationError,
+                                            INSTANCE_SUMMARY)
+from rackspace_database.schema import Projection
 
 from test import MockResponse, MockHttpTestCase
 from test.file_fixtures import FIXTURES_ROOT
@@ -92,6 +94,34 @@ class RackspaceTests(unittest.TestCase):
         self.assertEqual(result[2].databases, None)
         self.assertEqual(result[2].rootEnabled, None)
 
+    def test_list_instances_projection(self):
+        raw = self.driver.list_instances(ex_projection='raw')
+        self.assertEqual(raw[0]['id'], '81e93520')
+
+        result = self.driver.list_instances(ex_projection=('id', 'size'))
+        self.assertEqual(result[:2], [('81e93520', None), ('68345c52', 2)])
+
+        result = self.driver.list_instances(ex_projection=INSTANCE_SUMMARY)
+        self.assertEqual(result[1].id, '68345c52')
+        self.assertEqual(result[1].status, InstanceStatus.ACTIVE)
+        self.assertTrue(result[1].flavorRef.endswith('/flavors/1'))
+
+        self.assertRaises(ValueError, self.driver.list_instances,
+                          ex_projection=('id', 'hostname'))
+
+    def test_get_projection(self):
+        result = self.driver.get_instance('68345c52',
+                                          ex_projection=('name',
+                                                         'databases'))
+        self.assertEqual(result[0], 'a_rack_instance')
+        self.assertEqual(result[1][0].name, 'nextround')
+
+        row = self.driver.get_flavor(3, ex_projection=Projection('Flavor',
+                                                                 ('id',
+                                                                  'href')))
+        self.assertEqual(row.id, 3)
+        self.assertTrue(row.href.endswith('/flavors/3'))
+
     def test_get_instance(self):
         flavorRef = ("http://ord.databases.api." +
             "rackspacecloud.com/v1.0/586067/flavors/1")
@@ -232,7 +262,7 @@ class RackspaceMockHttp(MockHttpTestCase):
 
     def _v1_0_586067_instances_68345c52(self, method, url, body, headers):
         if method == 'DELETE':
-            self.assertEqual(body, {})
+            self.assertEqual(body, '')
             return (httplib.NO_CONTENT, body, self.json_content_headers,
                     httplib.responses[httplib.NO_CONTENT])
         elif method == 'GET':
@@ -242,6 +272,11 @@ class RackspaceMockHttp(MockHttpTestCase):
 
         raise NotImplementedError('')
 
+    def _v1_0_586067_instances_missing(self, method, url, body, headers):
+        body = self.fixtures.load('get_instance_not_found.json')
+        return (httplib.NOT_FOUND, body, self.json_content_headers,
+                httplib.responses[httplib.NOT_FOUND])
+
     def _v1_0_586067_instances(self, method, url, body, headers):
         if method == 'POST':
             flavorRef = ("http://ord.databases.api." +
@@ -0,0 +1,205 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import unittest
+
+from libcloud.common.base import LibcloudHTTPConnection
+from libcloud.common.base import LibcloudHTTPSConnection
+
+from rackspace_database.base import Instance, InstanceStatus
+from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+from rackspace_database.rolling import RollingOperation
+from rackspace_database.standin import StandInServer
+
+
+class LaggingDriver(object):
+    """
+    Fake driver whose restarts leave ACTIVE only after C{lag} seconds, and
+    never when C{lag} is C{None}.  The first C{failures} list_instances
+    calls fail.
+    """
+    def __init__(self, count, lag, busy, failures=0):
+        self.lag = lag
+        self.busy = busy
+        self.failures = failures
+        self.calls = 0
+        self.restarts = {}
+        self.ids = ['%d' % (i) for i in range(count)]
+
+    def restart_instance(self, instance_id):
+        self.calls += 1
+        self.restarts[instance_id] = time.time()
+
+    def _status(self, instance_id):
+        restarted = self.restarts.get(instance_id)
+        if restarted is None or self.lag is None:
+            return InstanceStatus.ACTIVE
+        elapsed = time.time() - restarted
+        if self.lag <= elapsed < self.lag + self.busy:
+            return InstanceStatus.SHUTDOWN
+        return InstanceStatus.ACTIVE
+
+    def list_instances(self):
+        if self.failures:
+            self.failures -= 1
+            raise Exception({'serviceUnavailable': {'code': 503,
+                                                    'message': ''}})
+        return [Instance('1', id=i, status=self._status(i), size=1)
+                for i in self.ids]
+
+
+class RollingOperationTests(unittest.TestCase):
+    def setUp(self):
+        RackspaceDatabaseDriver.connectionCls.conn_classes = (
+                LibcloudHTTPConnection, LibcloudHTTPSConnection)
+        self.server = StandInServer(restart_time=0.15,
+                                    resize_time=0.15).start()
+        self.driver = RackspaceDatabaseDriver('user', 'key',
+                                              **self.server.driver_kwargs())
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def _instances(self, count, **kwargs):
+        return [self.server.add_instance('rolling_%d' % (i), **kwargs)
+                for i in range(count)]
+
+    def test_pipelined_restart(self):
+        ids = self._instances(6)
+        rolling = RollingOperation(self.driver, 'restart', ids, batch_size=2,
+                                   max_unavailable=4, poll_interval=0.05)
+        report = rolling.run()
+        self.assertEqual(sorted(report.done), sorted(ids))
+        self.assertEqual(report.batches, 3)
+        self.assertEqual(report.peak_unavailable, 4)
+        self.assertFalse(report.halted)
+        self.assertEqual(self.server.stats['instance_action'], 6)
+        statuses = [i.status for i in self.driver.list_instances()]
+        self.assertEqual(set(statuses), set([1]))
+        self.assertTrue('done=6' in report.format())
+
+    def test_resize_volume(self):
+        ids = self._instances(3)
+        report = RollingOperation(self.driver, 'resize_volume', ids,
+                                  argument=5, batch_size=3,
+                                  poll_interval=0.05).run()
+        self.assertEqual(len(report.done), 3)
+        self.assertEqual(set([i.size for i in self.driver.list_instances()]),
+                         set([5]))
+
+    def test_halts_on_failure_rate(self):
+        ids = self._instances(2, status='FAILED') + self._instances(6)
+        rolling = RollingOperation(self.driver, 'restart', ids, batch_size=2,
+                                   max_failure_rate=0.5, poll_interval=0.05)
+        report = rolling.run()
+        self.assertTrue(report.halted)
+        self.assertEqual(len(report.failed), 2)
+        self.assertEqual(len(report.skipped), 6)
+
+    def test_resume(self):
+        ids = self._instances(4)
+        state_file = os.path.join(self.directory, 'restart.state')
+        fp = open(state_file, 'w')
+        json.dump({'operation': 'restart', 'argument': None,
+                   'instances': {ids[0]: {'state': 'done'},
+                                 ids[1]: {'state': 'failed',
+                                          'reason': 'timed out'}}}, fp)
+        fp.close()
+
+        report = RollingOperation(self.driver, 'restart', ids,
+                                  batch_size=2, poll_interval=0.05,
+                                  state_file=state_file).run()
+        self.assertEqual(sorted(report.done), sorted(ids[2:]))
+        self.assertEqual(self.server.stats['instance_action'], 2)
+
+        saved = json.load(open(state_file))
+        self.assertEqual(sorted([s['state'] for s in
+                                 saved['instances'].values()]),
+                         ['done', 'done', 'done', 'failed'])
+
+        report = RollingOperation(self.driver, 'restart', ids,
+                                  poll_interval=0.05, state_file=state_file,
+                                  retry_failed=True).run()
+        self.assertEqual(report.done, [ids[1]])
+        self.assertRaises(ValueError, RollingOperation(
+            self.driver, 'resize', ids, argument=2,
+            state_file=state_file).run)
+
+    def test_transition_starting_after_a_poll(self):
+        driver = LaggingDriver(2, lag=0.15, busy=0.1)
+        report = RollingOperation(driver, 'restart', driver.ids,
+                                  batch_size=1, poll_interval=0.05).run()
+        self.assertEqual(report.done, driver.ids)
+        # The second restart waited for the first one to complete
+        self.assertTrue(driver.restarts['1'] - driver.restarts['0'] >= 0.25)
+
+    def test_transition_never_seen(self):
+        driver = LaggingDriver(2, lag=None, busy=0)
+        report = RollingOperation(driver, 'restart', driver.ids,
+                                  batch_size=2, poll_interval=0.05,
+                                  timeout=0.2).run()
+        self.assertEqual(sorted(report.failed), driver.ids)
+        self.assertEqual(set(report.failed.values()), set(['timed out']))
+
+        report = RollingOperation(driver, 'restart', driver.ids,
+                                  batch_size=2, poll_interval=0.05,
+                                  settle_time=0.1).run()
+        self.assertEqual(sorted(report.done), driver.ids)
+
+    def test_poll_errors(self):
+        driver = LaggingDriver(2, lag=0.05, busy=0.3, failures=2)
+        report = RollingOperation(driver, 'restart', driver.ids,
+                                  batch_size=2, poll_interval=0.05).run()
+        self.assertEqual(sorted(report.done), driver.ids)
+        self.assertEqual(report.poll_errors, 2)
+        self.assertTrue('poll_errors=2' in report.format())
+
+        # Failing until the timeout, the instances time out
+        driver = LaggingDriver(2, lag=0.05, busy=0.1, failures=1000)
+        report = RollingOperation(driver, 'restart', driver.ids,
+                                  batch_size=2, poll_interval=0.05,
+                                  timeout=0.2).run()
+        self.assertEqual(sorted(report.failed), driver.ids)
+        self.assertEqual(set(report.failed.values()), set(['timed out']))
+        self.assertTrue(report.poll_errors >= 4)
+
+    def test_duplicate_ids(self):
+        driver = LaggingDriver(2, lag=0.05, busy=0.1)
+        rolling = RollingOperation(driver, 'restart', ['0', '1', '0', '1'],
+                                   batch_size=1, poll_interval=0.05)
+        report = rolling.run()
+        self.assertEqual(rolling.instance_ids, ['0', '1'])
+        self.assertEqual(report.done, ['0', '1'])
+        self.assertEqual(driver.calls, 2)
+
+    def test_invalid_arguments(self):
+        self.assertRaises(ValueError, RollingOperation, self.driver, 'stop',
+                          [])
+        self.assertRaises(ValueError, RollingOperation, self.driver,
+                          'resize', [])
+        self.assertRaises(ValueError, RollingOperation, self.driver,
+                          'restart', [], batch_size=4, max_unavailable=2)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
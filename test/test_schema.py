@@ -0,0 +1,101 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import unittest
+try:
+    import simplejson as json
+except:
+    import json
+
+from rackspace_database.base import InstanceStatus, Database
+from rackspace_database.schema import (Schema, Value, Path, Lookup, SelfLink,
+                                       Nested, enum_table, self_link)
+from rackspace_database.drivers.rackspace import (RackspaceDatabaseDriver,
+                                                  DECODED_STRING_TYPE)
+
+from test.benchmarks import fixtures, bench_rackspace
+
+
+class SchemaTests(unittest.TestCase):
+    def test_fields(self):
+        schema = Schema(lambda *args, **kwargs: (args, kwargs), [
+            Value('a'),
+            Value('b', 'b', required=False),
+            Path(('c', 'd'), 'd'),
+            Lookup('e', {'X': 1}, 'e'),
+            SelfLink('f', 'f'),
+            Nested('g', Schema(Database, [Value('name')]), 'g')
+        ])
+        mapper = schema.compile()
+        self.assertTrue(schema.compile() is mapper)
+
+        args, kwargs = mapper({'a': 1, 'c': {'d': 2}, 'e': 'X',
+                               'f': {'links': [{'rel': 'bookmark',
+                                                'href': 'b'},
+                                               {'rel': 'self',
+                                                'href': 's'}]},
+                               'g': [{'name': 'db'}]})
+        self.assertEqual(args, (1,))
+        self.assertEqual(kwargs['b'], None)
+        self.assertEqual(kwargs['d'], 2)
+        self.assertEqual(kwargs['e'], 1)
+        self.assertEqual(kwargs['f'], 's')
+        self.assertEqual([d.name for d in kwargs['g']], ['db'])
+
+        args, kwargs = mapper({'a': 1, 'e': 'X', 'f': {'links': []},
+                               'g': []})
+        self.assertEqual(kwargs['d'], None)
+        self.assertEqual(kwargs['f'], None)
+        self.assertEqual(kwargs['g'], None)
+        self.assertRaises(KeyError, mapper, {'a': 1, 'e': 'Y'})
+
+        lookup = Schema(dict, [Lookup('e', {'X': 1}, 'e', default=0),
+                               Lookup('f', {'X': 1}, 'f', default=None)
+                               ]).compile()
+        self.assertEqual(lookup({'e': 'X', 'f': 'X'}), {'e': 1, 'f': 1})
+        self.assertEqual(lookup({'e': 'Y', 'f': 'Y'}), {'e': 0, 'f': None})
+
+        self.assertEqual(len(mapper.many([{'a': 1, 'e': 'X',
+                                           'f': {'links': []}}] * 3)), 3)
+
+    def test_key_type(self):
+        schema = Schema(Database, [Value('name')])
+        self.assertTrue(schema.compile(unicode) is not schema.compile(str))
+        self.assertEqual(schema.compile(unicode)({u'name': u'a'}).name,
+                         u'a')
+
+    def test_helpers(self):
+        self.assertEqual(enum_table(InstanceStatus)['RESIZE'],
+                         InstanceStatus.RESIZE)
+        self.assertEqual(self_link({'links': [{'rel': 'self',
+                                               'href': 'x'}]}), 'x')
+
+    def test_instance_mapper_matches_dict_walk(self):
+        driver = RackspaceDatabaseDriver('user', 'key')
+        objs = json.loads(json.dumps([fixtures.instance(i, databases=i % 3)
+                                      for i in range(20)]))
+        self.assertEqual(type(objs[0]['name']), DECODED_STRING_TYPE)
+
+        for obj in objs:
+            expected = bench_rackspace._dict_walk_to_instance(obj, {})
+            got = driver._to_instance(obj, {})
+            self.assertEqual(repr(got), repr(expected))
+        self.assertEqual([repr(i) for i in driver._to_instance.many(objs)],
+                         [repr(driver._to_instance(o, {})) for o in objs])
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,108 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import json
+import signal
+import unittest
+
+from StringIO import StringIO
+
+from libcloud.common.base import LibcloudHTTPConnection
+from libcloud.common.base import LibcloudHTTPSConnection
+
+from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+from rackspace_database.slowlog import SlowCallLog, url_template
+from rackspace_database.standin import StandInServer
+
+
+class SlowCallLogTests(unittest.TestCase):
+    def setUp(self):
+        RackspaceDatabaseDriver.connectionCls.conn_classes = (
+                LibcloudHTTPConnection, LibcloudHTTPSConnection)
+        self.server = StandInServer(latency=0.05).start()
+        self.instance_id = self.server.add_instance('slow',
+                                                    databases=['a', 'b'])
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _driver(self, **kwargs):
+        kwargs.update(self.server.driver_kwargs())
+        return RackspaceDatabaseDriver('user', 'key', **kwargs)
+
+    def test_url_template(self):
+        self.assertEqual(url_template('/instances/abc/databases/db1'),
+                         ('/instances/{instance_id}/databases/{database}',
+                          'abc'))
+        self.assertEqual(url_template('/instances/detail'),
+                         ('/instances/detail', None))
+        self.assertEqual(url_template('/flavors/2'),
+                         ('/flavors/{flavor_id}', None))
+
+    def test_slow_calls_are_logged(self):
+        driver = self._driver(ex_slow_call_threshold=0.03)
+        driver.list_databases(self.instance_id)
+        self.assertRaises(Exception, driver.get_instance, 'missing')
+
+        records = driver.connection.slow_calls.records()
+        self.assertEqual(len(records), 2)
+        record = records[0]
+        self.assertEqual(record['operation'], 'list_databases')
+        self.assertEqual(record['url'], '/instances/{instance_id}/databases')
+        self.assertEqual(record['instance_id'], self.instance_id)
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['objects'], 2)
+        self.assertEqual(record['request_bytes'], 0)
+        self.assertTrue(record['response_bytes'] > 0)
+        self.assertTrue(record['duration'] >= 0.05)
+        # The stack stops at the caller, outside the package
+        self.assertTrue('test_slow_calls_are_logged' in record['stack'][-1])
+        self.assertEqual(len([f for f in record['stack']
+                              if 'rackspace_database' in f]), 0)
+
+        self.assertEqual(records[1]['status'], 404)
+        self.assertEqual(records[1]['objects'], 0)
+        self.assertTrue('itemNotFound' in records[1]['error'])
+
+    def test_fast_calls_are_not_logged(self):
+        log = SlowCallLog(10)
+        driver = self._driver(ex_slow_call_log=log)
+        driver.list_instances()
+        self.assertEqual(len(log), 0)
+
+    def test_ring_buffer_and_dump(self):
+        log = SlowCallLog(0, capacity=2)
+        for i in range(3):
+            log.record('get_instance', '/instances/%d' % (i), 1.0)
+        self.assertEqual([r['instance_id'] for r in log.records()],
+                         ['1', '2'])
+        self.assertEqual(log.dropped, 1)
+
+        output = StringIO()
+        previous = log.install_signal_handler(signal.SIGUSR1, output)
+        try:
+            os.kill(os.getpid(), signal.SIGUSR1)
+        finally:
+            signal.signal(signal.SIGUSR1, previous)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0])['url'],
+                         '/instances/{instance_id}')
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
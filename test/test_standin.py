@@ -0,0 +1,213 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import time
+import zlib
+import unittest
+try:
+    import simplejson as json
+except:
+    import json
+
+from libcloud.common.base import LibcloudHTTPConnection
+from libcloud.common.base import LibcloudHTTPSConnection
+
+from rackspace_database.base import Instance, InstanceStatus, Database, User
+from rackspace_database.drivers.rackspace import (RackspaceDatabaseDriver,
+                                                  _DeflateDecompressor)
+from rackspace_database.standin import (StandInServer, TokenBucket,
+                                        parse_distribution)
+
+
+class StandInDriverTests(unittest.TestCase):
+    def setUp(self):
+        RackspaceDatabaseDriver.connectionCls.conn_classes = (
+                LibcloudHTTPConnection, LibcloudHTTPSConnection)
+        self.server = StandInServer(build_time=0.05).start()
+        self.driver = RackspaceDatabaseDriver('user', 'key',
+                                              **self.server.driver_kwargs())
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _create_instance(self):
+        flavor = self.driver.get_flavor(1)
+        return self.driver.create_instance(Instance(flavor.href, size=2,
+                name='an_instance', databases=[Database('a_database')]))
+
+    def test_build_to_active(self):
+        instance = self._create_instance()
+        self.assertEqual(instance.status, InstanceStatus.BUILD)
+        time.sleep(0.1)
+        instance = self.driver.get_instance(instance.id)
+        self.assertEqual(instance.status, InstanceStatus.ACTIVE)
+        self.assertEqual(instance.size, 2)
+        self.assertEqual(instance.databases[0].name, 'a_database')
+
+    def test_databases_users_and_root(self):
+        instance_id = self.server.add_instance('seeded')
+        self.driver.create_database(instance_id, Database('first'))
+        self.driver.create_user(instance_id, User('a_user', 'a_password'),
+                                [Database('first')])
+        self.assertEqual([d.name for d in
+                          self.driver.list_databases(instance_id)],
+                         ['first'])
+        self.assertEqual([u.name for u in self.driver.list_users(instance_id)],
+                         ['a_user'])
+
+        self.assertEqual(self.driver.has_root_enabled(instance_id), False)
+        self.assertEqual(self.driver.enable_root(instance_id).name, 'root')
+        self.assertEqual(self.driver.has_root_enabled(instance_id), True)
+
+        self.driver.delete_user(instance_id, 'a_user')
+        self.driver.delete_database(instance_id, 'first')
+        self.assertEqual(self.driver.list_databases(instance_id), [])
+
+    def test_resize_and_delete(self):
+        instance_id = self.server.add_instance('seeded', size=1)
+        self.driver.resize_instance_volume(instance_id, 5)
+        self.assertEqual(self.driver.get_instance(instance_id).status,
+                         InstanceStatus.RESIZE)
+
+        self.driver.delete_instance(instance_id)
+        self.assertEqual(self.driver.list_instances(), [])
+
+    def test_restart_and_unknown_status(self):
+        instance_id = self.server.add_instance('seeded')
+        other_id = self.server.add_instance('other', status='BACKUP')
+        self.driver.restart_instance(instance_id)
+        statuses = dict([(i.id, i.status) for i in
+                         self.driver.list_instances()])
+        self.assertEqual(statuses, {instance_id: InstanceStatus.REBOOT,
+                                    other_id: InstanceStatus.UNKNOWN})
+
+    def test_compression(self):
+        for i in range(20):
+            self.server.add_instance('instance_%d' % (i), databases=['db'])
+        self.server.compress_min_size = 512
+        # libcloud always accepts gzip and buffers the body to decompress it
+        self.assertEqual(len(self.driver.list_instances()), 20)
+        self.assertEqual(self.server.stats['gzip_responses'], 1)
+        self.assertEqual(self.driver.connection.byte_counters, None)
+
+        driver = RackspaceDatabaseDriver('user', 'key', ex_compression=True,
+                                         **self.server.driver_kwargs())
+        instances = driver.list_instances()
+        self.assertEqual(len(instances), 20)
+        self.assertEqual(instances[0].name, 'instance_0')
+        self.assertEqual(self.server.stats['gzip_responses'], 2)
+
+        counters = driver.connection.byte_counters.snapshot()
+        gzip = counters['encodings']['gzip']
+        self.assertEqual(gzip['responses'], 1)
+        self.assertTrue(gzip['wire_bytes'] < gzip['body_bytes'])
+        self.assertTrue(counters['saved_bytes'] > 0)
+
+    def test_deflate_decompressor(self):
+        data = 'x' * 1000
+        for wbits in (zlib.MAX_WBITS, -zlib.MAX_WBITS):
+            compressor = zlib.compressobj(6, zlib.DEFLATED, wbits)
+            compressed = compressor.compress(data) + compressor.flush()
+            decompressor = _DeflateDecompressor()
+            self.assertEqual(decompressor.decompress(compressed[:10]) +
+                             decompressor.decompress(compressed[10:]) +
+                             decompressor.flush(), data)
+
+    def test_auth_2_0(self):
+        driver = RackspaceDatabaseDriver('user', 'key',
+                **self.server.driver_kwargs(auth_version='2.0'))
+        self.assertEqual(len(driver.list_flavors()), 4)
+        self.assertEqual(self.server.stats['auth_v2_0'], 1)
+
+
+class StandInHandlerTests(unittest.TestCase):
+    def _token(self, server):
+        status, headers, body = server.handle('POST', '/v1.1/auth', {},
+                json.dumps({'credentials': {'username': 'u', 'key': 'k'}}))
+        self.assertEqual(status, 200)
+        return {'X-Auth-Token': json.loads(body)['auth']['token']['id']}
+
+    def test_requires_token(self):
+        server = StandInServer()
+        status, headers, body = server.handle('GET',
+                '/v1.0/586067/instances', {}, None)
+        self.assertEqual(status, 401)
+
+        status, headers, body = server.handle('GET',
+                '/v1.0/586067/instances', self._token(server), None)
+        self.assertEqual(status, 200)
+
+    def test_credentials(self):
+        server = StandInServer(credentials={'u': 'secret'})
+        status, headers, body = server.handle('POST', '/v1.1/auth', {},
+                json.dumps({'credentials': {'username': 'u', 'key': 'k'}}))
+        self.assertEqual(status, 401)
+
+    def test_error_injection(self):
+        server = StandInServer(error_rate=1.0, error_codes=(503,))
+        status, headers, body = server.handle('GET', '/v1.0/586067/flavors',
+                                              self._token(server), None)
+        self.assertEqual(status, 503)
+        self.assertTrue('serviceUnavailable' in json.loads(body))
+
+    def test_rate_limit(self):
+        server = StandInServer(rate_limit=0.5, burst=1)
+        headers = self._token(server)
+        status, _, _ = server.handle('GET', '/v1.0/586067/flavors', headers,
+                                     None)
+        self.assertEqual(status, 200)
+        status, response_headers, _ = server.handle('GET',
+                '/v1.0/586067/flavors', headers, None)
+        self.assertEqual(status, 413)
+        self.assertEqual(response_headers['Retry-After'], '2')
+
+    def test_duplicate_database(self):
+        server = StandInServer()
+        instance_id = server.add_instance('seeded', databases=['a'])
+        status, _, _ = server.handle('POST',
+                '/v1.0/586067/instances/%s/databases' % (instance_id),
+                self._token(server),
+                json.dumps({'databases': [{'name': 'a'}]}))
+        self.assertEqual(status, 409)
+
+    def test_action_requires_active(self):
+        server = StandInServer()
+        instance_id = server.add_instance('seeded', status='BUILD')
+        status, _, _ = server.handle('POST',
+                '/v1.0/586067/instances/%s/action' % (instance_id),
+                self._token(server), json.dumps({'restart': {}}))
+        self.assertEqual(status, 422)
+
+
+class DistributionTests(unittest.TestCase):
+    def test_parse_distribution(self):
+        self.assertEqual(parse_distribution('0.25')(), 0.25)
+        value = parse_distribution('uniform:0.1,0.2')()
+        self.assertTrue(0.1 <= value <= 0.2)
+        self.assertTrue(parse_distribution('lognormal:0.02,0.5')() > 0)
+        self.assertRaises(ValueError, parse_distribution, 'nope:1')
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=1, burst=2)
+        self.assertEqual(bucket.acquire()[0], True)
+        self.assertEqual(bucket.acquire()[0], True)
+        allowed, retry_after = bucket.acquire()
+        self.assertEqual(allowed, False)
+        self.assertTrue(0 < retry_after <= 1)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,188 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import time
+import threading
+import unittest
+
+from libcloud.common.base import LibcloudHTTPConnection
+from libcloud.common.base import LibcloudHTTPSConnection
+
+from rackspace_database.base import InstanceStatus, status_code
+from rackspace_database.concurrency import WorkerPool, bounded_map
+from rackspace_database.concurrency import shared_limiter
+from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+from rackspace_database.standin import StandInServer
+from rackspace_database.teardown import teardown
+
+
+class ConcurrencyTests(unittest.TestCase):
+    def test_bounded_map(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'peak': 0}
+
+        def work(value):
+            lock.acquire()
+            try:
+                state['running'] += 1
+                state['peak'] = max(state['peak'], state['running'])
+            finally:
+                lock.release()
+            time.sleep(0.02)
+            lock.acquire()
+            try:
+                state['running'] -= 1
+            finally:
+                lock.release()
+            if value == 3:
+                raise ValueError(value)
+            return value * 2
+
+        tasks = bounded_map(work, range(12), concurrency=4)
+        self.assertEqual(state['peak'], 4)
+        self.assertEqual([t.value for t in tasks if t.error is None],
+                         [v * 2 for v in range(12) if v != 3])
+        self.assertTrue(isinstance(tasks[3].error, ValueError))
+        self.assertRaises(ValueError, tasks[3].result)
+
+    def test_worker_pool_callbacks(self):
+        done = []
+        pool = WorkerPool(2)
+        try:
+            task = pool.submit(lambda a, b=0: a + b, 1, b=2)
+            self.assertEqual(task.result(timeout=1), 3)
+            task.add_done_callback(lambda t: done.append(t.value))
+        finally:
+            pool.close()
+        self.assertEqual(done, [3])
+        self.assertRaises(RuntimeError, pool.submit, len, [])
+
+
+class FlakyListing(object):
+    """
+    Wraps a driver whose first C{failures} list_instances calls fail.
+    """
+    def __init__(self, driver, failures):
+        self.driver = driver
+        self.failures = failures
+        self.deletes = []
+
+    def delete_instance(self, instance_id):
+        self.deletes.append(instance_id)
+        return self.driver.delete_instance(instance_id)
+
+    def list_instances(self):
+        if self.failures:
+            self.failures -= 1
+            raise Exception({'serviceUnavailable': {'code': 503,
+                                                    'message': ''}})
+        return self.driver.list_instances()
+
+
+class TeardownTests(unittest.TestCase):
+    def setUp(self):
+        RackspaceDatabaseDriver.connectionCls.conn_classes = (
+                LibcloudHTTPConnection, LibcloudHTTPSConnection)
+        self.server = StandInServer(delete_time=0.2).start()
+        self.driver = RackspaceDatabaseDriver('user', 'key',
+                                              **self.server.driver_kwargs())
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_status_code(self):
+        error = Exception({'itemNotFound': {'code': 404, 'message': ''}})
+        self.assertEqual(status_code(error), 404)
+        self.assertEqual(status_code(Exception('boom')), None)
+
+    def test_teardown_by_name(self):
+        for i in range(6):
+            self.server.add_instance('loadtest-%d' % (i))
+        keep = self.server.add_instance('keep')
+
+        report = teardown(self.driver, name='loadtest-*', concurrency=3,
+                          poll_interval=0.05, timeout=5)
+        self.assertTrue(report.success)
+        self.assertEqual(len(report.deleted), 6)
+        self.assertTrue(report.polls > 1)
+        self.assertTrue(report.elapsed >= 0.2)
+        self.assertEqual([i.id for i in self.driver.list_instances()],
+                         [keep])
+        self.assertTrue('deleted=6' in report.format())
+
+    def test_teardown_with_limiter(self):
+        for i in range(8):
+            self.server.add_instance('loadtest-%d' % (i))
+        limiter = shared_limiter(self.driver, initial=2, max_limit=4)
+        report = teardown(self.driver, name='loadtest-*', concurrency=limiter,
+                          poll_interval=0.05, timeout=5)
+        self.assertTrue(report.success)
+        self.assertEqual(len(report.deleted), 8)
+        self.assertEqual(limiter.snapshot()['calls'], 8)
+
+    def test_teardown_by_status(self):
+        self.server.add_instance('a')
+        self.server.add_instance('b', status='FAILED')
+        report = teardown(self.driver, status=InstanceStatus.FAILED,
+                          poll_interval=0.05)
+        self.assertEqual(len(report.deleted), 1)
+        self.assertEqual([i.name for i in self.driver.list_instances()],
+                         ['a'])
+
+    def test_already_gone_and_stragglers(self):
+        self.server.delete_time = lambda: 5
+        instance_id = self.server.add_instance('slow')
+        report = teardown(self.driver, [instance_id, 'missing'],
+                          poll_interval=0.05, timeout=0.3)
+        self.assertEqual(report.already_gone, ['missing'])
+        self.assertEqual(report.stragglers, [instance_id])
+        self.assertFalse(report.success)
+        self.assertTrue(report.elapsed < 1)
+
+    def test_poll_errors(self):
+        ids = [self.server.add_instance('flaky-%d' % (i)) for i in range(3)]
+        driver = FlakyListing(self.driver, failures=2)
+        report = teardown(driver, ids, poll_interval=0.05, timeout=5)
+        self.assertTrue(report.success)
+        self.assertEqual(sorted(report.deleted), sorted(ids))
+        self.assertEqual(report.poll_errors, 2)
+        self.assertTrue('poll_errors=2' in report.format())
+
+        # Failing until the timeout, the deletes are still reported
+        instance_id = self.server.add_instance('flaky')
+        driver = FlakyListing(self.driver, failures=1000)
+        report = teardown(driver, [instance_id], poll_interval=0.05,
+                          timeout=0.3)
+        self.assertEqual(report.stragglers, [instance_id])
+        self.assertTrue(report.poll_errors >= 1)
+        self.assertEqual(report.polls, report.poll_errors)
+
+    def test_duplicate_ids(self):
+        instance_id = self.server.add_instance('twice')
+        driver = FlakyListing(self.driver, failures=0)
+        report = teardown(driver, [instance_id, instance_id],
+                          poll_interval=0.05, timeout=5)
+        self.assertEqual(driver.deletes, [instance_id])
+        self.assertEqual(report.deleted, [instance_id])
+        self.assertEqual(report.already_gone, [])
+        self.assertEqual(report.summary()['requested'], 1)
+
+    def test_filter_required(self):
+        self.assertRaises(ValueError, teardown, self.driver)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,134 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import unittest
+try:
+    import simplejson as json
+except:
+    import json
+
+from libcloud.utils.py3 import StringIO
+
+from rackspace_database.tracing import Tracer, NULL_SPAN, start_span
+from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+
+from test import test_rackspace
+from secrets import RACKSPACE_PARAMS
+
+
+class TracerTests(unittest.TestCase):
+    def test_spans_are_nested(self):
+        tracer = Tracer()
+        with tracer.span('outer', 'call') as outer:
+            with tracer.span('inner', 'network', bytes=10) as inner:
+                inner.set(status=200)
+
+        spans = tracer.spans()
+        self.assertEqual([s.name for s in spans], ['inner', 'outer'])
+        self.assertEqual(inner.parent_id, outer.span_id)
+        self.assertEqual(outer.parent_id, None)
+        self.assertEqual(inner.attrs, {'bytes': 10, 'status': 200})
+
+        totals = tracer.phase_totals()
+        self.assertAlmostEqual(totals['call'] + totals['network'],
+                               outer.duration)
+
+    def test_error_is_recorded(self):
+        tracer = Tracer()
+        try:
+            with tracer.span('failing', 'call'):
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(tracer.spans()[0].error, 'ValueError')
+
+    def test_start_span_without_tracer(self):
+        self.assertTrue(start_span(None, 'x', 'call') is NULL_SPAN)
+
+    def test_export_jsonl(self):
+        tracer = Tracer()
+        with tracer.span('a', 'call'):
+            pass
+        with tracer.span('b', 'call'):
+            pass
+        fp = StringIO()
+        tracer.export_jsonl(fp)
+        lines = fp.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[1])['name'], 'b')
+
+    def test_export_chrome(self):
+        tracer = Tracer()
+        with tracer.span('a', 'network', status=200):
+            pass
+        fp = StringIO()
+        tracer.export_chrome(fp)
+        events = json.loads(fp.getvalue())['traceEvents']
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]['ph'], 'X')
+        self.assertEqual(events[0]['cat'], 'network')
+        self.assertEqual(events[0]['args'], {'status': 200})
+
+
+class DriverTracingTests(unittest.TestCase):
+    def setUp(self):
+        RackspaceDatabaseDriver.connectionCls.conn_classes = (
+                test_rackspace.RackspaceMockHttp,
+                test_rackspace.RackspaceMockHttp)
+        RackspaceDatabaseDriver.connectionCls.auth_url = \
+                'https://auth.api.example.com/v1.1/'
+        test_rackspace.RackspaceMockHttp.type = None
+
+        self.tracer = Tracer()
+        self.driver = RackspaceDatabaseDriver(key=RACKSPACE_PARAMS[0],
+                                              secret=RACKSPACE_PARAMS[1],
+                                              ex_tracer=self.tracer)
+
+    def test_list_instances_phases(self):
+        self.driver.list_instances()
+        spans = dict([(s.phase, s) for s in self.tracer.spans()
+                      if s.phase != 'decode'])
+
+        self.assertEqual(sorted(spans.keys()),
+                         ['auth', 'call', 'map', 'network'])
+        call = spans['call']
+        self.assertEqual(call.name, 'list_instances')
+        self.assertEqual(call.attrs['url'], '/instances/detail')
+        self.assertEqual(spans['network'].parent_id, call.span_id)
+        self.assertEqual(spans['auth'].parent_id, spans['network'].span_id)
+        self.assertEqual(spans['network'].attrs['status'], 200)
+        self.assertTrue(spans['network'].attrs['response_bytes'] > 0)
+        self.assertEqual(spans['map'].attrs['objects'], 3)
+
+        decode = [s for s in self.tracer.spans() if s.phase == 'decode']
+        self.assertTrue(len(decode) >= 1)
+
+    def test_api_error_status(self):
+        self.assertRaises(Exception, self.driver.get_instance, 'missing')
+        network = [s for s in self.tracer.spans() if s.phase == 'network']
+        self.assertEqual(network[0].attrs['status'], 404)
+        self.assertEqual(network[0].error, 'Exception')
+
+    def test_second_call_does_not_authenticate(self):
+        self.driver.list_flavors()
+        self.tracer.clear()
+        self.driver.list_flavors()
+        phases = [s.phase for s in self.tracer.spans()]
+        self.assertFalse('auth' in phases)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
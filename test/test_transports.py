@@ -0,0 +1,262 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import time
+import errno
+import socket
+import threading
+import unittest
+
+from timeit import default_timer as timer
+
+from libcloud.utils.py3 import httplib
+from libcloud.common.base import LibcloudHTTPConnection
+from libcloud.common.base import LibcloudHTTPSConnection
+
+from rackspace_database.base import Database
+from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+from rackspace_database.standin import StandInServer
+from rackspace_database.transports import (PooledTransport, HTTP2Transport,
+                                           get_transport, h2)
+
+
+def run_concurrently(func, count):
+    results = [None] * count
+    errors = []
+
+    def run(i):
+        try:
+            results[i] = func(i)
+        except Exception:
+            errors.append(sys.exc_info()[1])
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+class FakeResponse(object):
+    status = 200
+    reason = 'OK'
+    version = 11
+    will_close = False
+
+
+class FlakyConnection(object):
+    """
+    Connection raising the exceptions in C{errors} from its responses,
+    in order, and recording the methods of its requests.
+    """
+    errors = []
+    methods = []
+
+    def __init__(self, host, port, timeout=None):
+        pass
+
+    def request(self, method, url, body=None, headers=None):
+        FlakyConnection.methods.append(method)
+
+    def getresponse(self):
+        if FlakyConnection.errors:
+            raise FlakyConnection.errors.pop(0)
+        return FakeResponse()
+
+    def close(self):
+        pass
+
+
+class PooledRetryTests(unittest.TestCase):
+    def setUp(self):
+        FlakyConnection.errors = []
+        FlakyConnection.methods = []
+        self.transport = PooledTransport(
+            conn_classes=(FlakyConnection, FlakyConnection))
+        # An idle connection, which the server may have closed
+        key = ('127.0.0.1', 80, False)
+        conn, reused = self.transport._checkout(key, None)
+        self.transport._checkin(key, conn)
+
+    def _request(self, method, error):
+        FlakyConnection.errors = [error]
+        conn = self.transport.connection('127.0.0.1', 80, False)
+        conn.request(method, '/instances')
+        return conn.getresponse()
+
+    def test_retry_idempotent_methods(self):
+        for method, error in [
+                ('GET', httplib.BadStatusLine('')),
+                ('HEAD', socket.error(errno.ECONNRESET, 'reset')),
+                ('get', socket.error(errno.EPIPE, 'broken pipe')),
+                ('OPTIONS', httplib.BadStatusLine(''))]:
+            self.setUp()
+            self.assertEqual(self._request(method, error).status, 200)
+            self.assertEqual(FlakyConnection.methods, [method, method])
+            self.assertEqual(self.transport.stats['retried'], 1)
+
+    def test_no_retry_of_other_methods(self):
+        for method in ['POST', 'DELETE', 'PUT']:
+            self.setUp()
+            self.assertRaises(httplib.BadStatusLine, self._request, method,
+                              httplib.BadStatusLine(''))
+            self.assertEqual(FlakyConnection.methods, [method])
+            self.assertEqual(self.transport.stats['retried'], 0)
+            self.assertEqual(self.transport.open(), 0)
+
+    def test_no_retry_after_a_response(self):
+        for error in [socket.timeout('timed out'),
+                      httplib.BadStatusLine('HTTP/1.1 2'),
+                      socket.error(errno.ECONNREFUSED, 'refused')]:
+            self.setUp()
+            self.assertRaises(type(error), self._request, 'GET', error)
+            self.assertEqual(FlakyConnection.methods, ['GET'])
+            self.assertEqual(self.transport.stats['retried'], 0)
+
+
+class TransportTestCase(unittest.TestCase):
+    server_kwargs = {}
+
+    def setUp(self):
+        RackspaceDatabaseDriver.connectionCls.conn_classes = (
+                LibcloudHTTPConnection, LibcloudHTTPSConnection)
+        self.server = StandInServer(**self.server_kwargs).start()
+        self.instance_ids = [self.server.add_instance('instance_%d' % (i))
+                             for i in range(10)]
+
+    def tearDown(self):
+        self.server.stop()
+
+
+class PooledTransportTests(TransportTestCase):
+    def setUp(self):
+        super(PooledTransportTests, self).setUp()
+        self.transport = PooledTransport(max_idle=4)
+        self.driver = RackspaceDatabaseDriver('user', 'key',
+                                              ex_transport=self.transport,
+                                              **self.server.driver_kwargs())
+
+    def tearDown(self):
+        self.transport.close()
+        super(PooledTransportTests, self).tearDown()
+
+    def test_connections_are_reused(self):
+        for instance_id in self.instance_ids:
+            self.assertEqual(self.driver.get_instance(instance_id).id,
+                             instance_id)
+        self.assertEqual(self.transport.stats['created'], 1)
+        self.assertEqual(self.transport.stats['reused'], 9)
+        self.assertEqual(self.transport.idle(), 1)
+
+    def test_concurrent_calls(self):
+        results = run_concurrently(
+            lambda i: self.driver.get_instance(self.instance_ids[i]), 10)
+        self.assertEqual([r.id for r in results], self.instance_ids)
+        self.assertTrue(self.transport.idle() <= 4)
+
+    def test_retry_on_connection_closed_by_server(self):
+        self.driver.list_flavors()
+        self.server._httpd.close_requests()
+        self.assertEqual(len(self.driver.list_flavors()), 4)
+        self.assertEqual(self.transport.stats['retried'], 1)
+
+
+class HTTP2TransportTests(TransportTestCase):
+    server_kwargs = {'http2': True, 'latency': 0.1}
+
+    def setUp(self):
+        if h2 is None:
+            return
+        super(HTTP2TransportTests, self).setUp()
+        self.transport = HTTP2Transport()
+        self.driver = RackspaceDatabaseDriver('user', 'key',
+                ex_transport=self.transport,
+                **self.server.driver_kwargs(http2=True))
+
+    def tearDown(self):
+        if h2 is None:
+            return
+        self.transport.close()
+        super(HTTP2TransportTests, self).tearDown()
+
+    def test_concurrent_calls_are_multiplexed(self):
+        if h2 is None:
+            return
+        self.driver.list_flavors()
+
+        start = timer()
+        results = run_concurrently(
+            lambda i: self.driver.get_instance(self.instance_ids[i]), 10)
+        elapsed = timer() - start
+
+        self.assertEqual([r.id for r in results], self.instance_ids)
+        self.assertEqual(self.transport.stats['connections'], 1)
+        self.assertEqual(self.server.stats['http2_streams'], 11)
+        # Ten 0.1s requests one after the other would take 1s
+        self.assertTrue(elapsed < 0.6, elapsed)
+
+    def test_request_body_and_errors(self):
+        if h2 is None:
+            return
+        self.driver.create_database(self.instance_ids[0],
+                                    Database('a_database'))
+        self.assertEqual([d.name for d in
+                          self.driver.list_databases(self.instance_ids[0])],
+                         ['a_database'])
+        self.assertRaises(Exception, self.driver.get_instance, 'missing')
+
+    def test_response_after_timeout(self):
+        if h2 is None:
+            return
+        self.driver.list_flavors()
+        connection = self.transport.connection(self.server.host,
+                                               self.server.http2_port, False,
+                                               timeout=0.02)
+        connection.request('GET', '/v1.0/%s/flavors' %
+                           (self.server.account_id),
+                           headers={'X-Auth-Token':
+                                    self.driver.connection.auth_token})
+        self.assertRaises(socket.timeout, connection.getresponse)
+        client = connection._client
+        self.assertEqual(client._streams, {})
+
+        # A stream dropped without a reset still gets its response
+        connection.request('GET', '/v1.0/%s/flavors' %
+                           (self.server.account_id),
+                           headers={'X-Auth-Token':
+                                    self.driver.connection.auth_token})
+        client._streams.pop(connection._stream_id)
+
+        # Let the responses of both streams arrive
+        time.sleep(0.2)
+        self.assertFalse(client.closed)
+        self.assertEqual(len(self.driver.list_flavors()), 4)
+        self.assertEqual(self.transport.stats['connections'], 1)
+
+
+class GetTransportTests(unittest.TestCase):
+    def test_get_transport(self):
+        transport = PooledTransport()
+        self.assertTrue(get_transport(transport) is transport)
+        self.assertTrue(isinstance(get_transport('pooled'), PooledTransport))
+        self.assertRaises(ValueError, get_transport, 'carrier_pigeon')
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
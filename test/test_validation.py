@@ -0,0 +1,143 @@
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.    You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import unittest
+
+from libcloud.common.base import LibcloudHTTPConnection
+from libcloud.common.base import LibcloudHTTPSConnection
+
+from rackspace_database.base import Instance, Database, User
+from rackspace_database.drivers.dummy import DummyDatabaseDriver
+from rackspace_database.drivers.rackspace import RackspaceDatabaseDriver
+from rackspace_database.drivers.rackspace import \
+    RackspaceDatabaseValidationError, status_code
+from rackspace_database.standin import StandInServer
+from rackspace_database.validation import database_errors, user_errors, \
+    instance_errors
+
+
+class ValidatorTests(unittest.TestCase):
+    def test_database(self):
+        self.assertEqual(database_errors(Database('app_db', 'utf8',
+                                                  'utf8_general_ci')), [])
+        self.assertEqual(len(database_errors(Database('x' * 65))), 1)
+        self.assertEqual(len(database_errors(Database('a;b'))), 1)
+        self.assertEqual(len(database_errors(Database(' app'))), 1)
+        self.assertEqual(len(database_errors(Database(''))), 1)
+        self.assertEqual(len(database_errors(Database('app', 'utf-8'))), 1)
+        self.assertEqual(len(database_errors(Database('app', 'latin1',
+                                                      'utf8_bin'))), 1)
+
+    def test_user(self):
+        self.assertEqual(user_errors(User('bob', 'p4ss-word!')), [])
+        self.assertEqual(len(user_errors(User('bob@host'))), 1)
+        self.assertEqual(len(user_errors(User('a_very_long_user_name'))), 1)
+        errors = user_errors(User('bob', "it's secret"))
+        self.assertEqual(len(errors), 1)
+        self.assertFalse('secret' in errors[0])
+
+    def test_instance(self):
+        self.assertEqual(instance_errors(Instance('flavors/1', size=1)), [])
+        self.assertEqual(len(instance_errors(Instance('flavors/1',
+                                                      size=51))), 1)
+        self.assertEqual(len(instance_errors(Instance(None, size='2'))), 2)
+        self.assertEqual(len(instance_errors(Instance(
+            'flavors/1', size=2, databases=[Database('a/b')]))), 1)
+
+
+class DriverValidationTests(unittest.TestCase):
+    def setUp(self):
+        RackspaceDatabaseDriver.connectionCls.conn_classes = (
+                LibcloudHTTPConnection, LibcloudHTTPSConnection)
+        self.server = StandInServer().start()
+        self.instance_id = self.server.add_instance('db')
+        self.driver = RackspaceDatabaseDriver('user', 'key',
+                                              **self.server.driver_kwargs())
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_bulk_calls_leave_invalid_items_out(self):
+        bad = Database('bad;name')
+        rejected = self.driver.create_databases(
+            self.instance_id, [Database('a'), bad, Database('b')])
+        self.assertEqual([item for item, error in rejected], [bad])
+        self.assertTrue(isinstance(rejected[0][1],
+                                   RackspaceDatabaseValidationError))
+        self.assertEqual(rejected[0][1].code, 400)
+        self.assertEqual([d.name for d in
+                          self.driver.list_databases(self.instance_id)],
+                         ['a', 'b'])
+
+        pairs = [(User('alice'), [Database('a')]),
+                 (User('bob'), [Database('a,b')])]
+        rejected = self.driver.create_users(self.instance_id, pairs)
+        self.assertEqual([item for item, error in rejected], [pairs[1]])
+        self.assertEqual([u.name for u in
+                          self.driver.list_users(self.instance_id)],
+                         ['alice'])
+        self.assertEqual(self.server.stats['create_databases'], 1)
+        self.assertEqual(self.server.stats['create_users'], 1)
+
+        # Nothing valid left, no request is made
+        rejected = self.driver.create_databases(self.instance_id,
+                                                [Database('x' * 65)])
+        self.assertEqual(len(rejected), 1)
+        self.assertEqual(self.server.stats['create_databases'], 1)
+
+    def test_single_calls_raise(self):
+        self.assertRaises(RackspaceDatabaseValidationError,
+                          self.driver.create_database, self.instance_id,
+                          Database('bad/name'))
+        self.assertRaises(RackspaceDatabaseValidationError,
+                          self.driver.create_user, self.instance_id,
+                          User('bad name?'), [])
+        self.assertRaises(RackspaceDatabaseValidationError,
+                          self.driver.create_instance,
+                          Instance('flavors/1', name='db', size=0))
+        self.assertFalse('create_databases' in self.server.stats)
+        self.assertFalse('create_instance' in self.server.stats)
+
+    def test_dummy_driver_partitions_alike(self):
+        dummy = DummyDatabaseDriver()
+        dummy_instance_id = dummy.ex_add_instance('db')
+        databases = [Database('a'), Database('bad;name'), Database('x' * 65)]
+        pairs = [(User('alice'), []), (User('bad?'), [])]
+        for driver, instance_id in ((self.driver, self.instance_id),
+                                    (dummy, dummy_instance_id)):
+            rejected = driver.create_databases(instance_id, databases)
+            self.assertEqual([item for item, error in rejected],
+                             databases[1:])
+            self.assertEqual([status_code(error) for item, error in
+                              rejected], [400, 400])
+            rejected = driver.create_users(instance_id, pairs)
+            self.assertEqual([item for item, error in rejected], pairs[1:])
+            self.assertEqual(driver.create_databases(instance_id, []), [])
+            self.assertEqual(driver.create_users(instance_id, []), [])
+            self.assertEqual([d.name for d in
+                              driver.list_databases(instance_id)], ['a'])
+        self.assertEqual(self.server.stats['create_databases'], 1)
+
+    def test_validation_can_be_disabled(self):
+        driver = RackspaceDatabaseDriver('user', 'key', ex_validate=False,
+                                         **self.server.driver_kwargs())
+        self.assertEqual(driver.create_databases(self.instance_id,
+                                                 [Database('a;b')]), [])
+        self.assertEqual(self.server.stats['create_databases'], 1)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())